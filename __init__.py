@@ -31,25 +31,56 @@ compilation, and execution.
 
 from fbrelation.exceptions import RelationException
 
+from fbrelation.profiling import NULL_PROFILE as _NULL_PROFILE
+
 from fbrelation.syntax.program import ProgramSyntax as _ProgramSyntax
 
-def loads(string):
+from fbrelation.serialization import dump, dumps
+
+from fbrelation.batch import loadMany
+
+def loads(string, profile=None, path=None, validation='warn', targets=None,
+        programId=None):
     """
     Parses, compiles, and executes a program from its provided source text.
 
+    :param profile:    Optionally, a :class:`.Profile` in which to record
+                       the time and memory spent in each phase of loading the
+                       program.
+    :param path:       Optionally, the path of the file the program was read
+                       from, used to find the modules it imports.
+    :param validation: Either "strict" or "warn", to either raise a
+                       :class:`.CompilationError` or warn if a relation's
+                       connections form a cycle or drive one node twice (see
+                       :mod:`.validation`), or None to skip the check.
+    :param targets:    Optionally, the names of the only relations to load.
+                       The relations they use as macros are loaded too, but
+                       every other relation is skipped without being parsed.
+    :param programId:  Optionally, the id with which to tag each constraint
+                       created, so that they can be found and torn down
+                       together later (see :mod:`.tagging`). Defaults to an
+                       id derived from the program's structure.
+
     :returns: a dictionary mapping constraint declaration names to their
               corresponding FBConstraintRelation objects.
     :raises:  a :class:`.RelationException` if a program is invalid or
               unsupported.
     """
-    syntax = _ProgramSyntax.parse(string)
-    declaration = syntax.compile()
-    return declaration.execute()
+    profile = profile or _NULL_PROFILE
+    with profile.session():
+        with profile.measure('parse', 'phase'):
+            syntax = _ProgramSyntax.parse(string, path, targets)
+        with profile.measure('compile', 'phase'):
+            declaration = syntax.compile(profile, validation=validation)
+        with profile.measure('execute', 'phase'):
+            return declaration.execute(profile, programId=programId)
 
-def load(fp):
+def load(fp, profile=None, validation='warn', targets=None, programId=None):
     """
     Parses, compiles, and executes a program from the provided open file.
+    Imported modules are found relative to the file, if it has a name.
 
     :note:    Returns and raises identically to loads.
     """
-    return loads(fp.read())
+    return loads(fp.read(), profile, getattr(fp, 'name', None), validation,
+        targets, programId)
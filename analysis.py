@@ -0,0 +1,264 @@
+"""
+`fbrelation.analysis`
+
+Defines a static cost model for compiled programs. Each relation is analyzed
+without executing it, producing a :class:`RelationReport` that summarizes its
+size and shape: box counts by kind, the fully expanded box count (with macros
+counted as the boxes they contain), the depth of its critical path, its
+fan-out hotspots, and an estimated per-frame evaluation cost.
+
+Costs are estimated from a table of weights, keyed by strings of the following
+forms, with more specific keys taking precedence::
+
+    "<group>/<type>"    a specific type of function box
+    "<group>"           any function box in the group
+    "function"          any function box
+    "sender", "receiver", "input", "output"
+                        placeholder boxes and macro tools
+    "connection"        each connection
+    "constraint"        the overhead of evaluating each relation constraint
+                        (used when comparing partitionings; see
+                        :mod:`.partitioning`)
+
+Macro boxes cost as much as the relations they instantiate. Running this
+module as a script analyzes every program in a directory tree and prints the
+most expensive relations::
+
+    python -m fbrelation.analysis --top 20 path/to/programs
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import sys
+
+from fbrelation.exceptions import RelationException
+
+from fbrelation.syntax.program import ProgramSyntax
+
+DEFAULT_WEIGHTS = {
+    'function': 1.0,
+    'sender': 2.0,
+    'receiver': 2.0,
+    'input': 0.1,
+    'output': 0.1,
+    'connection': 0.25,
+    'constraint': 5.0,
+    'Converters': 0.5,
+    'Vector': 1.5,
+}
+""" The default weight table used to estimate evaluation costs. """
+
+class RelationReport(object):
+    """
+    Summarizes the size, shape, and estimated cost of a single relation.
+    """
+
+    def __init__(self, name):
+        """
+        Initializes an empty report for the relation with the given name.
+        """
+        self.name = name
+        self.boxCounts = {}
+        """ Maps box kinds (as in the weight table) to the number of boxes. """
+        self.boxCount = 0
+        """ The number of boxes declared directly in the relation. """
+        self.expandedBoxCount = 0
+        """ The number of boxes with all nested macros expanded. """
+        self.connectionCount = 0
+        """ The number of connections declared directly in the relation. """
+        self.depth = 0
+        """ The number of boxes along the longest path through the graph. """
+        self.fanOut = []
+        """ A list of (node, count) pairs for the most-connected outputs. """
+        self.cost = 0.0
+        """ The estimated cost of evaluating the relation once per frame. """
+
+    def toDict(self):
+        """
+        Returns the contents of the report as a dictionary, suitable for
+        serializing to JSON.
+        """
+        return {
+            'name': self.name,
+            'boxCounts': self.boxCounts,
+            'boxCount': self.boxCount,
+            'expandedBoxCount': self.expandedBoxCount,
+            'connectionCount': self.connectionCount,
+            'depth': self.depth,
+            'fanOut': self.fanOut,
+            'cost': self.cost,
+        }
+
+def analyzeProgram(program, weights=None, hotspots=5):
+    """
+    Analyzes each relation in the given :class:`.ProgramDeclaration`.
+
+    :param weights:  A weight table which overrides entries in
+                     :data:`DEFAULT_WEIGHTS`.
+    :param hotspots: The maximum number of fan-out hotspots to report for
+                     each relation.
+
+    :returns: a list of :class:`RelationReport` objects, in program order.
+    """
+    table = dict(DEFAULT_WEIGHTS)
+    table.update(weights or {})
+
+    # Share reports between relations so that each macro is analyzed once
+    reports = {}
+    return [_analyzeRelation(r, table, hotspots, reports)
+        for r in program.relations]
+
+def getBoxKind(box):
+    """
+    Returns the key that identifies the kind of the given box in a weight
+    table: "<group>/<type>" for function boxes, "macro" for macro boxes, or
+    the kind of placeholder box or macro tool.
+    """
+    signature = box.getSignature()
+    if signature[0] == 'function':
+        return '%s/%s' % (signature[1], signature[2])
+    return signature[0]
+
+def getBoxWeight(box, table):
+    """
+    Returns the weight of the given (non-macro) box from the given table,
+    falling back on less specific keys as necessary.
+    """
+    signature = box.getSignature()
+    if signature[0] == 'function':
+        for key in ('%s/%s' % (signature[1], signature[2]), signature[1]):
+            if key in table:
+                return table[key]
+    return table.get(signature[0], table['function'])
+
+def _analyzeRelation(relation, table, hotspots, reports):
+    """
+    Analyzes a single relation, recursing into the relations used by its macro
+    boxes. Reports are cached in the given dictionary by relation.
+    """
+    if id(relation) in reports:
+        return reports[id(relation)]
+
+    report = RelationReport(relation.name)
+    report.boxCount = len(relation.boxes)
+    report.connectionCount = len(relation.connections)
+    report.cost = table['connection'] * len(relation.connections)
+
+    # Count and weigh each box, expanding macros into the boxes they contain
+    boxDepths = {}
+    for box in relation.boxes:
+        kind = getBoxKind(box)
+        report.boxCounts[kind] = report.boxCounts.get(kind, 0) + 1
+        if kind == 'macro':
+            nested = _analyzeRelation(
+                box.relation, table, hotspots, reports)
+            report.expandedBoxCount += nested.expandedBoxCount
+            report.cost += nested.cost
+            boxDepths[box.name] = nested.depth
+        else:
+            report.expandedBoxCount += 1
+            report.cost += getBoxWeight(box, table)
+            boxDepths[box.name] = 1
+
+    # Find the longest path through the graph, visiting boxes in dependency
+    # order so that each box's upstream depth is known before it's visited
+    pathDepths = {}
+    for box, inputConnections in relation.getEvaluationPlan():
+        upstream = [pathDepths[c.src.box.name] for c in inputConnections]
+        pathDepths[box.name] = boxDepths[box.name] + max(upstream or [0])
+    report.depth = max(list(pathDepths.values()) or [0])
+
+    # Count the connections leaving each output node to find hotspots
+    fanOut = {}
+    for connection in relation.connections:
+        node = '%s.%s' % (connection.src.box.name, connection.src.key) \
+            if connection.src.key is not None else connection.src.box.name
+        fanOut[node] = fanOut.get(node, 0) + 1
+    report.fanOut = sorted(
+        [(node, count) for node, count in fanOut.items() if count > 1],
+        key=lambda pair: (-pair[1], pair[0]))[:hotspots]
+
+    reports[id(relation)] = report
+    return report
+
+def analyzeFiles(paths, weights=None):
+    """
+    Parses, compiles, and analyzes each of the programs at the given paths.
+
+    :returns: a list of (path, report) pairs for every relation in every
+              program, along with a list of (path, exception) pairs for
+              programs that could not be compiled.
+    """
+    results = []
+    errors = []
+    for path in paths:
+        try:
+            with open(path) as fp:
+                program = ProgramSyntax.parse(fp.read()).compile()
+            reports = analyzeProgram(program, weights)
+        except (IOError, RelationException) as e:
+            errors.append((path, e))
+            continue
+        results.extend((path, report) for report in reports)
+    return results, errors
+
+def findFiles(directory, pattern):
+    """
+    Returns the paths of all files in the given directory tree whose names
+    match the given shell-style pattern, in sorted order.
+    """
+    paths = []
+    for root, dirnames, filenames in os.walk(directory):
+        paths.extend(os.path.join(root, filename)
+            for filename in fnmatch.filter(filenames, pattern))
+    return sorted(paths)
+
+def main(argv=None):
+    """
+    Runs the command-line interface, printing the most expensive relations
+    found in the programs under the given directories.
+    """
+    parser = argparse.ArgumentParser(description=
+        'Reports the most expensive relations in a tree of fbrelation '
+        'programs.')
+    parser.add_argument('directories', nargs='+')
+    parser.add_argument('--top', type=int, default=10,
+        help='the number of relations to report (default: 10)')
+    parser.add_argument('--pattern', default='*.fbr',
+        help='the file name pattern of programs (default: *.fbr)')
+    parser.add_argument('--weights',
+        help='a JSON file containing a weight table to use')
+    parser.add_argument('--json', action='store_true',
+        help='print the reports as JSON')
+    args = parser.parse_args(argv)
+
+    weights = None
+    if args.weights:
+        with open(args.weights) as fp:
+            weights = json.load(fp)
+
+    paths = []
+    for directory in args.directories:
+        paths.extend(findFiles(directory, args.pattern))
+    results, errors = analyzeFiles(paths, weights)
+
+    for path, error in errors:
+        sys.stderr.write('%s: %s\n' % (path, error))
+
+    results.sort(key=lambda pair: -pair[1].cost)
+    results = results[:args.top]
+    if args.json:
+        print(json.dumps([dict(report.toDict(), path=path)
+            for path, report in results], indent=2, sort_keys=True))
+        return
+
+    print('%10s %8s %8s %6s  %s' %
+        ('cost', 'boxes', 'expanded', 'depth', 'relation'))
+    for path, report in results:
+        print('%10.2f %8d %8d %6d  %s: %s' % (report.cost, report.boxCount,
+            report.expandedBoxCount, report.depth, path, report.name))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+`fbrelation.backend`
+
+Provides deferred access to the MotionBuilder SDK. Only the execution phase
+needs pyfbsdk, so the declaration modules reach it through :data:`sdk` rather
+than importing it directly. This allows parsing, compilation, and offline
+evaluation to run in a plain Python interpreter (in a worker process, for
+example) where pyfbsdk is not available.
+"""
+
+from fbrelation.exceptions import ExecutionError
+
+class Backend(object):
+    """
+    Stands in for the pyfbsdk module. Attribute access is forwarded to the
+    underlying module, which is imported the first time it's needed.
+    """
+
+    def __init__(self):
+        """
+        Initializes a new backend with no module loaded yet.
+        """
+        self.module = None
+
+    def __getattr__(self, name):
+        """
+        Forwards attribute access to the underlying SDK module.
+
+        :raises: an :class:`.ExecutionError` if pyfbsdk can not be imported.
+        """
+        return getattr(self.load(), name)
+
+    def load(self):
+        """
+        Returns the underlying SDK module, importing pyfbsdk on first use if
+        no other module has been installed.
+
+        :raises: an :class:`.ExecutionError` if pyfbsdk can not be imported.
+        """
+        if self.module is None:
+            try:
+                import pyfbsdk
+            except ImportError:
+                raise ExecutionError(
+                    'The MotionBuilder SDK (pyfbsdk) is not available. '
+                    'Programs can only be executed inside MotionBuilder.')
+            self.module = pyfbsdk
+        return self.module
+
+    def use(self, module):
+        """
+        Installs the given module-like object in place of pyfbsdk and returns
+        the previously installed module (or None), so that it can be restored
+        afterward.
+        """
+        previous = self.module
+        self.module = module
+        return previous
+
+sdk = Backend()
+""" The shared backend instance used by all declaration classes. """
@@ -0,0 +1,326 @@
+"""
+`fbrelation.bake`
+
+Bakes the results of a program's relations into keyframes. Rather than
+creating relation constraints that MotionBuilder has to evaluate on every
+frame, a program can be evaluated offline over a range of frames, with the
+values it would send to its receivers written out as one column of values per
+animated channel.
+
+Baked values are stored in a compact, memory-mapped columnar file, which can be
+read back with :class:`BakeFile` and optionally applied to the receivers as
+keyframes in place of executing the program. The file has the following
+layout::
+
+    header    magic ("FBRB"), version, first frame, frame count,
+              column count, and offset of the data section
+    columns   a JSON list of [component name, node name, axis] entries, one
+              per column, with an axis of -1 for numeric channels
+    data      one column of 8-byte floats per channel, frame count values
+              each, starting at an 8-byte aligned offset
+
+Large frame ranges can be split into shards that are evaluated across a pool
+of worker processes. Each worker maps the output file into memory and writes
+its rows directly into the appropriate columns, so the file itself serves as
+the memory shared between processes.
+"""
+
+import json
+import mmap
+import multiprocessing
+import struct
+import sys
+
+from array import array
+
+from fbrelation.exceptions import EvaluationError
+
+from fbrelation.declarations.box import SenderBoxDeclaration, \
+                                        ConstantSenderBoxDeclaration, \
+                                        ReceiverBoxDeclaration
+
+_MAGIC = b'FBRB'
+_VERSION = 1
+_HEADER = struct.Struct('<4sIiIII')
+_VALUE_SIZE = 8
+
+class BakeFile(object):
+    """
+    Provides read access to the columns of a bake file, which is mapped into
+    memory rather than being read in its entirety.
+    """
+
+    def __init__(self, path):
+        """
+        Opens the bake file at the given path.
+
+        :raises: an :class:`.EvaluationError` if the file is not a valid bake
+                 file.
+        """
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # Read the header to determine the shape of the data
+        magic, version, self.firstFrame, self.frameCount, columnCount, \
+            self._dataOffset = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self.close()
+            raise EvaluationError('"%s" is not a valid bake file.' % path)
+
+        # Read the column table that follows the header
+        table = self._map[_HEADER.size:self._dataOffset].decode('utf-8')
+        self.columns = [tuple(column) for column in json.loads(table)]
+        """ A list of (componentName, nodeName, axis) tuples. """
+        assert len(self.columns) == columnCount
+
+    def __enter__(self):
+        """
+        Allows the file to be used in a with statement.
+        """
+        return self
+
+    def __exit__(self, *exc_info):
+        """
+        Closes the file at the end of a with statement.
+        """
+        self.close()
+
+    def column(self, index):
+        """
+        Returns an array containing the values of the column at the given
+        index, one per frame.
+        """
+        start = self._dataOffset + index * self.frameCount * _VALUE_SIZE
+        values = array('d', self._map[start:start +
+            self.frameCount * _VALUE_SIZE])
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return values
+
+    def close(self):
+        """
+        Unmaps and closes the file.
+        """
+        self._map.close()
+        self._file.close()
+
+def bake(program, firstFrame, lastFrame, path, senders=None, workers=1,
+         apply=False):
+    """
+    Evaluates the given program offline over an inclusive range of frames and
+    writes the values received by each of its receivers to a bake file.
+
+    :param program: The :class:`.ProgramDeclaration` to bake.
+    :param path:    The path of the bake file to write.
+    :param senders: Optionally provides the input values for each frame, as a
+                    list of sender dictionaries (see
+                    :meth:`.ProgramDeclaration.evaluate`). If omitted, the
+                    values are sampled from the scene.
+    :param workers: The number of worker processes among which to divide the
+                    frame range. Using more than one requires that the
+                    multiprocessing module be able to start a Python
+                    interpreter that can import fbrelation.
+    :param apply:   If True, the baked values are also applied as keyframes to
+                    the receivers, in place of executing the program.
+
+    :returns: the newly written :class:`BakeFile`.
+    :raises:  an :class:`.EvaluationError` if the program can not be
+              evaluated.
+    """
+    frameCount = lastFrame - firstFrame + 1
+    if frameCount < 1:
+        raise EvaluationError(
+            'Can not bake an empty range of frames (%d to %d).' %
+            (firstFrame, lastFrame))
+
+    # Sample the input values from the scene if they weren't provided
+    if senders is None:
+        senders = sampleSenders(program, firstFrame, lastFrame)
+    if len(senders) != frameCount:
+        raise EvaluationError(
+            'Expected sender values for %d frames, but got %d.' %
+            (frameCount, len(senders)))
+
+    # Evaluate the first frame to determine which channels are driven, then
+    # lay out the file with one column for each
+    columns = _findColumns(program.evaluate(senders[0]))
+    dataOffset = _createBakeFile(path, firstFrame, frameCount, columns)
+
+    if workers > 1 and frameCount > 1:
+
+        # Divide the range into a few shards per worker so that the work is
+        # evenly balanced, then have the workers write them in parallel
+        shardSize = max(1, -(-frameCount // (workers * 4)))
+        shards = [(start, senders[start:start + shardSize])
+            for start in range(0, frameCount, shardSize)]
+        pool = multiprocessing.Pool(workers, _initializeWorker,
+            (program, path, dataOffset, frameCount, columns))
+        try:
+            pool.map(_bakeShard, shards)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _writeRows(path, dataOffset, frameCount, columns, 0,
+            _evaluateRows(program, columns, senders))
+
+    # Open the finished file, applying its contents to the scene if requested
+    bakeFile = BakeFile(path)
+    if apply:
+        applyBake(program, bakeFile)
+    return bakeFile
+
+def sampleSenders(program, firstFrame, lastFrame):
+    """
+    Samples the values of every sender node referenced in the given program
+    from the scene, over an inclusive range of frames.
+
+    :returns: a list of sender dictionaries, one per frame.
+    :raises:  an :class:`.ExecutionError` if any sender component or property
+              can not be found.
+    """
+    # Find each sender box along with the names of the nodes it sends from
+    senderNodes = []
+    for relation in program.relations:
+        for connection in relation.connections:
+            box = connection.src.box
+            if (isinstance(box, SenderBoxDeclaration) and
+                    not isinstance(box, ConstantSenderBoxDeclaration)):
+                senderNodes.append((box, connection.src.nodeName))
+
+    # Sample each node once, skipping nodes shared by more than one box
+    senders = [{} for frame in range(firstFrame, lastFrame + 1)]
+    for box, nodeName in senderNodes:
+        if nodeName in senders[0].get(box.componentName, {}):
+            continue
+        values = box.sample(nodeName, firstFrame, lastFrame)
+        for frameSenders, value in zip(senders, values):
+            frameSenders.setdefault(box.componentName, {})[nodeName] = value
+    return senders
+
+def applyBake(program, bakeFile):
+    """
+    Applies the values stored in the given bake file to the receivers of the
+    given program, replacing the animation of each baked property with one
+    keyframe per frame.
+
+    :raises: an :class:`.ExecutionError` if any receiver component or property
+             can not be found.
+    """
+    # Find a receiver box declaration for each receiver component
+    receivers = {}
+    for relation in program.relations:
+        for box in relation.boxes:
+            if isinstance(box, ReceiverBoxDeclaration):
+                receivers[box.componentName] = box
+
+    # Group the columns by property, preserving the order of vector axes
+    properties = []
+    indices = {}
+    for index, (componentName, nodeName, axis) in enumerate(bakeFile.columns):
+        key = (componentName, nodeName)
+        if key not in indices:
+            indices[key] = []
+            properties.append(key)
+        indices[key].append(index)
+
+    # Replace each property's animation with the baked values
+    for componentName, nodeName in properties:
+        receivers[componentName].applyKeys(nodeName, bakeFile.firstFrame,
+            [bakeFile.column(i) for i in indices[(componentName, nodeName)]])
+
+def _findColumns(receivers):
+    """
+    Given the receiver values computed for a single frame, returns a list of
+    (componentName, nodeName, axis) tuples, one for each column of the bake.
+    """
+    columns = []
+    for componentName in sorted(receivers):
+        for nodeName in sorted(receivers[componentName]):
+            value = receivers[componentName][nodeName]
+            if isinstance(value, tuple):
+                columns.extend((componentName, nodeName, axis)
+                    for axis in range(len(value)))
+            else:
+                columns.append((componentName, nodeName, -1))
+    return columns
+
+def _evaluateRows(program, columns, senders):
+    """
+    Evaluates the program once for each of the given sender dictionaries,
+    returning a list of rows that hold one value per column.
+    """
+    rows = []
+    for frameSenders in senders:
+        receivers = program.evaluate(frameSenders)
+        try:
+            rows.append([float(receivers[c][n] if axis < 0 else
+                receivers[c][n][axis]) for c, n, axis in columns])
+        except (KeyError, IndexError, TypeError):
+            raise EvaluationError(
+                'The channels driven by the program must be the same on '
+                'every frame.')
+    return rows
+
+def _createBakeFile(path, firstFrame, frameCount, columns):
+    """
+    Writes the header and column table of a new bake file, reserving space for
+    its data, and returns the offset at which the data begins.
+    """
+    table = json.dumps([list(column) for column in columns]).encode('utf-8')
+
+    # Pad the table with whitespace so that the data is properly aligned
+    dataOffset = _HEADER.size + len(table)
+    padding = -dataOffset % _VALUE_SIZE
+    dataOffset += padding
+
+    with open(path, 'wb') as fp:
+        fp.write(_HEADER.pack(_MAGIC, _VERSION, firstFrame, frameCount,
+            len(columns), dataOffset))
+        fp.write(table + b' ' * padding)
+        fp.truncate(dataOffset + len(columns) * frameCount * _VALUE_SIZE)
+    return dataOffset
+
+def _writeRows(path, dataOffset, frameCount, columns, rowStart, rows):
+    """
+    Writes the given rows into each of the columns of an existing bake file,
+    starting at the given row offset.
+    """
+    if not rows or not columns:
+        return
+
+    with open(path, 'r+b') as fp:
+        fileMap = mmap.mmap(fp.fileno(), 0)
+        try:
+            for index in range(len(columns)):
+                values = array('d', [row[index] for row in rows])
+                if sys.byteorder != 'little':
+                    values.byteswap()
+                start = dataOffset + \
+                    (index * frameCount + rowStart) * _VALUE_SIZE
+                data = values.tobytes() if hasattr(values, 'tobytes') else \
+                    values.tostring()
+                fileMap[start:start + len(data)] = data
+        finally:
+            fileMap.close()
+
+# The program and file layout shared by each worker process in a bake
+_worker = {}
+
+def _initializeWorker(program, path, dataOffset, frameCount, columns):
+    """
+    Initializes a worker process with the details of the bake in progress.
+    """
+    _worker.update(program=program, path=path, dataOffset=dataOffset,
+        frameCount=frameCount, columns=columns)
+
+def _bakeShard(shard):
+    """
+    Evaluates a contiguous shard of frames in a worker process and writes the
+    results directly into the bake file.
+    """
+    rowStart, senders = shard
+    rows = _evaluateRows(_worker['program'], _worker['columns'], senders)
+    _writeRows(_worker['path'], _worker['dataOffset'], _worker['frameCount'],
+        _worker['columns'], rowStart, rows)
+    return len(rows)
@@ -0,0 +1,167 @@
+"""
+`fbrelation.batch`
+
+Loads many program files at once. Parsing and compilation are pure Python and
+don't touch the scene, so they're spread across a pool of worker processes,
+while execution (which must happen on MotionBuilder's main thread) takes place
+on the calling thread as each compiled program arrives::
+
+    for result in fbrelation.loadMany(paths, workers=4):
+        if result.error:
+            print('%s: %s' % (result.path, result.error))
+
+Each file is loaded as a module (see :mod:`.modules`), so a file that's
+imported by another file in the same batch is executed first, and the file
+that imports it uses its constraints rather than creating them again. A file
+that fails to load doesn't prevent the others from loading; its error is
+reported in its result.
+
+Worker processes are started with :mod:`multiprocessing`, which needs a
+Python interpreter it can launch. Where that isn't available (as within some
+embedded interpreters), pass `workers=1` to compile every file on the calling
+thread instead.
+"""
+
+import os
+import multiprocessing
+
+from fbrelation.exceptions import RelationException
+
+from fbrelation.profiling import NULL_PROFILE
+
+from fbrelation.modules import ModuleResolver, defaultResolver, cacheModule
+
+class LoadResult(object):
+    """
+    Describes the outcome of loading one file in a batch.
+    """
+
+    def __init__(self, path, constraints=None, error=None):
+        """
+        Initializes a new result for the file at the given path.
+
+        :param constraints: If the file was loaded, a dictionary which maps
+                            the names of its relation declarations to their
+                            corresponding constraint objects.
+        :param error:       If the file failed to load, the exception that
+                            was raised.
+        """
+        self.path = path
+        self.constraints = constraints
+        self.error = error
+
+def loadMany(paths, workers=None, profile=None, resolver=None):
+    """
+    Parses, compiles, and executes the program files at the given paths,
+    compiling them in parallel and executing them on the calling thread in
+    dependency order (each after any other file in the batch that it
+    imports).
+
+    :param workers:  The number of worker processes to compile files in.
+                     Defaults to the number of CPUs. If 1, every file is
+                     compiled on the calling thread.
+    :param profile:  Optionally, a :class:`.Profile` in which to record the
+                     time spent executing each file.
+    :param resolver: Optionally, the :class:`.ModuleResolver` whose search
+                     path is used to find imported modules. Defaults to
+                     :data:`.defaultResolver`.
+
+    :returns: a list of :class:`LoadResult` objects, one per file, in the
+              order in which the files finished loading.
+    """
+    profile = profile or NULL_PROFILE
+    resolver = resolver or defaultResolver
+    paths = [os.path.abspath(path) for path in paths]
+    batch = set(paths)
+
+    results = []
+    finished = set()
+    pending = {}
+    with profile.session():
+        for path, compiled in _compileAll(paths, workers, resolver):
+
+            # Hold each compiled module until the modules it depends on have
+            # been loaded, then load every module that's become ready
+            if isinstance(compiled, Exception):
+                results.append(LoadResult(path, error=compiled))
+                finished.add(path)
+            else:
+                module = cacheModule(compiled)
+                pending[path] = (module, _getDependencies(module) & batch)
+
+            ready = [p for p in paths if p in pending and
+                pending[p][1] <= finished]
+            while ready:
+                for readyPath in ready:
+                    module = pending.pop(readyPath)[0]
+                    with profile.measure(readyPath, 'load'):
+                        results.append(_executeModule(module, profile))
+                    finished.add(readyPath)
+                ready = [p for p in paths if p in pending and
+                    pending[p][1] <= finished]
+
+    return results
+
+def _compileAll(paths, workers, resolver):
+    """
+    Compiles the files at the given paths, in worker processes if possible.
+
+    :returns: an iterator over (path, module) pairs in the order in which the
+              files finish compiling, where module is either the compiled
+              :class:`.Module` or the exception raised while compiling it.
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield _compileFile((path, resolver))
+        return
+
+    pool = multiprocessing.Pool(min(workers, len(paths)))
+    try:
+        arguments = [(path, ModuleResolver(resolver.searchPath))
+            for path in paths]
+        for result in pool.imap_unordered(_compileFile, arguments):
+            yield result
+    finally:
+        pool.terminate()
+
+def _compileFile(arguments):
+    """
+    Compiles the file at the given path using the given resolver. Runs in a
+    worker process, and so takes its arguments as a single tuple.
+
+    :returns: a (path, module) pair, where module is either the compiled
+              :class:`.Module` or the exception raised while compiling it.
+    """
+    path, resolver = arguments
+    try:
+        return path, resolver.load(path)
+    except RelationException as e:
+        return path, e
+
+def _getDependencies(module):
+    """
+    Returns the set of paths of the modules that the given module imports,
+    directly or indirectly.
+    """
+    dependencies = set()
+    stack = list(module.program.modules)
+    while stack:
+        dependency = stack.pop()
+        if dependency.path not in dependencies:
+            dependencies.add(dependency.path)
+            stack.extend(dependency.program.modules)
+    return dependencies
+
+def _executeModule(module, profile):
+    """
+    Executes the given module, creating its constraints even if they already
+    exist, so that loading a file always creates its constraints.
+
+    :returns: the :class:`LoadResult` for the module's file.
+    """
+    try:
+        return LoadResult(module.path, module.execute(profile, force = True))
+    except RelationException as e:
+        return LoadResult(module.path, error=e)
@@ -0,0 +1,360 @@
+"""
+`fbrelation.benchmark`
+
+Defines benchmarks for measuring the performance of the library. Each
+benchmark function returns a dictionary which maps the name of each measured
+case to the best time, in seconds, taken to run it. Running this module as a
+script runs every benchmark and prints the results::
+
+    python -m fbrelation.benchmark
+
+The phase benchmarks time the parsing, compilation, and execution of programs
+produced by the :mod:`.generate` module at several scales (see
+:data:`SCALES`), executing them against a :class:`.FakeSDK` scene, along with
+the time taken to write them back out as text and the time taken to produce
+them with a :class:`.ProgramBuilder` rather than from text. Results can
+be recorded as a baseline and later compared against it, in which case the
+script exits with a non-zero status if any case has slowed down by more than
+the given threshold::
+
+    python -m fbrelation.benchmark --record baseline.json
+    python -m fbrelation.benchmark --baseline baseline.json --threshold 0.2
+"""
+
+import argparse
+import json
+import sys
+import timeit
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from fbrelation.syntax.program import ProgramSyntax
+
+from fbrelation.backend import sdk
+from fbrelation.builder import ProgramBuilder
+from fbrelation.codegen import compileRelation
+from fbrelation.fakesdk import FakeSDK
+from fbrelation.generate import generateProgram
+from fbrelation.serialization import dump, dumps
+from fbrelation.template import compileTemplate
+
+SCALES = {
+    'small': {'relations': 5, 'boxes': 20},
+    'medium': {'relations': 20, 'boxes': 100},
+    'large': {'relations': 50, 'boxes': 400},
+    'huge': {'relations': 10, 'boxes': 10000},
+}
+""" Maps the name of each scale to the parameters used to generate programs. """
+
+DEFAULT_SCALES = ['small', 'medium', 'large']
+""" The scales run by default. The huge scale has over 100,000 boxes. """
+
+_EXAMPLE = '''
+linear_interpolate
+{
+    a [input="Number"]
+    b [input="Number"]
+    t [input="Number"]
+    sub  [group="Number", type="Subtract (a - b)"]
+    mult [group="Number", type="Multiply (a x b)"]
+    add  [group="Number", type="Add (a + b)"]
+    r [output="Number"]
+    b -> sub.a
+    a -> sub.b
+    sub.Result -> mult.a
+    t -> mult.b
+    a -> add.a
+    mult.Result -> add.b
+    add.Result -> r
+}
+
+test_constraint
+{
+    null [sender="Null"]
+    cube [receiver="Cube"]
+    null-translation [group="Converters", type="Vector to Number"]
+    cube-translation [group="Converters", type="Number to Vector"]
+    lerp [macro="linear_interpolate"]
+    null.Translation -> null-translation.V
+    null-translation.X -> lerp.a
+    null-translation.Y -> lerp.b
+    null-translation.Z -> lerp.t
+    lerp.r -> cube-translation.X
+    cube-translation.Result -> cube.Lcl Translation
+}
+'''
+""" The example program from the documentation, used by default. """
+
+_TEMPLATE = '''
+finger_$side_$digit
+{
+    base [sender="$side_Finger_Base_$digit"]
+    tip [receiver="$side_Finger_Tip_$digit"]
+    base-rotation [group="Converters", type="Vector to Number"]
+    tip-rotation [group="Converters", type="Number to Vector"]
+    curl [group="Number", type="Multiply (a x b)"]
+    spread [group="Number", type="Multiply (a x b)"]
+    twist [group="Number", type="Subtract (a - b)"]
+    base.Lcl Rotation -> base-rotation.V
+    base-rotation.X -> curl.a
+    base-rotation.X -> curl.b
+    base-rotation.Y -> spread.a
+    base-rotation.Z -> spread.b
+    base-rotation.Z -> twist.a
+    curl.Result -> tip-rotation.X
+    spread.Result -> tip-rotation.Y
+    twist.Result -> tip-rotation.Z
+    tip-rotation.Result -> tip.Lcl Rotation
+}
+'''
+""" A template for a finger relation, used to benchmark templates. """
+
+def measure(function, iterations, repeat=3):
+    """
+    Calls the given function the given number of times, repeating the
+    measurement several times, and returns the best total time in seconds.
+    """
+    return min(timeit.repeat(function, number=iterations, repeat=repeat))
+
+def benchmarkCodegen(relation, senders, arguments=None, iterations=10000):
+    """
+    Compares the time taken to evaluate the given relation declaration with
+    the graph-walking evaluator and with a function generated by the
+    :mod:`.codegen` module, along with the one-time cost of generating that
+    function.
+
+    :param senders:   The sender values to evaluate the relation with.
+    :param arguments: Optionally, the values of the relation's macro inputs.
+    """
+    compiled = compileRelation(relation)
+    values = [senders[p[1]][p[2]] if p[0] == 'sender' else
+        (arguments or {}).get(p[1], p[2]) for p in compiled.parameters]
+
+    return {
+        'evaluate': measure(
+            lambda: relation.evaluate(senders, arguments), iterations),
+        'codegen.call': measure(
+            lambda: compiled(senders, arguments), iterations),
+        'codegen.function': measure(
+            lambda: compiled.function(*values), iterations),
+        'codegen.compile': measure(
+            lambda: type(compiled)(relation), 1),
+    }
+
+def benchmarkPhases(text, repeat=3):
+    """
+    Measures the time taken to parse, compile, and execute the given program
+    text, executing it in a new :class:`.FakeSDK` scene each time.
+    """
+    syntax = ProgramSyntax.parse(text)
+    program = syntax.compile()
+
+    def execute():
+        """
+        Executes the program in a new, empty scene.
+        """
+        previous = sdk.use(FakeSDK())
+        try:
+            program.execute()
+        finally:
+            sdk.use(previous)
+
+    return {
+        'parse': measure(lambda: ProgramSyntax.parse(text), 1, repeat),
+        'compile': measure(syntax.compile, 1, repeat),
+        'execute': measure(execute, 1, repeat),
+    }
+
+def benchmarkSerialization(text, repeat=3):
+    """
+    Compares the time taken to convert the given program text back to a
+    string with `str` and with :func:`.dumps`, along with the time taken to
+    write it to a file with :func:`.dump`, from both its syntax and its
+    compiled declaration.
+    """
+    syntax = ProgramSyntax.parse(text)
+    program = syntax.compile()
+    return {
+        'str': measure(lambda: str(syntax), 1, repeat),
+        'dumps': measure(lambda: dumps(syntax), 1, repeat),
+        'dump': measure(lambda: dump(syntax, StringIO()), 1, repeat),
+        'dump.declaration': measure(
+            lambda: dump(program, StringIO()), 1, repeat),
+    }
+
+def benchmarkBuilder(text, repeat=3):
+    """
+    Compares two ways of producing the given program's declaration from the
+    same plain description of its relations, boxes, and connections: by
+    formatting it as text and then parsing and compiling that text, and by
+    adding each element with a :class:`.ProgramBuilder`.
+    """
+    description = [(relation.name,
+        [(box.name, dict(box.attributes.attributes)) for box in relation.boxes],
+        [(str(c.src), str(c.dst)) for c in relation.connections])
+        for relation in ProgramSyntax.parse(text).relations]
+
+    def formatBox(name, attributes):
+        """
+        Returns the text of a box declaration.
+        """
+        return '%s [%s]' % (name, ', '.join(
+            ['%s="%s"' % (key, attributes[key]) for key in sorted(attributes)]))
+
+    def viaText():
+        """
+        Formats the program as text, then parses and compiles it.
+        """
+        lines = []
+        for name, boxes, connections in description:
+            lines.extend([name, '{'])
+            lines.extend([formatBox(*box) for box in boxes])
+            lines.extend(['%s -> %s' % pair for pair in connections])
+            lines.append('}')
+        return ProgramSyntax.parse('\n'.join(lines)).compile()
+
+    def viaBuilder():
+        """
+        Builds the program with a builder.
+        """
+        builder = ProgramBuilder()
+        for name, boxes, connections in description:
+            relation = builder.relation(name)
+            for boxName, attributes in boxes:
+                relation.box(boxName, **attributes)
+            for src, dst in connections:
+                relation.connect(src, dst)
+        return builder.build()
+
+    return {
+        'text': measure(viaText, 1, repeat),
+        'builder': measure(viaBuilder, 1, repeat),
+    }
+
+def benchmarkTemplate(text, bindings, repeat=3):
+    """
+    Compares the time taken to produce a relation for each of the given sets
+    of parameter values from the given template text: by substituting the
+    values into the text and compiling each copy separately, and by
+    compiling the template once and instantiating it for each set of values.
+    """
+    def viaText():
+        """
+        Substitutes each set of values into the text and compiles it.
+        """
+        pattern = text.replace('$side', '%(side)s').replace(
+            '$digit', '%(digit)s')
+        return ProgramSyntax.parse(''.join(
+            [pattern % values for values in bindings])).compile()
+
+    def viaTemplate():
+        """
+        Compiles the template once and instantiates it for each set of
+        values.
+        """
+        template = compileTemplate(text)
+        return [template.instantiate(values) for values in bindings]
+
+    return {
+        'text': measure(viaText, 1, repeat),
+        'instantiate': measure(viaTemplate, 1, repeat),
+    }
+
+def runSuite(scales=None, seed=0, repeat=3):
+    """
+    Runs the phase, serialization, and builder benchmarks against a generated
+    program at each of the given scales (by default, :data:`DEFAULT_SCALES`).
+
+    :returns: a dictionary mapping case names of the form "<scale>.<phase>",
+              "<scale>.serialize.<case>", or "<scale>.build.<case>" to the
+              best time taken, in seconds.
+    """
+    results = {}
+    for scale in scales or DEFAULT_SCALES:
+        text = generateProgram(seed, **SCALES[scale])
+        for phase, seconds in benchmarkPhases(text, repeat).items():
+            results['%s.%s' % (scale, phase)] = seconds
+        for case, seconds in benchmarkSerialization(text, repeat).items():
+            results['%s.serialize.%s' % (scale, case)] = seconds
+        for case, seconds in benchmarkBuilder(text, repeat).items():
+            results['%s.build.%s' % (scale, case)] = seconds
+    return results
+
+def findRegressions(results, baseline, threshold=0.2):
+    """
+    Compares the given results against a baseline.
+
+    :param threshold: The fraction by which a case may be slower than its
+                      baseline before it's considered a regression.
+
+    :returns: a sorted list of (name, baseline, result) tuples for each case
+              that has regressed. Cases missing from either side are ignored.
+    """
+    regressions = []
+    for name in sorted(set(results) & set(baseline)):
+        if results[name] > baseline[name] * (1.0 + threshold):
+            regressions.append((name, baseline[name], results[name]))
+    return regressions
+
+def main(argv=None):
+    """
+    Runs each benchmark, printing the results, and optionally records them
+    as a baseline or compares them against one.
+
+    :returns: 1 if any regressions were found, or 0 otherwise.
+    """
+    parser = argparse.ArgumentParser(description=
+        'Measures the performance of the fbrelation library.')
+    parser.add_argument('--scales', default=','.join(DEFAULT_SCALES),
+        help='a comma-separated list of scales to run, from %s '
+        '(default: %s)' % (', '.join(sorted(SCALES)), ','.join(DEFAULT_SCALES)))
+    parser.add_argument('--seed', type=int, default=0,
+        help='the seed used to generate programs (default: 0)')
+    parser.add_argument('--repeat', type=int, default=3,
+        help='the number of times to repeat each measurement (default: 3)')
+    parser.add_argument('--record',
+        help='a JSON file in which to record the results as a baseline')
+    parser.add_argument('--baseline',
+        help='a JSON file containing a baseline to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+        help='the allowed slowdown relative to the baseline (default: 0.2)')
+    args = parser.parse_args(argv)
+
+    # Compare evaluation strategies on the example program
+    program = ProgramSyntax.parse(_EXAMPLE).compile()
+    senders = {'Null': {'Translation': (1.0, 3.0, 0.5)}}
+    results = benchmarkCodegen(program.relations[-1], senders)
+
+    # Compare compiling 200 copies of a relation with instantiating a template
+    bindings = [{'side': side, 'digit': str(digit)}
+        for side in ('Left', 'Right') for digit in range(100)]
+    for case, seconds in benchmarkTemplate(
+            _TEMPLATE, bindings, args.repeat).items():
+        results['template.%s' % case] = seconds
+
+    # Measure each phase at each of the requested scales
+    scales = [scale for scale in args.scales.split(',') if scale]
+    results.update(runSuite(scales, args.seed, args.repeat))
+    for name in sorted(results):
+        print('%-24s %10.6fs' % (name, results[name]))
+
+    if args.record:
+        with open(args.record, 'w') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        regressions = findRegressions(results, baseline, args.threshold)
+        for name, before, after in regressions:
+            print('REGRESSION %-24s %10.6fs -> %10.6fs (%+.0f%%)' %
+                (name, before, after, (after / before - 1.0) * 100.0))
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,244 @@
+"""
+`fbrelation.builder`
+
+Builds programs directly from Python code, producing the same
+:class:`.ProgramDeclaration` objects that compiling a program's text would,
+without formatting or parsing any text along the way::
+
+    program = (ProgramBuilder()
+        .relation('linear_interpolate')
+            .input('a', 'Number')
+            .input('b', 'Number')
+            .function('sub', 'Number', 'Subtract (a - b)')
+            .output('r', 'Number')
+            .connect('b', 'sub.a')
+            .connect('a', 'sub.b')
+            .connect('sub.Result', 'r')
+        .relation('test_constraint')
+            .sender('null', 'Null')
+            .macro('lerp', 'linear_interpolate')
+            ...
+        .build())
+
+Each box and connection is checked as it's added, by the same code that checks
+box and node syntax during compilation, so the builder raises the same
+:class:`.CompilationError` that the equivalent text would. Each relation is
+finished when the next one is begun (or when the program is built), at which
+point it becomes available for use as a macro, and nothing more can be added
+to it.
+"""
+
+from fbrelation.exceptions import CompilationError
+
+from fbrelation.syntax.attributelist import AttributeListSyntax
+from fbrelation.syntax.box import BoxSyntax
+from fbrelation.syntax.node import NodeSyntax
+from fbrelation.syntax.connection import ConnectionSyntax
+from fbrelation.syntax.vector import VectorConverters
+
+from fbrelation.declarations.program import ProgramDeclaration
+from fbrelation.declarations.relation import RelationDeclaration
+
+class ProgramBuilder(object):
+    """
+    Builds a :class:`.ProgramDeclaration` one relation at a time.
+    """
+
+    def __init__(self):
+        """
+        Initializes a new builder for an empty program.
+        """
+        self.relations = []
+        """ The relation declarations finished so far. """
+
+        self._relationsByName = {}
+        self._current = None
+
+    def relation(self, name):
+        """
+        Finishes the current relation, if any, and begins a new one with the
+        given name.
+
+        :returns: a :class:`RelationBuilder` for the new relation.
+        :raises:  a :class:`.CompilationError` if the name is blank.
+        """
+        self._finishRelation()
+        if not name:
+            raise CompilationError(
+                'Relation constraint declarations must be explicitly named.')
+        self._current = RelationBuilder(self, name)
+        return self._current
+
+    def build(self):
+        """
+        Finishes the current relation, if any, and returns the program.
+
+        :returns: the resulting program declaration.
+        """
+        self._finishRelation()
+        return ProgramDeclaration(list(self.relations))
+
+    def instantiate(self, template, values):
+        """
+        Finishes the current relation, if any, and adds an instance of the
+        given :class:`.RelationTemplate` to the program, making it available
+        for use as a macro.
+
+        :param values: Maps the name of each of the template's parameters to
+                       its value.
+
+        :returns: the builder itself.
+        """
+        self._finishRelation()
+        self._addRelation(template.instantiate(values))
+        return self
+
+    def findRelation(self, name):
+        """
+        Returns the first finished relation declaration with the given name,
+        or None.
+        """
+        return self._relationsByName.get(name)
+
+    def _finishRelation(self):
+        """
+        Converts the relation currently being built into a declaration,
+        making it available for use as a macro.
+        """
+        if self._current is not None:
+            self._addRelation(self._current.getDeclaration())
+            self._current.finished = True
+            self._current = None
+
+    def _addRelation(self, relation):
+        """
+        Adds a finished relation declaration to the program.
+        """
+        self.relations.append(relation)
+        self._relationsByName.setdefault(relation.name, relation)
+
+class RelationBuilder(object):
+    """
+    Builds a single relation within a :class:`ProgramBuilder`. Every method
+    that adds a box or connection returns the builder itself, so that calls
+    can be chained.
+    """
+
+    def __init__(self, program, name):
+        """
+        Initializes a new builder for an empty relation with the given name,
+        belonging to the given program builder.
+        """
+        self.program = program
+        self.name = name
+        self.boxes = []
+        self.connections = []
+        self.finished = False
+        """
+        Whether the relation has been finished, after which no more boxes or
+        connections can be added to it.
+        """
+        self._boxesByName = {}
+        self._converters = VectorConverters(self.boxes, self._boxesByName)
+
+    def box(self, name, **attributes):
+        """
+        Adds a box with the given attributes, exactly as they'd be written in
+        a box declaration: for example, `box('t', input='Number')`.
+
+        :raises: a :class:`.CompilationError` if the box fails to statically
+                 check, or if the relation has been finished.
+        """
+        self._checkUnfinished()
+        syntax = BoxSyntax(name, AttributeListSyntax(attributes))
+        box = syntax.compile(self._boxesByName, self.program._relationsByName)
+        self.boxes.append(box)
+        self._boxesByName[name] = box
+        return self
+
+    def function(self, name, groupName, typeName):
+        """
+        Adds a function box of the given type from the given group.
+        """
+        return self.box(name, group=groupName, type=typeName)
+
+    def input(self, name, inputType):
+        """
+        Adds a macro input box of the given type.
+        """
+        return self.box(name, input=inputType)
+
+    def output(self, name, outputType):
+        """
+        Adds a macro output box of the given type.
+        """
+        return self.box(name, output=outputType)
+
+    def macro(self, name, relationName):
+        """
+        Adds a macro box which uses the named relation, which must already be
+        finished.
+        """
+        return self.box(name, macro=relationName)
+
+    def sender(self, name, componentName):
+        """
+        Adds a sender box for the named scene component.
+        """
+        return self.box(name, sender=componentName)
+
+    def receiver(self, name, componentName):
+        """
+        Adds a receiver box for the named scene component.
+        """
+        return self.box(name, receiver=componentName)
+
+    def connect(self, src, dst):
+        """
+        Adds a connection between two nodes, each of which is given as it'd
+        be written in a connection declaration: either `box.node`, or just
+        `box` for a macro input or output, optionally followed by a vector
+        component (see :mod:`.syntax.vector`).
+
+        :raises: a :class:`.ParsingError` if either node is malformed, or a
+                 :class:`.CompilationError` if the connection fails to
+                 statically check, or if the relation has been finished.
+        """
+        self._checkUnfinished()
+        self.connections.extend(self._converters.compile(ConnectionSyntax(
+            NodeSyntax.parse(src), NodeSyntax.parse(dst))))
+        return self
+
+    def relation(self, name):
+        """
+        Finishes this relation and begins a new one in the same program.
+
+        :returns: a :class:`RelationBuilder` for the new relation.
+        """
+        return self.program.relation(name)
+
+    def build(self):
+        """
+        Finishes this relation and returns the entire program.
+        """
+        return self.program.build()
+
+    def getDeclaration(self):
+        """
+        Returns a new :class:`.RelationDeclaration` from the boxes and
+        connections added so far.
+        """
+        return RelationDeclaration(
+            self.name, list(self.boxes), list(self.connections))
+
+    def _checkUnfinished(self):
+        """
+        Ensures that the relation is still being built.
+
+        :raises: a :class:`.CompilationError` if the relation has been
+                 finished.
+        """
+        if self.finished:
+            raise CompilationError(
+                'The relation constraint "%s" has already been finished, so '
+                'nothing more can be added to it.' % self.name)
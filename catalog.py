@@ -0,0 +1,194 @@
+"""
+`fbrelation.catalog`
+
+Defines a catalog of known function box types. MotionBuilder doesn't expose
+the node names or behavior of its function boxes, so the catalog describes
+them independently: for each group and type name, it records the names and
+value types of the box's input and output nodes, along with a Python function
+that computes the box's outputs. This allows relations to be evaluated
+offline, without MotionBuilder.
+
+Values are represented as plain Python objects: numbers as floats, vectors as
+3-tuples of floats, and booleans as bools. Angles are given in degrees, as in
+MotionBuilder. Unknown box types can be described with
+:func:`registerFunctionType`.
+"""
+
+import math
+
+DEFAULT_VALUES = {
+    'Bool': False,
+    'ColorAndAlpha': (0.0, 0.0, 0.0, 0.0),
+    'Number': 0.0,
+    'Time': 0.0,
+    'Vector': (0.0, 0.0, 0.0),
+}
+"""
+Maps the name of each value type to the value assumed for an input node of
+that type when nothing is connected to it.
+"""
+
+VECTOR_PROPERTIES = ['Translation', 'Rotation', 'Scaling', 'Lcl Translation',
+    'Lcl Rotation', 'Lcl Scaling']
+"""
+The names of the model properties known to hold vectors. Other properties can
+be declared as vectors with the `vectors` attribute of a sender or receiver
+box.
+"""
+
+class FunctionType(object):
+    """
+    Describes a single type of function box: its input and output nodes, and
+    how to compute the values of its outputs from the values of its inputs.
+    """
+
+    def __init__(self, groupName, typeName, inputs, outputs, function,
+                 expressions=None):
+        """
+        Initializes a new description of the function box type with the given
+        group and type name.
+
+        :param inputs:      A list of (nodeName, valueType) pairs for the
+                            box's input nodes, in the order expected by
+                            function.
+        :param outputs:     A list of (nodeName, valueType) pairs for the
+                            box's output nodes, in the order returned by
+                            function.
+        :param function:    A callable which accepts one argument per input
+                            node and returns a tuple with one value per output
+                            node.
+        :param expressions: Optionally, a list of Python expressions, one per
+                            output node, which compute the same values as
+                            function. Each is a format string in which
+                            `%(name)s` stands for the input node of that
+                            name. Used to generate inline code; boxes without
+                            expressions are compiled into calls to function.
+        """
+        self.groupName = groupName
+        self.typeName = typeName
+        self.inputs = inputs
+        self.outputs = outputs
+        self.function = function
+        self.expressions = expressions
+
+    def evaluate(self, inputValues):
+        """
+        Computes the box's outputs from the given dictionary of input node
+        names to values. Inputs that are missing from the dictionary take the
+        default value for their type.
+
+        :returns: a dictionary mapping output node names to values.
+        """
+        arguments = [inputValues.get(name, DEFAULT_VALUES[valueType])
+            for name, valueType in self.inputs]
+        results = self.function(*arguments)
+        return dict(zip([name for name, _ in self.outputs], results))
+
+    def getNodeValueType(self, nodeName, isInput):
+        """
+        Returns the value type of the named input or output node, or None if
+        the box has no such node.
+        """
+        for name, valueType in (self.inputs if isInput else self.outputs):
+            if name == nodeName:
+                return valueType
+        return None
+
+# The catalog itself, mapping (groupName, typeName) pairs to FunctionTypes
+_functionTypes = {}
+
+def registerFunctionType(functionType):
+    """
+    Adds the given :class:`FunctionType` to the catalog, replacing any
+    existing description of a box with the same group and type name.
+    """
+    _functionTypes[(functionType.groupName, functionType.typeName)] = \
+        functionType
+
+def findFunctionType(groupName, typeName):
+    """
+    Returns the :class:`FunctionType` registered for the given group and type
+    name, or None if the box type is unknown.
+    """
+    return _functionTypes.get((groupName, typeName))
+
+def _divide(a, b):
+    """
+    Divides a by b, producing zero rather than an error when b is zero.
+    """
+    return a / b if b else 0.0
+
+def _register(groupName, typeName, inputs, outputs, function,
+              expressions=None):
+    """
+    Helper function used to populate the catalog with built-in box types.
+    Inputs and outputs are given as (name, type) pairs.
+    """
+    registerFunctionType(FunctionType(
+        groupName, typeName, inputs, outputs, function, expressions))
+
+_N = 'Number'
+_V = 'Vector'
+
+# Number boxes
+_register('Number', 'Absolute (|a|)', [('a', _N)], [('Result', _N)],
+    lambda a: (abs(a),), ['abs(%(a)s)'])
+_register('Number', 'Add (a + b)', [('a', _N), ('b', _N)], [('Result', _N)],
+    lambda a, b: (a + b,), ['%(a)s + %(b)s'])
+_register('Number', 'Subtract (a - b)', [('a', _N), ('b', _N)],
+    [('Result', _N)], lambda a, b: (a - b,), ['%(a)s - %(b)s'])
+_register('Number', 'Multiply (a x b)', [('a', _N), ('b', _N)],
+    [('Result', _N)], lambda a, b: (a * b,), ['%(a)s * %(b)s'])
+_register('Number', 'Divide (a/b)', [('a', _N), ('b', _N)], [('Result', _N)],
+    lambda a, b: (_divide(a, b),),
+    ['(%(a)s / %(b)s if %(b)s else 0.0)'])
+_register('Number', 'Invert (1/a)', [('a', _N)], [('Result', _N)],
+    lambda a: (_divide(1.0, a),),
+    ['(1.0 / %(a)s if %(a)s else 0.0)'])
+_register('Number', 'Exponent (a^b)', [('a', _N), ('b', _N)],
+    [('Result', _N)], lambda a, b: (math.pow(a, b),))
+_register('Number', 'Modulo mod(a, b)', [('a', _N), ('b', _N)],
+    [('Result', _N)], lambda a, b: (math.fmod(a, b) if b else 0.0,))
+_register('Number', 'Sine sin(a)', [('a', _N)], [('Result', _N)],
+    lambda a: (math.sin(math.radians(a)),))
+_register('Number', 'Cosine cos(a)', [('a', _N)], [('Result', _N)],
+    lambda a: (math.cos(math.radians(a)),))
+_register('Number', 'sqrt(a)', [('a', _N)], [('Result', _N)],
+    lambda a: (math.sqrt(a) if a > 0.0 else 0.0,))
+
+# Vector boxes
+_register('Vector', 'Add (V1 + V2)', [('V1', _V), ('V2', _V)],
+    [('Result', _V)],
+    lambda v1, v2: (tuple(a + b for a, b in zip(v1, v2)),),
+    ['(%(V1)s[0] + %(V2)s[0], %(V1)s[1] + %(V2)s[1], '
+     '%(V1)s[2] + %(V2)s[2])'])
+_register('Vector', 'Subtract (V1 - V2)', [('V1', _V), ('V2', _V)],
+    [('Result', _V)],
+    lambda v1, v2: (tuple(a - b for a, b in zip(v1, v2)),),
+    ['(%(V1)s[0] - %(V2)s[0], %(V1)s[1] - %(V2)s[1], '
+     '%(V1)s[2] - %(V2)s[2])'])
+_register('Vector', 'Scale (a x V)', [('Number', _N), ('Vector', _V)],
+    [('Result', _V)],
+    lambda n, v: (tuple(n * x for x in v),),
+    ['(%(Number)s * %(Vector)s[0], %(Number)s * %(Vector)s[1], '
+     '%(Number)s * %(Vector)s[2])'])
+_register('Vector', 'Dot Product (V1 . V2)', [('V1', _V), ('V2', _V)],
+    [('Result', _N)],
+    lambda v1, v2: (sum(a * b for a, b in zip(v1, v2)),),
+    ['(%(V1)s[0] * %(V2)s[0] + %(V1)s[1] * %(V2)s[1] + '
+     '%(V1)s[2] * %(V2)s[2])'])
+_register('Vector', 'Vector Product (V1 x V2)', [('V1', _V), ('V2', _V)],
+    [('Result', _V)],
+    lambda v1, v2: ((v1[1] * v2[2] - v1[2] * v2[1],
+                     v1[2] * v2[0] - v1[0] * v2[2],
+                     v1[0] * v2[1] - v1[1] * v2[0]),))
+_register('Vector', 'Length', [('V', _V)], [('Result', _N)],
+    lambda v: (math.sqrt(sum(x * x for x in v)),))
+
+# Converters
+_register('Converters', 'Vector to Number', [('V', _V)],
+    [('X', _N), ('Y', _N), ('Z', _N)],
+    lambda v: tuple(v), ['%(V)s[0]', '%(V)s[1]', '%(V)s[2]'])
+_register('Converters', 'Number to Vector', [('X', _N), ('Y', _N), ('Z', _N)],
+    [('Result', _V)],
+    lambda x, y, z: ((x, y, z),), ['(%(X)s, %(Y)s, %(Z)s)'])
@@ -0,0 +1,336 @@
+"""
+`fbrelation.codegen`
+
+Compiles relation declarations into plain Python functions for fast offline
+evaluation. Rather than walking the relation's graph box by box, as
+:meth:`.RelationDeclaration.evaluate` does, the code generator lowers the
+relation (with any macros inlined) into a straight-line function, with one
+local variable per node and one argument per sender node or macro input::
+
+    def linear_interpolate(a0, a1, a2):
+        ...
+        # sub
+        v1 = a1 - a0
+        ...
+        return (v3, )
+
+Each function is compiled once and cached according to the structural hash of
+the relation it was generated from, so that structurally identical relations
+share the same compiled code.
+"""
+
+import keyword
+import re
+
+from fbrelation.exceptions import EvaluationError
+
+from fbrelation.catalog import DEFAULT_VALUES
+
+# Compiled relations, keyed by the structural hashes of their declarations
+_compiledRelations = {}
+
+def compileRelation(relation):
+    """
+    Returns a :class:`CompiledRelation` for the given relation declaration,
+    generating and compiling its code only if no structurally identical
+    relation has been compiled before.
+
+    :raises: an :class:`.EvaluationError` if code can not be generated for
+             any of the relation's boxes.
+    """
+    key = relation.getStructuralHash()
+    compiled = _compiledRelations.get(key)
+    if compiled is None:
+        compiled = CompiledRelation(relation)
+        _compiledRelations[key] = compiled
+    return compiled
+
+class CompiledRelation(object):
+    """
+    Holds a Python function generated from a relation declaration, along with
+    a description of its parameters and results.
+    """
+
+    def __init__(self, relation):
+        """
+        Generates and compiles a function from the given relation declaration.
+
+        :raises: an :class:`.EvaluationError` if code can not be generated
+                 for any of the relation's boxes.
+        """
+        generator = Generator()
+        generator.generateRelation(relation)
+
+        self.parameters = generator.parameters
+        """
+        A list describing each of the function's arguments in order, as either
+        ('sender', componentName, nodeName) or ('input', name, default).
+        """
+
+        self.results = generator.results
+        """
+        A list describing each value in the tuple returned by the function, as
+        either ('receiver', componentName, nodeName) or ('output', name).
+        """
+
+        self.source = generator.getSource(_getIdentifier(relation.name))
+        """ The generated Python source code. """
+
+        namespace = dict(generator.functions)
+        code = compile(self.source, '<fbrelation: %s>' % relation.name, 'exec')
+        exec(code, namespace)
+        self.function = namespace[_getIdentifier(relation.name)]
+        """ The compiled function. """
+
+    def __call__(self, senders, arguments=None):
+        """
+        Calls the compiled function with values taken from dictionaries of
+        the same form accepted by :meth:`.RelationDeclaration.evaluate`.
+
+        :returns: a (receivers, outputs) tuple, in which receivers maps
+                  receiver component names to dictionaries of node name ->
+                  value mappings, and outputs maps the names of macro outputs
+                  to values.
+        :raises:  an :class:`.EvaluationError` if a sender value is missing.
+        """
+        # Gather the function's arguments in order
+        arguments = arguments or {}
+        values = []
+        for parameter in self.parameters:
+            if parameter[0] == 'sender':
+                try:
+                    values.append(senders[parameter[1]][parameter[2]])
+                except KeyError:
+                    raise EvaluationError(
+                        'No value was given for the node "%s" of the sender '
+                        '"%s".' % (parameter[2], parameter[1]))
+            else:
+                values.append(arguments.get(parameter[1], parameter[2]))
+
+        # Call the function and sort its results into dictionaries
+        receivers = {}
+        outputs = {}
+        for result, value in zip(self.results, self.function(*values)):
+            if result[0] == 'receiver':
+                receivers.setdefault(result[1], {})[result[2]] = value
+            else:
+                outputs[result[1]] = value
+        return receivers, outputs
+
+class Generator(object):
+    """
+    Accumulates the lines of code for a generated function as the boxes of a
+    relation emit them through their :meth:`~.BoxDeclaration.generate`
+    methods.
+    """
+
+    def __init__(self):
+        """
+        Initializes a new generator with an empty function body.
+        """
+        self.parameters = []
+        self.results = []
+        self.functions = {}
+        """ Maps the names of non-inlined functions to their callables. """
+
+        self._lines = []
+        self._variableCount = 0
+        self._senderVariables = {}
+        self._scopes = []
+
+    def generateRelation(self, relation):
+        """
+        Generates the body of a function for the given top-level relation.
+        The function returns the values received by the relation's receivers
+        and macro outputs.
+        """
+        self._scopes.append(_Scope(None))
+        self._generateBody(relation)
+        scope = self._scopes.pop()
+
+        # Return every value received by a receiver or a macro output
+        variables = []
+        for componentName in sorted(scope.receivers):
+            for nodeName in sorted(scope.receivers[componentName]):
+                self.results.append(('receiver', componentName, nodeName))
+                variables.append(scope.receivers[componentName][nodeName])
+        for name in relation.getMacroToolNames(False):
+            self.results.append(('output', name))
+            variables.append(scope.outputs[name])
+        self._lines.append('return (%s)' % ''.join(
+            '%s, ' % variable for variable in variables))
+
+    def inline(self, relation, arguments):
+        """
+        Generates code for a relation used as a macro, within the body of the
+        function being generated.
+
+        :param arguments: Maps the names of the relation's macro inputs to the
+                          variables that hold their values.
+
+        :returns: a dictionary which maps the names of the relation's macro
+                  outputs to the variables that hold their values.
+        """
+        self._scopes.append(_Scope(arguments))
+        self._generateBody(relation)
+        return self._scopes.pop().outputs
+
+    def emitFunction(self, functionType, inputVariables):
+        """
+        Emits code for a function box of the given type from the
+        :mod:`.catalog`, using its inline expressions if it has them.
+
+        :returns: a dictionary which maps output node names to variables.
+        """
+        # Use the variable connected to each input, or the default value
+        arguments = {}
+        for name, valueType in functionType.inputs:
+            arguments[name] = inputVariables.get(name,
+                repr(DEFAULT_VALUES[valueType]))
+        outputNames = [name for name, _ in functionType.outputs]
+
+        # Assign each output from its expression, if possible
+        if functionType.expressions:
+            outputs = {}
+            for name, expression in zip(outputNames,
+                    functionType.expressions):
+                outputs[name] = self.emitAssignment(expression % arguments)
+            return outputs
+
+        # Otherwise, call the function directly and unpack its results
+        functionName = '_%s_%d' % (
+            _getIdentifier(functionType.typeName), id(functionType))
+        self.functions[functionName] = functionType.function
+        variables = [self.newVariable() for name in outputNames]
+        self._lines.append('%s = %s(%s)' % (
+            ''.join('%s, ' % variable for variable in variables),
+            functionName,
+            ', '.join(arguments[name] for name, _ in functionType.inputs)))
+        return dict(zip(outputNames, variables))
+
+    def emitAssignment(self, expression):
+        """
+        Emits a line of code that assigns the given expression to a new local
+        variable, and returns the name of that variable.
+        """
+        variable = self.newVariable()
+        self._lines.append('%s = %s' % (variable, expression))
+        return variable
+
+    def newVariable(self):
+        """
+        Returns the name of a new, unique local variable.
+        """
+        self._variableCount += 1
+        return 'v%d' % self._variableCount
+
+    def getArgument(self, name, default):
+        """
+        Returns the variable holding the value of the named macro input. In a
+        top-level relation, this adds a parameter to the function; in an
+        inlined macro, the variable is the one bound by the macro box, or a
+        default value if the input isn't connected.
+        """
+        scope = self._scopes[-1]
+        if scope.arguments is not None:
+            return scope.arguments.get(name, repr(default))
+
+        variable = 'a%d' % len(self.parameters)
+        self.parameters.append(('input', name, default))
+        return variable
+
+    def getSenderVariables(self, componentName):
+        """
+        Returns a dictionary which maps the node names of the given sender
+        component to the variables holding their values. Parameters are added
+        to the function for each node as it's first referenced, and shared by
+        all senders for the same component.
+        """
+        if componentName not in self._senderVariables:
+            self._senderVariables[componentName] = _SenderVariables(
+                self, componentName)
+        return self._senderVariables[componentName]
+
+    def setOutput(self, name, variable):
+        """
+        Records the variable holding the value of the named macro output.
+        """
+        self._scopes[-1].outputs[name] = variable
+
+    def setReceiver(self, componentName, inputVariables):
+        """
+        Records the variables holding the values received by the given
+        receiver component, keyed by node name.
+        """
+        self._scopes[-1].receivers.setdefault(
+            componentName, {}).update(inputVariables)
+
+    def getSource(self, functionName):
+        """
+        Returns the complete source code of the generated function.
+        """
+        parameters = ', '.join('a%d' % i for i in range(len(self.parameters)))
+        return 'def %s(%s):\n%s\n' % (functionName, parameters,
+            '\n'.join('    %s' % line for line in self._lines))
+
+    def _generateBody(self, relation):
+        """
+        Generates code for each box in the given relation, in dependency
+        order, in the current scope.
+        """
+        variables = {}
+        for box, inputConnections in relation.getEvaluationPlan():
+            inputVariables = {}
+            for connection in inputConnections:
+                inputVariables[connection.dst.key] = connection.src.evaluate(
+                    variables[connection.src.box.name])
+            self._lines.append('# %s' % box.name)
+            variables[box.name] = box.generate(inputVariables, self)
+
+class _Scope(object):
+    """
+    Holds the results of a relation whose code is being generated, along with
+    the variables bound to its macro inputs (or None for a top-level
+    relation, whose macro inputs are function parameters).
+    """
+
+    def __init__(self, arguments):
+        """
+        Initializes a new scope with the given macro input bindings.
+        """
+        self.arguments = arguments
+        self.receivers = {}
+        self.outputs = {}
+
+class _SenderVariables(dict):
+    """
+    Maps the node names of a sender component to variables, adding a new
+    parameter to the generated function whenever a new node is referenced.
+    """
+
+    def __init__(self, generator, componentName):
+        """
+        Initializes an empty mapping for the given sender component.
+        """
+        super(_SenderVariables, self).__init__()
+        self.generator = generator
+        self.componentName = componentName
+
+    def __missing__(self, nodeName):
+        """
+        Adds a parameter for the given node and returns its variable.
+        """
+        parameters = self.generator.parameters
+        variable = 'a%d' % len(parameters)
+        parameters.append(('sender', self.componentName, nodeName))
+        self[nodeName] = variable
+        return variable
+
+def _getIdentifier(name):
+    """
+    Converts the given name into a valid Python identifier.
+    """
+    identifier = re.sub(r'\W', '_', name)
+    if not re.match(r'[A-Za-z_]', identifier) or keyword.iskeyword(identifier):
+        identifier = '_' + identifier
+    return identifier
@@ -0,0 +1,563 @@
+"""
+`fbrelation.columnar`
+
+Stores compiled relations in a compact, columnar form. A
+:class:`.RelationDeclaration` is a graph of objects: boxes, connections, and
+nodes that point back at their boxes. That suits compilation and execution,
+but whole-graph passes over very large programs spend most of their time
+chasing pointers. A :class:`ColumnarRelation` instead holds the same graph as
+a handful of integer columns:
+
+- one row per box, giving its name, kind (function, macro, sender, and so
+  on), and group and type, as ids interned in a :class:`StringTable` shared
+  by the whole program;
+- one row per connection, giving the indices of its source and destination
+  boxes and the ids of their node names;
+- the connections of each box in compressed sparse row (CSR) form: for box
+  `i`, the indices of its outgoing connections are
+  `outConnections[outOffsets[i]:outOffsets[i + 1]]`, and likewise for its
+  incoming connections.
+
+Columns are NumPy arrays if NumPy is installed, and arrays from the standard
+library's :mod:`array` module otherwise. Graph analyses such as
+:meth:`ColumnarRelation.findReachable` and
+:meth:`ColumnarRelation.getTopologicalOrder` work a whole frontier of boxes at
+a time, and are vectorized when NumPy is available::
+
+    store = ColumnarProgram.fromProgram(program)
+    for relation in store.relations:
+        depths = relation.getDepths()
+    program = store.toProgram()
+
+Converting back produces an equivalent program: declarations are recreated
+from the columns, so any components bound to senders and receivers ahead of
+time are not preserved.
+"""
+
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from fbrelation.exceptions import EvaluationError, CompilationError
+
+from fbrelation.registry import defaultRegistry
+
+from fbrelation.declarations.box import FunctionBoxDeclaration, \
+                                        MacroBoxDeclaration, \
+                                        MacroInputBoxDeclaration, \
+                                        MacroOutputBoxDeclaration, \
+                                        SenderBoxDeclaration, \
+                                        ReceiverBoxDeclaration
+from fbrelation.declarations.node import BoxNodeDeclaration, \
+                                         MacroNodeDeclaration
+from fbrelation.declarations.connection import ConnectionDeclaration
+from fbrelation.declarations.relation import RelationDeclaration
+from fbrelation.declarations.program import ProgramDeclaration
+
+FUNCTION = 0
+""" The kind of a function box. """
+
+MACRO = 1
+""" The kind of a macro box. """
+
+INPUT = 2
+""" The kind of a macro input box. """
+
+OUTPUT = 3
+""" The kind of a macro output box. """
+
+SENDER = 4
+""" The kind of a sender box. """
+
+RECEIVER = 5
+""" The kind of a receiver box. """
+
+NONE = -1
+""" The id stored in place of a missing string. """
+
+VECTOR_THRESHOLD = 16
+""" The number of boxes in a frontier at which analyses are vectorized. """
+
+class StringTable(object):
+    """
+    Interns strings as integer ids, so that each distinct string is stored
+    once no matter how many rows refer to it.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty table.
+        """
+        self.strings = []
+        """ The interned strings, indexed by id. """
+        self._ids = {}
+
+    def __len__(self):
+        """
+        Returns the number of strings in the table.
+        """
+        return len(self.strings)
+
+    def intern(self, string):
+        """
+        Returns the id of the given string, adding it to the table if it's
+        not already present. None is given the id :data:`NONE`.
+        """
+        if string is None:
+            return NONE
+        stringId = self._ids.get(string)
+        if stringId is None:
+            stringId = self._ids[string] = len(self.strings)
+            self.strings.append(string)
+        return stringId
+
+    def find(self, string):
+        """
+        Returns the id of the given string, or :data:`NONE` if it's not in
+        the table.
+        """
+        return self._ids.get(string, NONE)
+
+    def get(self, stringId):
+        """
+        Returns the string with the given id, or None for :data:`NONE`.
+        """
+        if stringId == NONE:
+            return None
+        return self.strings[stringId]
+
+class ColumnarRelation(object):
+    """
+    Holds the boxes and connections of a relation as integer columns, with
+    the connections of each box indexed in CSR form.
+    """
+
+    def __init__(self, name, strings, boxNames, boxKinds, boxGroups, boxTypes,
+                 boxVectors, srcBoxes, srcNodes, dstBoxes, dstNodes):
+        """
+        Initializes a relation from its columns, given as sequences of
+        integers, and builds its CSR indices.
+
+        :param strings:    The :class:`StringTable` holding the strings
+                           referred to by id.
+        :param boxGroups:  The group name of each function box, or
+                           :data:`NONE`.
+        :param boxTypes:   The type name of each function box, the value type
+                           of each macro input or output, the component name
+                           of each sender or receiver, or the relation name of
+                           each macro box.
+        :param boxVectors: The `vectors` attribute of each sender or receiver,
+                           or :data:`NONE`.
+        :param srcNodes:   The node name of each connection's source, or
+                           :data:`NONE` for a macro input.
+        :param dstNodes:   The node name of each connection's destination, or
+                           :data:`NONE` for a macro output.
+        """
+        self.name = name
+        self.strings = strings
+        self.boxNames = _column('i', boxNames)
+        self.boxKinds = _column('b', boxKinds)
+        self.boxGroups = _column('i', boxGroups)
+        self.boxTypes = _column('i', boxTypes)
+        self.boxVectors = _column('i', boxVectors)
+        self.srcBoxes = _column('i', srcBoxes)
+        self.srcNodes = _column('i', srcNodes)
+        self.dstBoxes = _column('i', dstBoxes)
+        self.dstNodes = _column('i', dstNodes)
+
+        self.outOffsets, self.outConnections = _buildIndex(
+            self.srcBoxes, len(self.boxNames))
+        """ The CSR index of the connections leaving each box. """
+        self.inOffsets, self.inConnections = _buildIndex(
+            self.dstBoxes, len(self.boxNames))
+        """ The CSR index of the connections entering each box. """
+
+    @property
+    def boxCount(self):
+        """
+        The number of boxes in the relation.
+        """
+        return len(self.boxNames)
+
+    @property
+    def connectionCount(self):
+        """
+        The number of connections in the relation.
+        """
+        return len(self.srcBoxes)
+
+    @classmethod
+    def fromRelation(cls, relation, strings=None):
+        """
+        Converts the given :class:`.RelationDeclaration` to columnar form.
+
+        :param strings: Optionally, a :class:`StringTable` to share with
+                        other relations.
+        """
+        strings = StringTable() if strings is None else strings
+        indices = {}
+        names, kinds, groups, types, vectors = [], [], [], [], []
+        for i, box in enumerate(relation.boxes):
+            indices[id(box)] = i
+            kind, group, boxType, vectorNodes = _describeBox(box)
+            names.append(strings.intern(box.name))
+            kinds.append(kind)
+            groups.append(strings.intern(group))
+            types.append(strings.intern(boxType))
+            vectors.append(strings.intern(vectorNodes))
+
+        srcBoxes, srcNodes, dstBoxes, dstNodes = [], [], [], []
+        for connection in relation.connections:
+            srcBoxes.append(indices[id(connection.src.box)])
+            srcNodes.append(strings.intern(_getNodeName(connection.src)))
+            dstBoxes.append(indices[id(connection.dst.box)])
+            dstNodes.append(strings.intern(_getNodeName(connection.dst)))
+
+        return cls(relation.name, strings, names, kinds, groups, types,
+            vectors, srcBoxes, srcNodes, dstBoxes, dstNodes)
+
+    def toRelation(self, macros=None):
+        """
+        Recreates the relation as a :class:`.RelationDeclaration`.
+
+        :param macros: Optionally, maps relation names to the relation
+                       declarations used by macro boxes. Relations not found
+                       here are looked up in the default registry.
+
+        :raises: a :class:`.CompilationError` if a macro box's relation can
+                 not be found.
+        """
+        macros = macros or {}
+        get = self.strings.get
+        boxes = []
+        for i in range(self.boxCount):
+            name = get(self.boxNames[i])
+            kind = self.boxKinds[i]
+            boxType = get(self.boxTypes[i])
+            if kind == FUNCTION:
+                box = FunctionBoxDeclaration(name, get(self.boxGroups[i]),
+                    boxType)
+            elif kind == INPUT:
+                box = MacroInputBoxDeclaration(name, boxType)
+            elif kind == OUTPUT:
+                box = MacroOutputBoxDeclaration(name, boxType)
+            elif kind == MACRO:
+                relation = (macros.get(boxType) or
+                    defaultRegistry.findRelation(boxType))
+                if not relation:
+                    raise CompilationError(
+                        'Macro box "%s": No relation constraint named "%s" '
+                        'yet exists.' % (name, boxType))
+                box = MacroBoxDeclaration(name, relation)
+            else:
+                vectors = get(self.boxVectors[i])
+                vectorNodes = vectors.split(', ') if vectors else None
+                cls = SenderBoxDeclaration if kind == SENDER else \
+                    ReceiverBoxDeclaration
+                box = cls(name, boxType, vectorNodes)
+            boxes.append(box)
+
+        connections = []
+        for i in range(self.connectionCount):
+            src = boxes[self.srcBoxes[i]].createNodeDeclaration(
+                get(self.srcNodes[i]), True)
+            dst = boxes[self.dstBoxes[i]].createNodeDeclaration(
+                get(self.dstNodes[i]), False)
+            connections.append(ConnectionDeclaration(src, dst))
+        return RelationDeclaration(self.name, boxes, connections)
+
+    def findBox(self, name):
+        """
+        Returns the index of the box with the given name, or -1 if there's no
+        such box.
+        """
+        nameId = self.strings.find(name)
+        for i in range(self.boxCount):
+            if self.boxNames[i] == nameId:
+                return i
+        return -1
+
+    def getDownstreamBoxes(self, box):
+        """
+        Returns a sequence of the indices of the boxes that the given box's
+        outputs are connected to, once per connection.
+        """
+        return _gather(self.outOffsets, self.outConnections, self.dstBoxes,
+            [box])
+
+    def getUpstreamBoxes(self, box):
+        """
+        Returns a sequence of the indices of the boxes connected to the given
+        box's inputs, once per connection.
+        """
+        return _gather(self.inOffsets, self.inConnections, self.srcBoxes,
+            [box])
+
+    def findReachable(self, boxes, downstream=True):
+        """
+        Finds every box that can be reached from the given boxes by following
+        connections, visiting a whole frontier of boxes in each step.
+
+        :param boxes:      A sequence of box indices to start from.
+        :param downstream: If True, connections are followed from their
+                           sources to their destinations; otherwise, from
+                           their destinations to their sources.
+
+        :returns: a sorted list of the indices of the reachable boxes,
+                  including the given boxes.
+        """
+        if downstream:
+            offsets, order, ends = (self.outOffsets, self.outConnections,
+                self.dstBoxes)
+        else:
+            offsets, order, ends = (self.inOffsets, self.inConnections,
+                self.srcBoxes)
+
+        count = self.boxCount
+        visited = numpy.zeros(count, dtype=bool) if numpy is not None else \
+            bytearray(count)
+        frontier = sorted(set(boxes))
+        for box in frontier:
+            visited[box] = 1
+        while len(frontier):
+            if _isVectorized(frontier):
+                targets = _gather(offsets, order, ends, frontier)
+                frontier = numpy.unique(targets[~visited[targets]])
+                visited[frontier] = True
+            else:
+                targets = []
+                for box in _gather(offsets, order, ends, frontier):
+                    if not visited[box]:
+                        visited[box] = 1
+                        targets.append(box)
+                frontier = targets
+        if numpy is not None:
+            return numpy.nonzero(visited)[0].tolist()
+        return [i for i in range(count) if visited[i]]
+
+    def getTopologicalOrder(self):
+        """
+        Returns the indices of the relation's boxes in an order in which
+        every box follows the boxes that it receives input from. Boxes are
+        ordered by depth (see :meth:`getDepths`), then by index.
+
+        :raises: an :class:`.EvaluationError` if the connections form a cycle.
+        """
+        order, _ = self._getLevels()
+        return order
+
+    def getDepths(self):
+        """
+        Returns the depth of each box: 1 for a box with no connected inputs,
+        and otherwise one more than the greatest depth of the boxes connected
+        to its inputs.
+
+        :raises: an :class:`.EvaluationError` if the connections form a cycle.
+        """
+        _, depths = self._getLevels()
+        return depths
+
+    def _getLevels(self):
+        """
+        Sorts the boxes topologically with Kahn's algorithm, removing a whole
+        frontier of boxes whose inputs are all ready at each step.
+
+        :returns: a (order, depths) pair of lists.
+        :raises:  an :class:`.EvaluationError` if the connections form a
+                  cycle.
+        """
+        count = self.boxCount
+        if numpy is not None:
+            pending = numpy.bincount(self.dstBoxes, minlength=count)
+            depths = numpy.zeros(count, dtype=numpy.int32)
+            frontier = numpy.nonzero(pending == 0)[0]
+        else:
+            pending = [0] * count
+            for box in self.dstBoxes:
+                pending[box] += 1
+            depths = [0] * count
+            frontier = [i for i in range(count) if not pending[i]]
+
+        order = []
+        level = 1
+        while len(frontier):
+            if _isVectorized(frontier):
+                frontier = numpy.asarray(frontier, dtype=numpy.int32)
+                depths[frontier] = level
+                order.extend(frontier.tolist())
+                targets = _gather(self.outOffsets, self.outConnections,
+                    self.dstBoxes, frontier)
+                numpy.subtract.at(pending, targets, 1)
+                frontier = numpy.unique(targets[pending[targets] == 0])
+            else:
+                targets = set()
+                for box in frontier:
+                    depths[box] = level
+                for box in _gather(self.outOffsets, self.outConnections,
+                        self.dstBoxes, frontier):
+                    pending[box] -= 1
+                    if not pending[box]:
+                        targets.add(box)
+                order.extend(int(box) for box in frontier)
+                frontier = sorted(targets)
+            level += 1
+        if numpy is not None:
+            depths = depths.tolist()
+
+        if len(order) < count:
+            raise EvaluationError(
+                'Relation "%s" can not be evaluated, because its connections '
+                'form a cycle.' % self.name)
+        return order, depths
+
+class ColumnarProgram(object):
+    """
+    Holds the relations of a program in columnar form, sharing a single
+    :class:`StringTable` among them.
+    """
+
+    def __init__(self, relations, strings, modules=None, aliases=None):
+        """
+        Initializes a program from a list of :class:`ColumnarRelation`
+        objects, in program order. The modules and aliases are carried over
+        from the program declaration unchanged.
+        """
+        self.relations = relations
+        self.strings = strings
+        self.modules = modules or []
+        self.aliases = aliases or {}
+
+    @classmethod
+    def fromProgram(cls, program):
+        """
+        Converts the given :class:`.ProgramDeclaration` to columnar form.
+        """
+        strings = StringTable()
+        relations = [ColumnarRelation.fromRelation(r, strings)
+            for r in program.relations]
+        return cls(relations, strings, program.modules, program.aliases)
+
+    def toProgram(self):
+        """
+        Recreates the program as a :class:`.ProgramDeclaration`, resolving
+        macro boxes to the relations recreated before them, or to the
+        relations of the program's imported modules. As in compilation, a
+        macro refers to the first relation with its name.
+        """
+        macros = {}
+        for module in self.modules:
+            for relation in module.program.relations:
+                macros.setdefault(relation.name, relation)
+        relations = []
+        for columnar in self.relations:
+            relation = columnar.toRelation(macros)
+            macros.setdefault(relation.name, relation)
+            relations.append(relation)
+        return ProgramDeclaration(relations, self.modules, self.aliases)
+
+def _column(typecode, values):
+    """
+    Returns a column holding the given integers: a NumPy array if NumPy is
+    available, or otherwise an array of the given type code.
+    """
+    if numpy is not None:
+        return numpy.asarray(values,
+            dtype=numpy.int8 if typecode == 'b' else numpy.int32)
+    return array(typecode, values)
+
+def _buildIndex(boxes, count):
+    """
+    Builds a CSR index of the rows of the given column, which holds a box
+    index for each connection.
+
+    :returns: an (offsets, rows) pair, in which the rows belonging to box `i`
+              are `rows[offsets[i]:offsets[i + 1]]`, in their original order.
+    """
+    if numpy is not None:
+        counts = numpy.bincount(boxes, minlength=count)
+        offsets = numpy.zeros(count + 1, dtype=numpy.int32)
+        numpy.cumsum(counts, out=offsets[1:])
+        rows = numpy.argsort(boxes, kind='stable').astype(numpy.int32)
+        return offsets, rows
+
+    # Without NumPy, place each row with a counting sort
+    offsets = array('i', [0] * (count + 1))
+    for box in boxes:
+        offsets[box + 1] += 1
+    for i in range(count):
+        offsets[i + 1] += offsets[i]
+    positions = array('i', offsets)
+    rows = array('i', [0] * len(boxes))
+    for row, box in enumerate(boxes):
+        rows[positions[box]] = row
+        positions[box] += 1
+    return offsets, rows
+
+def _gather(offsets, rows, ends, boxes):
+    """
+    Returns the boxes at the far end of every connection indexed in a CSR
+    index for any of the given boxes.
+
+    :param ends: The column holding the box at the far end of each
+                 connection.
+    """
+    if _isVectorized(boxes):
+        boxes = numpy.asarray(boxes, dtype=numpy.int32)
+        starts = offsets[boxes]
+        lengths = offsets[boxes + 1] - starts
+        total = int(lengths.sum())
+        if not total:
+            return numpy.zeros(0, dtype=numpy.int32)
+
+        # Expand each box's slice of the index into one position per row
+        shifts = numpy.repeat(starts - (numpy.cumsum(lengths) - lengths),
+            lengths)
+        return ends[rows[numpy.arange(total) + shifts]]
+
+    result = []
+    for box in boxes:
+        for i in range(offsets[box], offsets[box + 1]):
+            result.append(int(ends[rows[i]]))
+    return result
+
+def _isVectorized(boxes):
+    """
+    Returns whether a step of a graph analysis that visits the given boxes
+    should be vectorized. Small frontiers are visited one box at a time even
+    when NumPy is available, since each vectorized step has a fixed overhead
+    that would dominate a long, narrow chain of boxes.
+    """
+    return numpy is not None and len(boxes) >= VECTOR_THRESHOLD
+
+def _describeBox(box):
+    """
+    Returns the kind, group, type, and vectors attribute of the given box
+    declaration, as stored in the columns of a :class:`ColumnarRelation`.
+    """
+    if isinstance(box, MacroInputBoxDeclaration):
+        return INPUT, None, box.valueType, None
+    if isinstance(box, MacroOutputBoxDeclaration):
+        return OUTPUT, None, box.valueType, None
+    if isinstance(box, FunctionBoxDeclaration):
+        return FUNCTION, box.groupName, box.typeName, None
+    if isinstance(box, MacroBoxDeclaration):
+        return MACRO, None, box.relation.name, None
+    vectors = ', '.join(box.vectorNodes) or None
+    if isinstance(box, SenderBoxDeclaration):
+        return SENDER, None, box.componentName, vectors
+    return RECEIVER, None, box.componentName, vectors
+
+def _getNodeName(node):
+    """
+    Returns the name by which the given node declaration refers to its node,
+    or None for the single node of a macro input or output.
+    """
+    if isinstance(node, BoxNodeDeclaration):
+        return node.nodeName
+    if isinstance(node, MacroNodeDeclaration):
+        names = node.box.relation.getMacroToolNames(not node.isSrc)
+        return names[node.nodeIndex]
+    return None
@@ -7,4 +7,5 @@ from fbrelation.declarations.box.macrotool   import MacroInputBoxDeclaration, \
                                                     MacroOutputBoxDeclaration
 from fbrelation.declarations.box.macro       import MacroBoxDeclaration
 from fbrelation.declarations.box.placeholder import SenderBoxDeclaration, \
+                                                    ConstantSenderBoxDeclaration, \
                                                     ReceiverBoxDeclaration
@@ -17,6 +17,15 @@ class BoxDeclaration(object):
         """
         self.name = name
 
+    def __str__(self):
+        """
+        Converts the declaration back into the text of an equivalent box
+        declaration.
+        """
+        attributes = self.getAttributes()
+        return '%s [%s]' % (self.name, ', '.join(
+            ['%s="%s"' % (key, attributes[key]) for key in sorted(attributes)]))
+
     def execute(self, constraint, relationComponents):
         """
         Overridden by subclasses in order to create and configure a new box of
@@ -32,6 +41,56 @@ class BoxDeclaration(object):
         """
         raise NotImplementedError
 
+    def evaluate(self, inputValues, environment):
+        """
+        Overridden by subclasses in order to compute the box's output values
+        offline, without MotionBuilder.
+
+        :param inputValues: Maps the keys of the box's connected input nodes
+                            to their values.
+        :param environment: The :class:`.EvaluationEnvironment` for the
+                            relation being evaluated.
+
+        :returns: a dictionary which maps the keys of the box's output nodes
+                  to their values.
+        :raises:  an :class:`.EvaluationError` if the box can not be
+                  evaluated.
+        """
+        raise NotImplementedError
+
+    def generate(self, inputVariables, generator):
+        """
+        Overridden by subclasses in order to emit Python code which computes
+        the box's output values, as part of compiling a relation into a
+        function with the :mod:`.codegen` module.
+
+        :param inputVariables: Maps the keys of the box's connected input
+                               nodes to the names of the local variables
+                               that hold their values.
+        :param generator:      The code generator to emit code with.
+
+        :returns: a dictionary which maps the keys of the box's output nodes
+                  to the names of the local variables that hold their values.
+        :raises:  an :class:`.EvaluationError` if no code can be generated
+                  for the box.
+        """
+        raise NotImplementedError
+
+    def getSignature(self):
+        """
+        Overridden by subclasses in order to return a tuple which describes
+        what the box does, independently of its name. Boxes with equal
+        signatures behave identically.
+        """
+        raise NotImplementedError
+
+    def getAttributes(self):
+        """
+        Overridden by subclasses in order to return a dictionary of the
+        attributes with which the box would be declared in a program.
+        """
+        raise NotImplementedError
+
     def createNodeDeclaration(self, nodeName, isSrc):
         """
         Creates and returns a new :class:`.NodeDeclaration` object for a node
@@ -61,6 +120,17 @@ class BoxDeclaration(object):
         """
         return bool(nodeName)
 
+    def getNodeValueType(self, nodeName, isSrc):
+        """
+        Returns the value type (e.g., "Number" or "Vector") of the node of the
+        given name, as an output node if isSrc is True, or otherwise as an
+        input node.
+
+        :note: The default implementation returns None, indicating that the
+               type of the node is unknown.
+        """
+        return None
+
     def prepareNode(self, nodeName):
         """
         Signals to the box declaration that a connection is about to be made
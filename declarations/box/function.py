@@ -2,7 +2,9 @@
 Defines base classes for box declarations that represent function boxes.
 """
 
-from fbrelation.exceptions import ExecutionError
+from fbrelation.exceptions import ExecutionError, EvaluationError
+
+from fbrelation.catalog import findFunctionType
 
 from fbrelation.declarations.box.base import BoxDeclaration
 
@@ -37,3 +39,53 @@ class FunctionBoxDeclaration(BoxDeclaration):
                 'Could not create a "%s" function box from the group "%s".' %
                 (self.typeName, self.groupName))
         return box
+
+    def evaluate(self, inputValues, environment):
+        """
+        Evaluates the box using the implementation registered for its group
+        and type name in the :mod:`.catalog`.
+
+        :raises: an :class:`.EvaluationError` if the box type is unknown.
+        """
+        functionType = findFunctionType(self.groupName, self.typeName)
+        if not functionType:
+            raise EvaluationError(
+                'No implementation is known for the "%s" function box from '
+                'the group "%s".' % (self.typeName, self.groupName))
+        return functionType.evaluate(inputValues)
+
+    def generate(self, inputVariables, generator):
+        """
+        Generates code for the box using the implementation registered for
+        its group and type name in the :mod:`.catalog`.
+
+        :raises: an :class:`.EvaluationError` if the box type is unknown.
+        """
+        functionType = findFunctionType(self.groupName, self.typeName)
+        if not functionType:
+            raise EvaluationError(
+                'No implementation is known for the "%s" function box from '
+                'the group "%s".' % (self.typeName, self.groupName))
+        return generator.emitFunction(functionType, inputVariables)
+
+    def getSignature(self):
+        """
+        Returns a signature identifying the box's group and type.
+        """
+        return ('function', self.groupName, self.typeName)
+
+    def getNodeValueType(self, nodeName, isSrc):
+        """
+        Overridden to look up the type of the node in the :mod:`.catalog`,
+        if the box type is known.
+        """
+        functionType = findFunctionType(self.groupName, self.typeName)
+        if not functionType:
+            return None
+        return functionType.getNodeValueType(nodeName, not isSrc)
+
+    def getAttributes(self):
+        """
+        Returns the box's group and type name as attributes.
+        """
+        return {'group': self.groupName, 'type': self.typeName}
@@ -5,6 +5,8 @@ relation constraints used as boxes).
 
 from fbrelation.exceptions import ExecutionError
 
+from fbrelation.registry import defaultRegistry
+
 from fbrelation.declarations.box.base import BoxDeclaration
 from fbrelation.declarations.node import MacroNodeDeclaration
 
@@ -30,11 +32,16 @@ class MacroBoxDeclaration(BoxDeclaration):
         :param relationComponents: Used to look up the exact name of the
                                    FBConstraintRelation that was created from
                                    the relation declaration, as the name may
-                                   have been changed on creation.
+                                   have been changed on creation. Relations
+                                   that were found in the :mod:`.registry`
+                                   rather than declared by the program are
+                                   looked up there instead.
         """
-        # Get the constraint from the collection of already-created relations
-        assert self.relation.name in relationComponents
-        macroConstraint = relationComponents[self.relation.name]
+        # Get the constraint from the collection of already-created relations,
+        # or from the registry (creating it if necessary)
+        macroConstraint = relationComponents.get(self.relation.name)
+        if macroConstraint is None:
+            macroConstraint = defaultRegistry.getConstraint(self.relation)
 
         # Create a macro box using that constraint
         box = constraint.CreateFunctionBox('My Macros',
@@ -44,6 +51,65 @@ class MacroBoxDeclaration(BoxDeclaration):
         # Return the newly created box
         return box
 
+    def evaluate(self, inputValues, environment):
+        """
+        Evaluates the box by evaluating the associated relation declaration,
+        passing in the values of this box's inputs as the relation's macro
+        inputs.
+
+        :returns: a dictionary mapping the index of each of the box's output
+                  nodes to its value.
+        """
+        # Macro box inputs are keyed by offset, whereas the relation expects
+        # its arguments to be keyed by the names of its macro input boxes
+        arguments = {}
+        for index, name in enumerate(self.relation.getMacroToolNames(True)):
+            if index in inputValues:
+                arguments[name] = inputValues[index]
+
+        # Evaluate the relation and key its outputs by offset in turn
+        outputs = self.relation.evaluate(environment.senders, arguments).outputs
+        return dict(enumerate(
+            [outputs[name] for name in self.relation.getMacroToolNames(False)]))
+
+    def generate(self, inputVariables, generator):
+        """
+        Generates code for the box by inlining the code for the associated
+        relation, binding its macro inputs to the variables connected to this
+        box's inputs.
+        """
+        arguments = {}
+        for index, name in enumerate(self.relation.getMacroToolNames(True)):
+            if index in inputVariables:
+                arguments[name] = inputVariables[index]
+
+        outputs = generator.inline(self.relation, arguments)
+        return dict(enumerate(
+            [outputs[name] for name in self.relation.getMacroToolNames(False)]))
+
+    def getSignature(self):
+        """
+        Returns a signature identifying the structure of the relation that's
+        used as a macro.
+        """
+        return ('macro', self.relation.getStructuralHash())
+
+    def getAttributes(self):
+        """
+        Returns the name of the relation used as a macro as an attribute.
+        """
+        return {'macro': self.relation.name}
+
+    def getNodeValueType(self, nodeName, isSrc):
+        """
+        Overridden to return the type of the corresponding macro input or
+        output in the associated relation.
+        """
+        for box in self.relation.boxes:
+            if box.name == nodeName and box.isMacroTool(not isSrc):
+                return box.valueType
+        return None
+
     def createNodeDeclaration(self, nodeName, isSrc):
         """
         Overridden to create instances of :class:`.MacroNodeDeclaration` for
@@ -3,6 +3,8 @@ Defines classes for macro tools, special forms of function boxes that allow
 the relation constraints in which they're included to be used as a macros.
 """
 
+from fbrelation.catalog import DEFAULT_VALUES
+
 from fbrelation.declarations.box.function import FunctionBoxDeclaration
 from fbrelation.declarations.node import MacroToolNodeDeclaration
 
@@ -27,6 +29,12 @@ class MacroToolBoxDeclaration(FunctionBoxDeclaration):
         """
         return not nodeName
 
+    def getNodeValueType(self, nodeName, isSrc):
+        """
+        Overridden to return the type of the macro tool.
+        """
+        return self.valueType
+
     def isMacroTool(self, isInput):
         """
         Overridden to be pure virtual, since for a generalized macro tool the
@@ -52,6 +60,7 @@ class MacroInputBoxDeclaration(MacroToolBoxDeclaration):
             name,
             'Macro Tools',
             'Macro Input %s' % inputType)
+        self.valueType = inputType
 
     def isMacroTool(self, isInput):
         """
@@ -59,6 +68,37 @@ class MacroInputBoxDeclaration(MacroToolBoxDeclaration):
         """
         return isInput
 
+    def evaluate(self, inputValues, environment):
+        """
+        Overridden to output the value passed into the relation for this
+        macro input, or the default value for its type if none was given.
+        """
+        value = environment.arguments.get(self.name)
+        if value is None:
+            value = DEFAULT_VALUES.get(self.valueType)
+        return {None: value}
+
+    def generate(self, inputVariables, generator):
+        """
+        Overridden to output the variable which holds the value passed into
+        the relation for this macro input.
+        """
+        return {None: generator.getArgument(self.name,
+            DEFAULT_VALUES.get(self.valueType))}
+
+    def getSignature(self):
+        """
+        Overridden to identify the macro input by name and type, since the
+        names of macro inputs form part of a relation's interface.
+        """
+        return ('input', self.name, self.valueType)
+
+    def getAttributes(self):
+        """
+        Overridden to declare the box as a macro input of its type.
+        """
+        return {'input': self.valueType}
+
 class MacroOutputBoxDeclaration(MacroToolBoxDeclaration):
     """
     Defines the declaration of a macro output box, which has a single input
@@ -77,9 +117,43 @@ class MacroOutputBoxDeclaration(MacroToolBoxDeclaration):
             name,
             'Macro Tools',
             'Macro Output %s' % outputType)
+        self.valueType = outputType
 
     def isMacroTool(self, isInput):
         """
         Overridden to indicate that this box is an output macro tool.
         """
         return not isInput
+
+    def evaluate(self, inputValues, environment):
+        """
+        Overridden to record the value received by this macro output as one of
+        the relation's outputs.
+        """
+        value = inputValues.get(None)
+        if value is None:
+            value = DEFAULT_VALUES.get(self.valueType)
+        environment.outputs[self.name] = value
+        return {}
+
+    def generate(self, inputVariables, generator):
+        """
+        Overridden to record the variable received by this macro output as
+        one of the relation's outputs.
+        """
+        generator.setOutput(self.name, inputVariables.get(None,
+            repr(DEFAULT_VALUES.get(self.valueType))))
+        return {}
+
+    def getSignature(self):
+        """
+        Overridden to identify the macro output by name and type, since the
+        names of macro outputs form part of a relation's interface.
+        """
+        return ('output', self.name, self.valueType)
+
+    def getAttributes(self):
+        """
+        Overridden to declare the box as a macro output of its type.
+        """
+        return {'output': self.valueType}
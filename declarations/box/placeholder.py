@@ -4,10 +4,14 @@ in order to send data to or receive data from the relation constraint in which
 they're included.
 """
 
-import pyfbsdk
+import copy
+
+from fbrelation.backend import sdk
 
 from fbrelation.exceptions import ExecutionError
 
+from fbrelation.catalog import VECTOR_PROPERTIES
+
 from fbrelation.declarations.box.base import BoxDeclaration
 
 class PlaceholderBoxDeclaration(BoxDeclaration):
@@ -36,7 +40,7 @@ class PlaceholderBoxDeclaration(BoxDeclaration):
         kLocal = 2
         """ Indicates that local transformations are to be used. """
 
-    def __init__(self, name, componentName):
+    def __init__(self, name, componentName, vectorNodes=None):
         """
         Initializes a new placeholder box declaration with the given component
         name.
@@ -45,10 +49,29 @@ class PlaceholderBoxDeclaration(BoxDeclaration):
                               `group::namespace:name`. If no group name is
                               specified, the name is assumed to refer to a
                               model.
+        :param vectorNodes:   Optionally, a list of the names of properties
+                              that hold vectors, besides those known to the
+                              :mod:`.catalog`.
         """
         super(PlaceholderBoxDeclaration, self).__init__(name)
         self.componentName = componentName
+        self.vectorNodes = vectorNodes or []
         self.transformation = self.TransformationType.kNone
+        self.component = None
+        """
+        Optionally, the scene component resolved ahead of time. If None, the
+        component is found by name whenever it's needed.
+        """
+
+    def bind(self, componentName, component=None):
+        """
+        Returns a copy of the declaration which stands in for a different
+        component, optionally resolved ahead of time.
+        """
+        box = copy.copy(self)
+        box.componentName = componentName
+        box.component = component
+        return box
 
     def supportsNode(self, nodeName):
         """
@@ -88,6 +111,24 @@ class PlaceholderBoxDeclaration(BoxDeclaration):
             self.transformation = self.TransformationType.kLocal
         return True
 
+    def getNodeValueType(self, nodeName, isSrc):
+        """
+        Overridden to identify the properties that hold vectors. The types of
+        other properties are unknown.
+        """
+        if nodeName in VECTOR_PROPERTIES or nodeName in self.vectorNodes:
+            return 'Vector'
+        return None
+
+    def getAttributes(self):
+        """
+        Returns the names of any properties declared as vectors as an
+        attribute. Subclasses add the name of the associated component.
+        """
+        if self.vectorNodes:
+            return {'vectors': ', '.join(self.vectorNodes)}
+        return {}
+
     def prepareNode(self, nodeName):
         """
         Overridden to ensure that the node with the given name exists if it
@@ -113,11 +154,12 @@ class PlaceholderBoxDeclaration(BoxDeclaration):
         :raises:  an :class:`.ExecutionError` if the component could not be
                   found.
         """
-        # Attempt to find the component in the scene by name
-        if '::' in self.componentName:
-            component = pyfbsdk.FBFindObjectByFullName(self.componentName)
-        else:
-            component = pyfbsdk.FBFindModelByLabelName(self.componentName)
+        # Use the component resolved ahead of time, if any
+        if self.component is not None:
+            return self.component
+
+        # Otherwise, attempt to find the component in the scene by name
+        component = findComponent(self.componentName)
 
         # Raise a runtime error if no component exists by the given name
         if not component:
@@ -128,6 +170,22 @@ class PlaceholderBoxDeclaration(BoxDeclaration):
         # Return the component if found
         return component
 
+    def _findProperty(self, nodeName):
+        """
+        Attempts to find the property of the associated scene component that
+        corresponds to the node with the given name.
+
+        :returns: the requested FBProperty.
+        :raises:  an :class:`.ExecutionError` if the component or the property
+                  could not be found.
+        """
+        prop = self._findComponent().PropertyList.Find(nodeName)
+        if not prop:
+            raise ExecutionError(
+                'The component "%s" has no property named "%s".' %
+                (self.componentName, nodeName))
+        return prop
+
     def _setTransformation(self, boxComponent):
         """
         Helper function used by subclasses to set the FBBox to the appropriate
@@ -175,6 +233,151 @@ class SenderBoxDeclaration(PlaceholderBoxDeclaration):
         self._setTransformation(box)
         return box
 
+    def evaluate(self, inputValues, environment):
+        """
+        Overridden to output the values sampled from the associated component,
+        as given in the environment's sender values.
+        """
+        return environment.senders.get(self.componentName, {})
+
+    def generate(self, inputVariables, generator):
+        """
+        Overridden to output variables that are passed into the generated
+        function, one for each node sent from the associated component.
+        """
+        return generator.getSenderVariables(self.componentName)
+
+    def getSignature(self):
+        """
+        Returns a signature identifying the box as a sender for the
+        associated component.
+        """
+        return ('sender', self.componentName)
+
+    def getAttributes(self):
+        """
+        Returns the name of the associated component as an attribute.
+        """
+        attributes = super(SenderBoxDeclaration, self).getAttributes()
+        attributes['sender'] = self.componentName
+        return attributes
+
+    def sample(self, nodeName, firstFrame, lastFrame):
+        """
+        Reads the values of the named property of the associated component
+        over the given (inclusive) range of frames, evaluating its animation
+        curves if it's animated.
+
+        :returns: a list of values, one per frame, as floats for numbers or
+                  tuples of floats for vectors.
+        :raises:  an :class:`.ExecutionError` if the component or property
+                  does not exist.
+        """
+        prop = self._findProperty(nodeName)
+        frames = range(firstFrame, lastFrame + 1)
+
+        # Evaluate the property's curves at each frame, if it has any
+        animationNode = prop.GetAnimationNode()
+        if animationNode:
+            times = [sdk.FBTime(0, 0, 0, frame) for frame in frames]
+            if animationNode.FCurve:
+                return [float(animationNode.FCurve.Evaluate(t)) for t in times]
+            if len(animationNode.Nodes):
+                curves = [n.FCurve for n in animationNode.Nodes]
+                return [tuple(float(c.Evaluate(t)) for c in curves)
+                    for t in times]
+
+        # Properties without animation curves hold the same value throughout
+        try:
+            value = tuple(float(x) for x in prop.Data)
+        except TypeError:
+            value = float(prop.Data)
+        return [value for frame in frames]
+
+class ConstantSenderBoxDeclaration(SenderBoxDeclaration):
+    """
+    Defines a sender box whose nodes send constant values. Since the
+    MotionBuilder API offers no way to plug constants into a box's input
+    nodes, the values are held as custom properties of a scene component,
+    which is created along with the properties when the box is executed.
+    """
+
+    def __init__(self, name, componentName, values):
+        """
+        Initializes a new constant sender for the given component.
+
+        :param values: Maps the names of the custom properties to send to
+                       their values, as floats for numbers or tuples of
+                       floats for vectors.
+        """
+        super(ConstantSenderBoxDeclaration, self).__init__(name,
+            componentName, sorted(n for n, v in values.items()
+                if isinstance(v, tuple)))
+        self.values = values
+
+    def getSignature(self):
+        """
+        Overridden to identify the box by its values as well as its
+        component, since :meth:`generate` emits the values as literals.
+        """
+        return ('sender', self.componentName,
+            tuple(sorted(self.values.items())))
+
+    def execute(self, constraint, relationComponents):
+        """
+        Overridden to create the associated component (as a null) if it
+        doesn't already exist, and to create and set each of its custom
+        properties, before adding it to the constraint as a sender.
+
+        :returns: the newly created sender box.
+        :raises:  an :class:`.ExecutionError` if a property could not be
+                  created or the sender box could not be added.
+        """
+        component = self.component or findComponent(self.componentName)
+        if not component:
+            component = sdk.FBModelNull(self.componentName)
+
+        for nodeName, value in sorted(self.values.items()):
+            prop = component.PropertyList.Find(nodeName)
+            if not prop:
+                if isinstance(value, tuple):
+                    prop = component.PropertyCreate(nodeName,
+                        sdk.FBPropertyType.kFBPT_Vector3D, 'Vector', True,
+                        True, None)
+                else:
+                    prop = component.PropertyCreate(nodeName,
+                        sdk.FBPropertyType.kFBPT_double, 'Number', True,
+                        True, None)
+            if not prop:
+                raise ExecutionError(
+                    'Could not create a property named "%s" on the '
+                    'component "%s".' % (nodeName, self.componentName))
+            prop.Data = (sdk.FBVector3d(*value) if isinstance(value, tuple)
+                else value)
+
+        box = constraint.SetAsSource(component)
+        if not box:
+            raise ExecutionError(
+                'Could not create a sender box for the component "%s".' %
+                component.LongName)
+        return box
+
+    def evaluate(self, inputValues, environment):
+        """
+        Overridden to output the constant values, along with any values
+        given in the environment for other properties of the component.
+        """
+        values = dict(environment.senders.get(self.componentName, {}))
+        values.update(self.values)
+        return values
+
+    def generate(self, inputVariables, generator):
+        """
+        Overridden to output the constant values as literals.
+        """
+        return dict((nodeName, repr(value))
+            for nodeName, value in self.values.items())
+
 class ReceiverBoxDeclaration(PlaceholderBoxDeclaration):
     """
     Defines a type of placeholder box which constrains a scene object as a
@@ -202,3 +405,120 @@ class ReceiverBoxDeclaration(PlaceholderBoxDeclaration):
         # newly created box
         self._setTransformation(box)
         return box
+
+    def evaluate(self, inputValues, environment):
+        """
+        Overridden to record the values received by the associated component
+        in the environment.
+        """
+        environment.receivers.setdefault(
+            self.componentName, {}).update(inputValues)
+        return {}
+
+    def generate(self, inputVariables, generator):
+        """
+        Overridden to record the variables received by the associated
+        component as results of the generated function.
+        """
+        generator.setReceiver(self.componentName, inputVariables)
+        return {}
+
+    def getSignature(self):
+        """
+        Returns a signature identifying the box as a receiver for the
+        associated component.
+        """
+        return ('receiver', self.componentName)
+
+    def getAttributes(self):
+        """
+        Returns the name of the associated component as an attribute.
+        """
+        attributes = super(ReceiverBoxDeclaration, self).getAttributes()
+        attributes['receiver'] = self.componentName
+        return attributes
+
+    def applyKeys(self, nodeName, firstFrame, columns):
+        """
+        Replaces the animation of the named property of the associated
+        component with keyframes holding precomputed values, one per frame.
+
+        :param columns: A list of sequences of values, one per frame starting
+                        at firstFrame. Numeric properties take a single
+                        column; vector properties take one per axis.
+
+        :raises: an :class:`.ExecutionError` if the component or property
+                 does not exist, or if the property can not be animated.
+        """
+        prop = self._findProperty(nodeName)
+        if not prop.IsAnimatable():
+            raise ExecutionError(
+                'The property "%s" of the component "%s" can not be '
+                'animated.' % (nodeName, self.componentName))
+        prop.SetAnimated(True)
+
+        # Numeric properties have a single curve; vectors have one per axis
+        animationNode = prop.GetAnimationNode()
+        if len(columns) == 1 and animationNode.FCurve:
+            curves = [animationNode.FCurve]
+        else:
+            curves = [n.FCurve for n in animationNode.Nodes]
+
+        # Replace any existing keys with the precomputed values
+        for curve, values in zip(curves, columns):
+            curve.EditBegin()
+            curve.EditClear()
+            for offset, value in enumerate(values):
+                curve.KeyAdd(sdk.FBTime(0, 0, 0, firstFrame + offset), value)
+            curve.EditEnd()
+
+def findComponent(componentName):
+    """
+    Finds the scene component with the given name. The name is assumed to be a
+    full name (group::namespace:name) if a group name is specified. Otherwise,
+    it's taken as the long name of a model.
+
+    :returns: the component, or None if it doesn't exist.
+    """
+    if '::' in componentName:
+        return sdk.FBFindObjectByFullName(componentName)
+    return sdk.FBFindModelByLabelName(componentName)
+
+def findComponents(componentNames):
+    """
+    Finds the scene components with each of the given names. Models are found
+    in a single pass over the scene's model hierarchy, rather than by
+    searching the scene once for each name, while components identified by
+    full name are looked up individually.
+
+    :returns: a dictionary which maps each name to its component, omitting
+              any components that don't exist.
+    """
+    remaining = set(componentNames)
+    components = {}
+
+    # Walk the model hierarchy once, collecting models with matching names
+    models = [sdk.FBSystem().Scene.RootModel]
+    while models and remaining:
+        model = models.pop()
+        if model.LongName in remaining:
+            components[model.LongName] = model
+            remaining.discard(model.LongName)
+        models.extend(model.Children)
+
+    # Look up the rest individually, in case they aren't models
+    for componentName in remaining:
+        component = findComponent(componentName)
+        if component:
+            components[componentName] = component
+    return components
+
+def getNamespacedName(componentName, namespace):
+    """
+    Returns the name of the given component within the given namespace, which
+    is prepended to the component's name (after the group name, if any).
+    """
+    if not namespace:
+        return componentName
+    groupName, separator, name = componentName.rpartition('::')
+    return '%s%s%s:%s' % (groupName, separator, namespace, name)
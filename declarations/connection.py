@@ -2,7 +2,7 @@
 Defines declaration classes for connections between nodes.
 """
 
-import pyfbsdk
+from fbrelation.backend import sdk
 
 class ConnectionDeclaration(object):
     """
@@ -17,6 +17,13 @@ class ConnectionDeclaration(object):
         self.src = srcNodeDeclaration
         self.dst = dstNodeDeclaration
 
+    def __str__(self):
+        """
+        Converts the declaration back into the text of an equivalent
+        connection declaration.
+        """
+        return '%s -> %s' % (str(self.src), str(self.dst))
+
     def execute(self, boxComponents):
         """
         Executes the connection, causing a connection to be made between the
@@ -40,4 +47,4 @@ class ConnectionDeclaration(object):
         dstNode = self.dst.execute(dstBoxComponent)
 
         # Connect the two nodes in order to execute the connection
-        pyfbsdk.FBConnect(srcNode, dstNode)
+        sdk.FBConnect(srcNode, dstNode)
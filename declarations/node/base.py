@@ -4,6 +4,8 @@ Defines base classes for node declarations.
 
 from fbrelation.utility import find
 
+from fbrelation.exceptions import EvaluationError
+
 class NodeDeclaration(object):
     """
     Abstract base class for a node declaration, which refers to some animation
@@ -32,6 +34,30 @@ class NodeDeclaration(object):
         """
         raise NotImplementedError
 
+    @property
+    def key(self):
+        """
+        Overridden by subclasses to return the value that identifies this node
+        among the input or output values of its box during offline evaluation.
+        """
+        raise NotImplementedError
+
+    def evaluate(self, boxValues):
+        """
+        Resolves the value of this node from the dictionary of output values
+        computed for its box during offline evaluation.
+
+        :returns: the value of the node.
+        :raises:  an :class:`.EvaluationError` if the box produced no value
+                  for this node.
+        """
+        try:
+            return boxValues[self.key]
+        except KeyError:
+            raise EvaluationError(
+                'No value is available for the node "%s" of the box named '
+                '"%s".' % (self.key, self.box.name))
+
     def _getParentNode(self, boxComponent):
         """
         Helper function that returns the parent animation node on either side
@@ -19,6 +19,13 @@ class BoxNodeDeclaration(NodeDeclaration):
         super(BoxNodeDeclaration, self).__init__(boxDeclaration, isSrc)
         self.nodeName = nodeName
 
+    def __str__(self):
+        """
+        Converts the declaration back into the text of an equivalent node
+        declaration.
+        """
+        return '%s.%s' % (self.box.name, self.nodeName)
+
     def execute(self, boxComponent):
         """
         Overridden to find the associated node by name within the given FBBox
@@ -34,3 +41,10 @@ class BoxNodeDeclaration(NodeDeclaration):
                 'Could not find a node named "%s" in the box named "%s".' %
                 (self.nodeName, self.box.name))
         return nodeComponent
+
+    @property
+    def key(self):
+        """
+        Overridden to identify the node by name during offline evaluation.
+        """
+        return self.nodeName
@@ -24,6 +24,14 @@ class MacroNodeDeclaration(NodeDeclaration):
         super(MacroNodeDeclaration, self).__init__(boxDeclaration, isSrc)
         self.nodeIndex = nodeIndex
 
+    def __str__(self):
+        """
+        Converts the declaration back into the text of an equivalent node
+        declaration, naming the macro tool at the node's offset.
+        """
+        names = self.box.relation.getMacroToolNames(not self.isSrc)
+        return '%s.%s' % (self.box.name, names[self.nodeIndex])
+
     def execute(self, boxComponent):
         """
         Overridden to search the given FBBox object for an input or output
@@ -40,3 +48,11 @@ class MacroNodeDeclaration(NodeDeclaration):
                     'output' if self.isSrc else 'input',
                     self.nodeIndex))
         return nodeComponent
+
+    @property
+    def key(self):
+        """
+        Overridden to identify the node by its offset among the macro box's
+        inputs or outputs during offline evaluation.
+        """
+        return self.nodeIndex
@@ -12,6 +12,13 @@ class MacroToolNodeDeclaration(NodeDeclaration):
     index in order to resolve that node from the associated FBBox.
     """
 
+    def __str__(self):
+        """
+        Converts the declaration back into the text of an equivalent node
+        declaration, which is simply the name of the macro tool box.
+        """
+        return self.box.name
+
     def execute(self, boxComponent):
         """
         Overridden to simply use the first and only animation node on the
@@ -24,3 +31,11 @@ class MacroToolNodeDeclaration(NodeDeclaration):
                 'Macro tool boxes must have exactly one input or output node.')
         
         return node
+
+    @property
+    def key(self):
+        """
+        Overridden to return None, since a macro tool's single node has no
+        name.
+        """
+        return None
@@ -2,32 +2,133 @@
 Defines declaration classes for entire programs.
 """
 
+import hashlib
+
+from fbrelation.exceptions import CompilationError
+
+from fbrelation.profiling import NULL_PROFILE
+
+from fbrelation.registry import defaultRegistry
+
+from fbrelation.declarations.box import MacroBoxDeclaration
+from fbrelation.declarations.box.placeholder import \
+    PlaceholderBoxDeclaration, findComponents, getNamespacedName
+
 class ProgramDeclaration(object):
     """
     Defines a program declaration, which consists of a series of individual
-    relation constraint declarations.
+    relation constraint declarations, along with any modules it imports.
     """
 
-    def __init__(self, relationDeclarations):
+    def __init__(self, relationDeclarations, modules=None, aliases=None):
         """
         Initializes a new program from the provided list of relation
         constraint declaration objects.
+
+        :param modules: Optionally, a list of the :class:`.Module` objects
+                        whose relations are used as macros by the program.
+        :param aliases: Optionally, a dictionary which maps the names of
+                        relation declarations to lists of the names under
+                        which their constraints are returned when the
+                        program is executed. Relations that aren't in the
+                        dictionary are returned under their own names. Used
+                        by :mod:`.partitioning` to return constraints under
+                        the names of the relations originally declared.
         """
         self.relations = relationDeclarations
+        self.modules = modules or []
+        self.aliases = aliases or {}
 
-    def execute(self):
+    def getProgramId(self):
+        """
+        Returns an id for the program derived from the name and structural
+        hash of each of its relations (see
+        :meth:`.RelationDeclaration.getStructuralHash`), so that the same
+        program compiled again is given the same id. Used to tag the
+        constraints the program creates (see :mod:`.tagging`).
+        """
+        structure = [(r.name, r.getStructuralHash()) for r in self.relations]
+        return hashlib.sha1(repr(structure).encode('utf-8')).hexdigest()
+
+    def execute(self, profile=None, namespaces=None, programId=None):
         """
         Executes the program, creating and configuring an FBConstraintRelation
-        for each relation declaration in the program.
+        for each relation declaration in the program. Relations which serve
+        only as macros reuse the constraints of structurally identical
+        relations in the :mod:`.registry`, if any still exist, rather than
+        creating new ones.
+
+        :param profile:    Optionally, a :class:`.Profile` in which to record
+                           the time spent executing each relation and box.
+        :param namespaces: Optionally, a list of namespaces in which to
+                           execute the program once each. See
+                           :meth:`executeInNamespaces`.
+        :param programId:  The id with which to tag each constraint created
+                           (see :mod:`.tagging`), or the program's own id (see
+                           :meth:`getProgramId`) if None.
 
         :returns: a dictionary which maps the names of the relation
-                  declarations to their corresponding constraint objects.
+                  declarations to their corresponding constraint objects, or
+                  if namespaces are given, a dictionary which maps each
+                  namespace to such a dictionary. The constraints of imported
+                  modules are not included.
         :raises:  an :class:`.ExecutionError` if any problems are encountered
                   at runtime.
         """
+        if namespaces is not None:
+            return self.executeInNamespaces(namespaces, profile, programId)
+        constraints = {}
+        for _ in self.iterExecute(constraints, profile, programId):
+            pass
+        return constraints
+
+    def iterExecute(self, constraints, profile=None, programId=None):
+        """
+        Executes the program one step at a time, as a generator, so that a
+        large program can be executed a little at a time without blocking
+        (see :mod:`.scheduling`). Each box and each connection is executed
+        in its own step, as is the creation of each relation's constraint;
+        each imported module, and each relation shared through the
+        :mod:`.registry`, is executed in a single step.
+
+        If the generator is closed before it's exhausted, the constraint of
+        the relation being executed is deleted, while the constraints of the
+        relations already executed are left complete and active.
+
+        :param constraints: A dictionary to which the name and constraint of
+                            each relation declaration are added as it's
+                            completed. The constraints of imported modules
+                            are not included.
+        :param profile:     Optionally, a :class:`.Profile` in which to record
+                            the time spent executing each relation and box.
+        :param programId:   The id with which to tag each constraint created,
+                            or the program's own id if None.
+
+        :returns: an iterator which yields a (completed, total) pair of step
+                  counts after each step.
+        :raises:  an :class:`.ExecutionError` if any problems are encountered
+                  at runtime.
+        """
+        profile = profile or NULL_PROFILE
+        if programId is None:
+            programId = self.getProgramId()
+        shared = self._findSharedRelations()
+        total = len(self.modules) + sum(
+            1 if id(r) in shared else r.countExecutionSteps()
+            for r in self.relations)
+        completed = 0
+
         # Collect a dictionary of name -> FBConstraintRelation mappings as
-        # each relation is executed
+        # each relation is executed, starting with the imported relations
         relationComponents = {}
+        for module in self.modules:
+            with profile.measure(module.path, 'import'):
+                moduleConstraints = module.execute(profile)
+            for name, constraint in moduleConstraints.items():
+                relationComponents.setdefault(name, constraint)
+            completed += 1
+            yield completed, total
+        imported = set(relationComponents)
 
         # Execute each individual relation declaration
         for relationDeclaration in self.relations:
@@ -35,8 +136,266 @@ class ProgramDeclaration(object):
             # Create the FBConstraintRelation by executing the relation,
             # passing in the dictionary of already-created relation
             # constraints. Then add the new constraint to the dictionary.
-            constraint = relationDeclaration.execute(relationComponents)
+            with profile.measure(relationDeclaration.name, 'execute'):
+                if id(relationDeclaration) in shared:
+                    constraint = defaultRegistry.getConstraint(
+                        relationDeclaration, relationComponents, profile)
+                    completed += 1
+                else:
+                    steps = relationDeclaration.iterExecute(
+                        relationComponents, profile, programId)
+                    try:
+                        for constraint in steps:
+                            completed += 1
+                            yield completed, total
+                    finally:
+                        steps.close()
             relationComponents[relationDeclaration.name] = constraint
+            if relationDeclaration.name not in imported:
+                for name in self._getAliases(relationDeclaration.name):
+                    constraints[name] = constraint
+            if id(relationDeclaration) in shared:
+                yield completed, total
 
-        # Return the dictionary of relation constraints to complete the program
-        return relationComponents
+    def executeInNamespaces(self, namespaces, profile=None, programId=None):
+        """
+        Executes the program once for each of the given namespaces, with the
+        components of every sender and receiver box remapped into that
+        namespace (so that a box whose component is "Hips" uses "Char1:Hips"
+        in the namespace "Char1").
+
+        The components for every namespace are found up front, in a single
+        pass over the scene. Relations which serve only as macros, and which
+        don't depend on any scene components, are executed only once and
+        shared by every namespace (and with other programs, through the
+        :mod:`.registry`). Every other relation is executed once per
+        namespace, and its constraint is placed in that namespace.
+
+        :param profile:   Optionally, a :class:`.Profile` in which to record
+                          the time spent executing each relation and box.
+        :param programId: The id with which to tag each constraint created,
+                          or the program's own id if None. The constraints
+                          of every namespace are tagged alike.
+
+        :returns: a dictionary which maps each namespace to a dictionary that
+                  maps the names of the relation declarations to their
+                  corresponding constraint objects in that namespace.
+        :raises:  an :class:`.ExecutionError` if any problems are encountered
+                  at runtime.
+        """
+        profile = profile or NULL_PROFILE
+        if programId is None:
+            programId = self.getProgramId()
+        shared = self._findSharedRelations()
+
+        # Find the components of every placeholder in every namespace at once
+        componentNames = set()
+        for relationDeclaration in self.relations:
+            if id(relationDeclaration) not in shared:
+                for box in relationDeclaration.boxes:
+                    if isinstance(box, PlaceholderBoxDeclaration):
+                        componentNames.update(
+                            getNamespacedName(box.componentName, namespace)
+                            for namespace in namespaces)
+        with profile.measure('components', 'execute'):
+            components = findComponents(componentNames)
+
+        # Execute each relation in order, either once for all namespaces or
+        # once within each one, starting with the imported relations
+        imported = self._executeModules(profile)
+        sharedComponents = dict(imported)
+        available = dict((namespace, dict(imported))
+            for namespace in namespaces)
+        results = dict((namespace, {}) for namespace in namespaces)
+        for relationDeclaration in self.relations:
+            name = relationDeclaration.name
+            if id(relationDeclaration) in shared:
+                with profile.measure(name, 'execute'):
+                    constraint = defaultRegistry.getConstraint(
+                        relationDeclaration, sharedComponents, profile)
+                sharedComponents[name] = constraint
+                for namespace in namespaces:
+                    available[namespace][name] = constraint
+                    for alias in self._getAliases(name):
+                        results[namespace][alias] = constraint
+                continue
+
+            for namespace in namespaces:
+                bound = _bindToNamespace(
+                    relationDeclaration, namespace, components)
+                with profile.measure(bound.name, 'execute'):
+                    constraint = bound.execute(available[namespace], profile,
+                        programId)
+                available[namespace][name] = constraint
+                for alias in self._getAliases(name):
+                    results[namespace][alias] = constraint
+        return results
+
+    def evaluate(self, senders):
+        """
+        Evaluates each of the program's relations offline, except for those
+        which serve only as macros.
+
+        :param senders: Maps sender component names to dictionaries which map
+                        node names to values.
+
+        :returns: a dictionary which maps receiver component names to
+                  dictionaries of node name -> value mappings.
+        :raises:  an :class:`.EvaluationError` if any relation can not be
+                  evaluated.
+        """
+        receivers = {}
+        for relationDeclaration in self.relations:
+            if relationDeclaration.isMacro():
+                continue
+            environment = relationDeclaration.evaluate(senders)
+            for componentName, values in environment.receivers.items():
+                receivers.setdefault(componentName, {}).update(values)
+        return receivers
+
+    def _getAliases(self, name):
+        """
+        Returns the names under which the constraint of the named relation
+        is returned when the program is executed.
+        """
+        return self.aliases.get(name, [name])
+
+    def _executeModules(self, profile):
+        """
+        Executes each imported module, unless it's already been executed in
+        the current scene.
+
+        :returns: a dictionary which maps the names of the imported relations
+                  to their corresponding constraint objects.
+        """
+        imported = {}
+        for module in self.modules:
+            with profile.measure(module.path, 'import'):
+                constraints = module.execute(profile)
+            for name, constraint in constraints.items():
+                imported.setdefault(name, constraint)
+        return imported
+
+    def _findSharedRelations(self):
+        """
+        Returns the ids of the relations that serve only as macros and don't
+        depend on any scene components, even through the macros they use.
+        Such relations are the same in every namespace. Relations from
+        outside the program (imported, or found in the registry) are never
+        namespaced, so macros that use them may be shared too.
+        """
+        local = set(id(r) for r in self.relations)
+        shared = set()
+        for relationDeclaration in self.relations:
+            if not relationDeclaration.isMacro():
+                continue
+            for box in relationDeclaration.boxes:
+                if isinstance(box, PlaceholderBoxDeclaration):
+                    break
+                if isinstance(box, MacroBoxDeclaration) and \
+                        id(box.relation) in local and \
+                        id(box.relation) not in shared:
+                    break
+            else:
+                shared.add(id(relationDeclaration))
+        return shared
+
+    def select(self, targets):
+        """
+        Returns a new program containing only the named relations and the
+        relations they use as macros, directly or indirectly, in program
+        order. Executing it creates only those relations' constraints.
+
+        :raises: a :class:`.CompilationError` if any of the targets are not
+                 declared in the program.
+        """
+        relationsByName = {}
+        for relationDeclaration in self.relations:
+            relationsByName.setdefault(relationDeclaration.name,
+                relationDeclaration)
+
+        # Follow macro boxes from the targets to find every relation needed
+        selected = set()
+        pending = []
+        for target in targets:
+            if target not in relationsByName:
+                raise CompilationError(
+                    'No relation constraint named "%s" is declared.' % target)
+            pending.append(relationsByName[target])
+        while pending:
+            relationDeclaration = pending.pop()
+            if id(relationDeclaration) in selected:
+                continue
+            selected.add(id(relationDeclaration))
+            for box in relationDeclaration.boxes:
+                if isinstance(box, MacroBoxDeclaration):
+                    pending.append(box.relation)
+
+        return ProgramDeclaration([r for r in self.relations
+            if id(r) in selected], self.modules, self.aliases)
+
+    def partition(self, **options):
+        """
+        Returns a new program in which large relations are split into their
+        independent parts and small relations are merged together, while
+        the constraints are still returned under the names of the original
+        relations (see :mod:`.partitioning`). Accepts the same options as
+        :func:`.partitionProgram`.
+        """
+        # As with analysis, the partitioning module is imported only when
+        # needed to avoid a circular import
+        from fbrelation.partitioning import partitionProgram
+        return partitionProgram(self, **options)
+
+    def simplify(self, rules=None):
+        """
+        Returns a new program in which the function boxes of each relation
+        are simplified, removing redundant boxes and rebalancing chains of
+        associative operations (see :mod:`.simplification`).
+
+        :param rules: A rule table which overrides entries in
+                      :data:`.simplification.DEFAULT_RULES`.
+        """
+        from fbrelation.simplification import simplifyProgram
+        return simplifyProgram(self, rules)
+
+    def foldConstants(self, senders=None, **options):
+        """
+        Evaluates the program over a range of frames and replaces the boxes
+        whose outputs never change with constants (see :mod:`.folding`).
+        Accepts the same options as :func:`.folding.foldConstants`.
+
+        :returns: a (program, report) pair of the folded program and a
+                  :class:`.FoldingReport`.
+        """
+        from fbrelation.folding import foldConstants
+        return foldConstants(self, senders, **options)
+
+    def analyze(self, weights=None):
+        """
+        Statically analyzes each relation in the program, estimating its
+        per-frame evaluation cost from the given weight table (see
+        :mod:`.analysis`).
+
+        :returns: a list of :class:`.RelationReport` objects, one per
+                  relation, in program order.
+        """
+        # The analysis module depends on the syntax classes, which in turn
+        # depend on this module, so it's imported only when needed
+        from fbrelation.analysis import analyzeProgram
+        return analyzeProgram(self, weights)
+
+def _bindToNamespace(relation, namespace, components):
+    """
+    Returns a copy of the given relation declaration whose name and
+    placeholder components are remapped into the given namespace, using the
+    components found ahead of time where possible.
+    """
+    replacements = {}
+    for box in relation.boxes:
+        if isinstance(box, PlaceholderBoxDeclaration):
+            componentName = getNamespacedName(box.componentName, namespace)
+            replacements[id(box)] = box.bind(
+                componentName, components.get(componentName))
+    return relation.replaceBoxes(
+        replacements, getNamespacedName(relation.name, namespace))
@@ -3,7 +3,47 @@ Defines declaration classes for individual relation constraints within a
 program.
 """
 
-import pyfbsdk
+import copy
+import hashlib
+
+from collections import deque
+
+from fbrelation.backend import sdk
+
+from fbrelation.exceptions import EvaluationError
+
+from fbrelation.profiling import NULL_PROFILE
+
+from fbrelation.tagging import tagConstraint, defaultIndex
+
+from fbrelation.declarations.connection import ConnectionDeclaration
+
+class EvaluationEnvironment(object):
+    """
+    Holds the values flowing into and out of a relation while it's evaluated
+    offline. Sender boxes read their values from the environment, while
+    receiver boxes and macro outputs record theirs.
+    """
+
+    def __init__(self, senders, arguments):
+        """
+        Initializes a new environment with the given inputs.
+
+        :param senders:   Maps sender component names to dictionaries which
+                          map node names to values.
+        :param arguments: Maps the names of macro input boxes to values.
+        """
+        self.senders = senders
+        self.arguments = arguments
+        self.receivers = {}
+        """ Maps receiver component names to node name -> value mappings. """
+        self.outputs = {}
+        """ Maps the names of macro output boxes to values. """
+        self.boxValues = {}
+        """
+        Maps the names of the relation's boxes to dictionaries of the values
+        of their output nodes, keyed as by :attr:`.NodeDeclaration.key`.
+        """
 
 class RelationDeclaration(object):
     """
@@ -20,8 +60,11 @@ class RelationDeclaration(object):
         self.name = name
         self.boxes = boxDeclarations
         self.connections = connectionDeclarations
+        self._evaluationPlan = None
+        self._structuralHash = None
+        self._macroTools = None
 
-    def execute(self, relationComponents):
+    def execute(self, relationComponents, profile=None, programId=None):
         """
         Executes the relation declaration, attempting to construct and
         configure an FBConstraintRelation object in the MotionBuilder scene.
@@ -29,47 +72,233 @@ class RelationDeclaration(object):
         :param relationComponents: Maps the names of the relation declarations
                                    compiled so far to their corresponding
                                    FBConstraintRelation objects.
+        :param profile:            Optionally, a :class:`.Profile` in which to
+                                   record the time spent executing each kind
+                                   of box.
+        :param programId:          Optionally, the id of the program being
+                                   executed, with which the constraint is
+                                   tagged (see :mod:`.tagging`).
 
         :returns: the newly created (and activated) FBConstraintRelation.
         :raises:  an :class:`.ExecutionError` if any box or connection
                   declarations can not be executed.
         """
-        # Create an actual relation constraint in the scene
-        constraint = pyfbsdk.FBConstraintRelation(self.name)
+        for constraint in self.iterExecute(relationComponents, profile,
+                programId):
+            pass
+        return constraint
+
+    def iterExecute(self, relationComponents, profile=None, programId=None):
+        """
+        Executes the relation declaration one step at a time, as a generator.
+        The constraint is created (and tagged with the given program id, if
+        any) first, and then each box and each connection is executed in its
+        own step; the constraint is activated once the final step is
+        complete.
+
+        If the generator is closed before it's exhausted, the partially
+        configured constraint is deleted, so that no incomplete constraint is
+        left in the scene.
+
+        :returns: an iterator which yields the FBConstraintRelation after
+                  each step: first after it's created, and then after each
+                  box and connection is executed.
+        :raises:  an :class:`.ExecutionError` if any box or connection
+                  declarations can not be executed.
+        """
+        profile = profile or NULL_PROFILE
+
+        # Create an actual relation constraint in the scene, tagging it before
+        # any boxes are created so that a constraint left incomplete by an
+        # error can still be found and torn down
+        constraint = sdk.FBConstraintRelation(self.name)
+        if programId is not None:
+            tagConstraint(constraint, programId, self.getStructuralHash())
         x, y = (0, 0)
+        try:
+            yield constraint
 
-        # Collect a mapping of box names to FBBox objects as boxes are executed
-        boxComponents = {}
+            # Collect a mapping of box names to FBBox objects as boxes are
+            # executed
+            boxComponents = {}
 
-        # Create all boxes in the order in which they were declared
-        for boxDeclaration in self.boxes:
+            # Create all boxes in the order in which they were declared
+            for boxDeclaration in self.boxes:
 
-            # Execute the box declaration to create the actual FBBox object
-            # within the newly created FBConstraintRelation, passing in the
-            # collection of already-created relation constraints in order to
-            # resolve macro references.
-            box = boxDeclaration.execute(constraint, relationComponents)
-            constraint.SetBoxPosition(box, x, y); x += 250; y += 100
-            boxComponents[boxDeclaration.name] = box
+                # Execute the box declaration to create the actual FBBox
+                # object within the newly created FBConstraintRelation,
+                # passing in the collection of already-created relation
+                # constraints in order to resolve macro references.
+                with profile.measure(type(boxDeclaration).__name__, 'box'):
+                    box = boxDeclaration.execute(
+                        constraint, relationComponents)
+                constraint.SetBoxPosition(box, x, y); x += 250; y += 100
+                boxComponents[boxDeclaration.name] = box
+                yield constraint
 
-        # With all the boxes created, execute all connections in the order in
-        # which they were declared
-        for connection in self.connections:
-            connection.execute(boxComponents)
+            # With all the boxes created, execute all connections in the
+            # order in which they were declared
+            with profile.measure('connections', 'box'):
+                for connection in self.connections:
+                    connection.execute(boxComponents)
+                    yield constraint
+        except GeneratorExit:
+            if programId is not None:
+                defaultIndex.discard(programId, constraint)
+            constraint.FBDelete()
+            raise
 
-        # With the constraint fully configured, activate it and return it
+        # With the constraint fully configured, activate it
         constraint.Active = True
-        return constraint
+
+    def countExecutionSteps(self):
+        """
+        Returns the number of steps taken by :meth:`iterExecute`: one to
+        create the constraint, plus one for each box and connection.
+        """
+        return 1 + len(self.boxes) + len(self.connections)
+
+    def evaluate(self, senders, arguments=None):
+        """
+        Evaluates the relation offline, computing the values that it would
+        send to its receivers and macro outputs in MotionBuilder.
+
+        :param senders:   Maps the component names of the relation's senders
+                          to dictionaries of node name -> value mappings.
+        :param arguments: Optionally maps the names of macro input boxes to
+                          values. Unspecified inputs take default values.
+
+        :returns: the :class:`.EvaluationEnvironment` holding the results.
+        :raises:  an :class:`.EvaluationError` if any box can not be
+                  evaluated.
+        """
+        environment = EvaluationEnvironment(senders, arguments or {})
+
+        # Evaluate boxes in dependency order, collecting each box's output
+        # values so that they can be passed along to downstream boxes
+        boxValues = environment.boxValues
+        for box, inputConnections in self.getEvaluationPlan():
+            inputValues = {}
+            for connection in inputConnections:
+                inputValues[connection.dst.key] = connection.src.evaluate(
+                    boxValues[connection.src.box.name])
+            boxValues[box.name] = box.evaluate(inputValues, environment)
+
+        return environment
+
+    def getEvaluationPlan(self):
+        """
+        Returns a list of (box, connections) pairs in which every box appears
+        after all of the boxes that it receives input from, alongside the
+        connections that feed its inputs. The plan is computed once and
+        cached.
+
+        :raises: an :class:`.EvaluationError` if the connections form a cycle.
+        """
+        if self._evaluationPlan is not None:
+            return self._evaluationPlan
+
+        # Index the connections by destination box, and count the number of
+        # incoming connections that each box is waiting on
+        inputConnections = dict((box.name, []) for box in self.boxes)
+        downstream = dict((box.name, []) for box in self.boxes)
+        for connection in self.connections:
+            inputConnections[connection.dst.box.name].append(connection)
+            downstream[connection.src.box.name].append(connection.dst.box.name)
+        pending = dict((box.name, len(inputConnections[box.name]))
+            for box in self.boxes)
+
+        # Visit boxes in declaration order once all their inputs are ready
+        boxesByName = dict((box.name, box) for box in self.boxes)
+        ready = deque(box.name for box in self.boxes if not pending[box.name])
+        plan = []
+        while ready:
+            name = ready.popleft()
+            plan.append((boxesByName[name], inputConnections[name]))
+            for dstName in downstream[name]:
+                pending[dstName] -= 1
+                if not pending[dstName]:
+                    ready.append(dstName)
+
+        if len(plan) != len(self.boxes):
+            raise EvaluationError(
+                'The relation "%s" can not be evaluated because its '
+                'connections form a cycle.' % self.name)
+
+        self._evaluationPlan = plan
+        return plan
+
+    def getStructuralHash(self):
+        """
+        Returns a hash of the relation's structure: the signature of each box
+        and the endpoints of each connection, along with the structure of any
+        relations used as macros. Two relations with the same hash compute
+        the same results from the same inputs, regardless of their names or
+        the names of their boxes (other than macro inputs and outputs, which
+        name the relation's interface). The hash is computed once and cached.
+        """
+        if self._structuralHash is not None:
+            return self._structuralHash
+
+        # Identify boxes by position rather than by name
+        indices = dict((box.name, i) for i, box in enumerate(self.boxes))
+        structure = repr((
+            [box.getSignature() for box in self.boxes],
+            [(indices[c.src.box.name], c.src.key,
+              indices[c.dst.box.name], c.dst.key) for c in self.connections]))
+
+        self._structuralHash = hashlib.sha1(
+            structure.encode('utf-8')).hexdigest()
+        return self._structuralHash
+
+    def replaceBoxes(self, replacements, name=None):
+        """
+        Returns a new relation declaration in which some of this relation's
+        boxes are replaced with others (of the same kind, with the same nodes).
+        Boxes and connections which aren't affected are shared with this
+        relation rather than copied.
+
+        :param replacements: Maps the ids of boxes to their replacements.
+        :param name:         Optionally, a new name for the relation.
+        """
+        boxes = [replacements.get(id(box), box) for box in self.boxes]
+
+        # Recreate each connection that involves a replaced box
+        connections = []
+        for connection in self.connections:
+            if (id(connection.src.box) in replacements or
+                    id(connection.dst.box) in replacements):
+                connection = ConnectionDeclaration(
+                    _replaceNodeBox(connection.src, replacements),
+                    _replaceNodeBox(connection.dst, replacements))
+            connections.append(connection)
+
+        return RelationDeclaration(name or self.name, boxes, connections)
+
+    def isMacro(self):
+        """
+        Returns whether the relation contains any macro input or output boxes,
+        which allow it to be used as a macro.
+        """
+        for box in self.boxes:
+            if box.isMacroTool(True) or box.isMacroTool(False):
+                return True
+        return False
+
+    def getMacroToolNames(self, isInput):
+        """
+        Returns the names of the relation's macro input or output boxes, in
+        the order in which they appear as nodes on a macro box.
+        """
+        return list(self._getMacroTools(isInput)[0])
 
     def hasMacroTool(self, name):
         """
         Returns whether the relation contains a macro input or output box with
         the specified name.
         """
-        for box in self.boxes:
-            if box.name == name:
-                return box.supportsNode('')
-        return False
+        return (name in self._getMacroTools(True)[1] or
+            name in self._getMacroTools(False)[1])
 
     def getMacroNodeIndex(self, nodeName, isInput):
         """
@@ -78,10 +307,45 @@ class RelationDeclaration(object):
         nodes, a, b, and c, then `getMacroNodeIndex('c', True)` will return 2.
         Returns -1 if no matching macro tool can be found.
         """
-        currentIndex = -1
-        for box in self.boxes:
-            if box.isMacroTool(isInput):
-                currentIndex += 1
-                if box.name == nodeName:
-                    return currentIndex
-        return -1
+        return self._getMacroTools(isInput)[1].get(nodeName, -1)
+
+    def _getMacroTools(self, isInput):
+        """
+        Returns a list of the names of the relation's macro input or output
+        boxes, along with a dictionary mapping each name to its index in that
+        list. Both are computed once and cached, so that macro nodes can be
+        resolved without searching the relation's boxes each time.
+        """
+        if self._macroTools is None:
+            self._macroTools = {}
+            for side in (True, False):
+                names = [b.name for b in self.boxes if b.isMacroTool(side)]
+                indices = {}
+                for index, name in enumerate(names):
+                    indices.setdefault(name, index)
+                self._macroTools[side] = (names, indices)
+        return self._macroTools[isInput]
+
+def constraintsExist(constraints):
+    """
+    Returns whether each of the given FBConstraintRelation objects still
+    exists in the scene (having not been deleted, for instance, or lost when a
+    new scene was opened).
+    """
+    sceneConstraints = list(sdk.FBSystem().Scene.Constraints)
+    for constraint in constraints:
+        if constraint not in sceneConstraints:
+            return False
+    return True
+
+def _replaceNodeBox(node, replacements):
+    """
+    Returns the given node declaration, or a copy of it that refers to the
+    replacement for its box, if its box has been replaced.
+    """
+    box = replacements.get(id(node.box))
+    if box is None:
+        return node
+    node = copy.copy(node)
+    node.box = box
+    return node
@@ -0,0 +1,373 @@
+"""
+`fbrelation.diff`
+
+Compares two compiled programs by structure rather than by text, so that
+renaming or reordering boxes and connections doesn't register as a change::
+
+    result = diff(oldProgram, newProgram)
+    if result:
+        print(result)
+
+Each relation's boxes are labelled by a canonical hash computed with
+Weisfeiler-Lehman refinement: a box's label begins as a hash of what the box
+does (its signature), and is then repeatedly combined with the labels of the
+boxes it's connected to and the nodes it's connected through. Boxes in the old
+and new relations are matched by their most refined labels first, then by
+less refined labels (so that boxes near a change still match), and finally by
+name; a relation's canonical hash is computed from the labels of its boxes and
+connections, and is independent of their names and order. Every step takes
+time roughly linear in the size of the programs.
+
+Relations are matched by name, and unmatched relations with equal canonical
+hashes are reported as renamed. Running this module as a script compares two
+program files, exiting with status 1 if they differ::
+
+    python -m fbrelation.diff old.fbr new.fbr
+"""
+
+import argparse
+import sys
+
+from fbrelation.exceptions import RelationException
+
+from fbrelation.syntax.program import ProgramSyntax
+
+from fbrelation.declarations.box import MacroBoxDeclaration
+
+WL_ITERATIONS = 3
+""" The maximum number of refinement rounds used to label boxes. """
+
+class RelationDiff(object):
+    """
+    Describes the differences between two versions of a relation.
+    """
+
+    def __init__(self, oldName, newName):
+        """
+        Initializes a new, empty description of the differences between the
+        relations with the given names.
+        """
+        self.oldName = oldName
+        self.newName = newName
+        self.addedBoxes = []
+        self.removedBoxes = []
+        self.changedBoxes = []
+        """ (old, new) pairs of boxes with the same name but new signatures. """
+        self.renamedBoxes = []
+        """ (old, new) pairs of equivalent boxes with different names. """
+        self.addedConnections = []
+        self.removedConnections = []
+
+    def __str__(self):
+        """
+        Describes the differences, one per line.
+        """
+        lines = []
+        lines.extend('    - %s' % box for box in self.removedBoxes)
+        lines.extend('    + %s' % box for box in self.addedBoxes)
+        lines.extend('    ~ %s => %s' % pair for pair in self.changedBoxes)
+        lines.extend('    - %s' % c for c in self.removedConnections)
+        lines.extend('    + %s' % c for c in self.addedConnections)
+        return '\n'.join(lines)
+
+class ProgramDiff(object):
+    """
+    Describes the differences between two versions of a program.
+    """
+
+    def __init__(self):
+        """
+        Initializes a new, empty description of the differences between two
+        programs.
+        """
+        self.addedRelations = []
+        self.removedRelations = []
+        self.renamedRelations = []
+        """ (oldName, newName) pairs of structurally identical relations. """
+        self.changedRelations = []
+        """ A :class:`RelationDiff` for each relation that's changed. """
+
+    def __bool__(self):
+        """
+        Returns True if the programs differ.
+        """
+        return bool(self.addedRelations or self.removedRelations or
+            self.renamedRelations or self.changedRelations)
+    __nonzero__ = __bool__
+
+    def __str__(self):
+        """
+        Describes the differences, one relation per line, with the changes to
+        each changed relation indented beneath it.
+        """
+        lines = []
+        lines.extend('- %s' % name for name in self.removedRelations)
+        lines.extend('+ %s' % name for name in self.addedRelations)
+        lines.extend('~ %s => %s' % pair for pair in self.renamedRelations)
+        for relationDiff in self.changedRelations:
+            if relationDiff.oldName == relationDiff.newName:
+                lines.append('* %s' % relationDiff.newName)
+            else:
+                lines.append('* %s => %s' %
+                    (relationDiff.oldName, relationDiff.newName))
+            lines.append(str(relationDiff))
+        return '\n'.join(line for line in lines if line)
+
+def diff(old, new):
+    """
+    Compares two :class:`.ProgramDeclaration` objects.
+
+    :returns: a :class:`ProgramDiff` describing how the new program differs
+              from the old one.
+    """
+    labeller = _Labeller()
+    result = ProgramDiff()
+
+    oldByName = _indexByName(old.relations)
+    newByName = _indexByName(new.relations)
+
+    # Compare the relations with the same names in each program
+    for name, newRelation in newByName.items():
+        oldRelation = oldByName.get(name)
+        if oldRelation is not None:
+            relationDiff = diffRelations(oldRelation, newRelation, labeller)
+            if relationDiff is not None:
+                result.changedRelations.append(relationDiff)
+
+    # Relations that are only in one program may have been renamed
+    removed = [r for n, r in oldByName.items() if n not in newByName]
+    added = [r for n, r in newByName.items() if n not in oldByName]
+    removedByHash = {}
+    for relation in removed:
+        removedByHash.setdefault(labeller.getRelationHash(relation),
+            []).append(relation)
+    for relation in added:
+        candidates = removedByHash.get(labeller.getRelationHash(relation))
+        if candidates:
+            oldRelation = candidates.pop(0)
+            result.renamedRelations.append((oldRelation.name, relation.name))
+            removed.remove(oldRelation)
+        else:
+            result.addedRelations.append(relation.name)
+    result.removedRelations = [relation.name for relation in removed]
+
+    # Report relations in the order they're declared
+    newOrder = dict((r.name, i) for i, r in enumerate(new.relations))
+    oldOrder = dict((r.name, i) for i, r in enumerate(old.relations))
+    result.addedRelations.sort(key=newOrder.get)
+    result.removedRelations.sort(key=oldOrder.get)
+    result.renamedRelations.sort(key=lambda pair: newOrder[pair[1]])
+    result.changedRelations.sort(key=lambda d: newOrder[d.newName])
+    return result
+
+def diffRelations(old, new, labeller=None):
+    """
+    Compares two :class:`.RelationDeclaration` objects.
+
+    :param labeller: Used internally to share the canonical hashes of macro
+                     relations between comparisons.
+
+    :returns: a :class:`RelationDiff` describing how the new relation differs
+              from the old one, or None if they're structurally identical.
+    """
+    labeller = labeller or _Labeller()
+    if labeller.getRelationHash(old) == labeller.getRelationHash(new):
+        return None
+    result = RelationDiff(old.name, new.name)
+
+    # Match boxes by their most refined labels first, then by their less
+    # refined labels, and finally by name
+    oldLabels = labeller.getBoxLabels(old)
+    newLabels = labeller.getBoxLabels(new)
+    rounds = min(len(labels) for labels in
+        list(oldLabels.values()) + list(newLabels.values()) + [[None]])
+    matches = {}
+    unmatchedOld = old.boxes
+    for level in reversed(range(rounds)):
+        matchedNew = set(matches.values())
+        unmatchedOld = _matchBoxes(unmatchedOld,
+            [box for box in new.boxes if box.name not in matchedNew],
+            lambda box: oldLabels[box.name][level],
+            lambda box: newLabels[box.name][level], matches)
+    matchedNew = set(matches.values())
+    unmatchedOld = _matchBoxes(unmatchedOld,
+        [box for box in new.boxes if box.name not in matchedNew],
+        lambda box: (box.name, type(box)), lambda box: (box.name, type(box)),
+        matches)
+
+    newBoxes = dict((box.name, box) for box in new.boxes)
+    matchedNew = set(matches.values())
+    for box in old.boxes:
+        if box.name not in matches:
+            continue
+        newBox = newBoxes[matches[box.name]]
+        if box.name != newBox.name:
+            result.renamedBoxes.append((box.name, newBox.name))
+        elif oldLabels[box.name][0] != newLabels[newBox.name][0]:
+            result.changedBoxes.append((box, newBox))
+    result.removedBoxes = unmatchedOld
+    result.addedBoxes = [box for box in new.boxes
+        if box.name not in matchedNew]
+
+    # Compare connections in terms of the new relation's box names
+    def getKey(connection, boxNames):
+        """
+        Returns a key identifying the given connection by its endpoints,
+        with its boxes renamed as given.
+        """
+        return (boxNames.get(connection.src.box.name), connection.src.key,
+            boxNames.get(connection.dst.box.name), connection.dst.key)
+    identity = dict((name, name) for name in newBoxes)
+    oldKeys = set(getKey(c, matches) for c in old.connections)
+    newKeys = set(getKey(c, identity) for c in new.connections)
+    result.removedConnections = [c for c in old.connections
+        if getKey(c, matches) not in newKeys]
+    result.addedConnections = [c for c in new.connections
+        if getKey(c, identity) not in oldKeys]
+    return result
+
+def _matchBoxes(oldBoxes, newBoxes, getOldKey, getNewKey, matches):
+    """
+    Pairs the old and new boxes that have equal keys, preferring pairs with
+    equal names, and records the pairs in matches (by name).
+
+    :returns: the list of old boxes left unmatched.
+    """
+    newByKey = {}
+    for box in newBoxes:
+        newByKey.setdefault(getNewKey(box), []).append(box)
+
+    unmatched = []
+    for box in oldBoxes:
+        candidates = newByKey.get(getOldKey(box))
+        if not candidates:
+            unmatched.append(box)
+            continue
+        match = candidates[0]
+        for candidate in candidates:
+            if candidate.name == box.name:
+                match = candidate
+                break
+        candidates.remove(match)
+        matches[box.name] = match.name
+    return unmatched
+
+def _indexByName(relations):
+    """
+    Maps the name of each relation to the first relation with that name.
+    """
+    relationsByName = {}
+    for relation in relations:
+        relationsByName.setdefault(relation.name, relation)
+    return relationsByName
+
+class _Labeller(object):
+    """
+    Computes and caches canonical labels for boxes and relations.
+    """
+
+    def __init__(self):
+        """
+        Initializes a new labeller with empty caches.
+        """
+        self._relationHashes = {}
+        self._boxLabels = {}
+
+    def getRelationHash(self, relation):
+        """
+        Returns a hash of the relation's structure which doesn't depend on the
+        names or order of its boxes and connections.
+        """
+        key = id(relation)
+        if key not in self._relationHashes:
+            labels = self.getBoxLabels(relation)
+            self._relationHashes[key] = hash((
+                tuple(sorted(label[-1] for label in labels.values())),
+                tuple(sorted((labels[c.src.box.name][-1], c.src.key,
+                    labels[c.dst.box.name][-1], c.dst.key)
+                    for c in relation.connections))))
+        return self._relationHashes[key]
+
+    def getBoxLabels(self, relation):
+        """
+        Returns a dictionary which maps the name of each of the relation's
+        boxes to a list of its labels: its initial label (from its signature)
+        followed by its label after each round of refinement.
+        """
+        key = id(relation)
+        if key in self._boxLabels:
+            return self._boxLabels[key]
+
+        labels = dict((box.name, [self._getInitialLabel(box)])
+            for box in relation.boxes)
+
+        # Index each box's connections to its neighbours
+        neighbours = dict((box.name, []) for box in relation.boxes)
+        for c in relation.connections:
+            neighbours[c.src.box.name].append(
+                ('out', c.src.key, c.dst.key, c.dst.box.name))
+            neighbours[c.dst.box.name].append(
+                ('in', c.dst.key, c.src.key, c.src.box.name))
+
+        # Refine the labels until they no longer distinguish more boxes
+        distinct = len(set(l[-1] for l in labels.values()))
+        for _ in range(WL_ITERATIONS):
+            current = dict((name, l[-1]) for name, l in labels.items())
+            for name, edges in neighbours.items():
+                labels[name].append(hash((current[name], tuple(sorted(
+                    (direction, ownKey, otherKey, current[other])
+                    for direction, ownKey, otherKey, other in edges)))))
+            refined = len(set(l[-1] for l in labels.values()))
+            if refined == distinct:
+                break
+            distinct = refined
+
+        self._boxLabels[key] = labels
+        return labels
+
+    def _getInitialLabel(self, box):
+        """
+        Returns a label for the given box based on its signature, using the
+        canonical hash of the relation for macro boxes.
+        """
+        if isinstance(box, MacroBoxDeclaration):
+            return hash(('macro', self.getRelationHash(box.relation)))
+        return hash(box.getSignature())
+
+def main(argv=None):
+    """
+    Runs the command-line interface, printing the differences between two
+    program files.
+
+    :returns: 0 if the programs are structurally identical, 1 if they differ,
+              or 2 if either can't be compiled.
+    """
+    parser = argparse.ArgumentParser(description=
+        'Compares the structure of two fbrelation programs.')
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--renames', action='store_true',
+        help='also list boxes that were only renamed')
+    args = parser.parse_args(argv)
+
+    programs = []
+    for path in (args.old, args.new):
+        try:
+            with open(path) as fp:
+                programs.append(ProgramSyntax.parse(fp.read(), path).compile(
+                    validation=None))
+        except (IOError, RelationException) as e:
+            sys.stderr.write('%s: %s\n' % (path, e))
+            return 2
+
+    result = diff(*programs)
+    if result:
+        print(str(result))
+    if args.renames:
+        for relationDiff in result.changedRelations:
+            for pair in relationDiff.renamedBoxes:
+                print('%s: %s => %s' % ((relationDiff.newName,) + pair))
+    return 1 if result else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -35,3 +35,21 @@ class ExecutionError(RelationException):
     FBConstraintRelation objects are being instantiated from declarations.
     """
     pass
+
+class EvaluationError(RelationException):
+    """
+    Indicates a problem evaluating a declaration offline, outside of
+    MotionBuilder: for example, a function box type with no known
+    implementation, a missing sender value, or a cycle in a relation's
+    connections. May be raised when computing a relation's outputs from
+    sampled input values.
+    """
+    pass
+
+class ValidationWarning(UserWarning):
+    """
+    Warns of a problem found by the :mod:`.validation` pass that isn't
+    treated as an error: for example, a cycle in a relation's connections, or
+    two connections that drive the same input node.
+    """
+    pass
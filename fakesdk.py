@@ -0,0 +1,488 @@
+"""
+`fbrelation.fakesdk`
+
+Defines a minimal, in-memory stand-in for the parts of the MotionBuilder SDK
+that the execution phase uses. It allows programs to be executed (and the cost
+of executing them to be measured) outside of MotionBuilder::
+
+    scene = FakeSDK()
+    previous = fbrelation.backend.sdk.use(scene)
+    try:
+        fbrelation.loads(text)
+    finally:
+        fbrelation.backend.sdk.use(previous)
+
+The fake scene records every constraint, box, and connection created in it.
+Function boxes can only be created for the types registered in the
+:mod:`.catalog`, since the node names of other types are unknown. Models are
+created on demand when they're looked up by name, unless the scene is
+constructed with `createModels=False`. This is not a simulation of
+MotionBuilder's evaluation: nothing is ever evaluated.
+"""
+
+from fbrelation.catalog import findFunctionType
+
+MODEL_PROPERTIES = ['Translation', 'Rotation', 'Scaling', 'Lcl Translation',
+    'Lcl Rotation', 'Lcl Scaling', 'Visibility']
+""" The names of the animatable properties given to each fake model. """
+
+class FakeTime(object):
+    """
+    Stands in for FBTime.
+    """
+
+    def __init__(self, hours, minutes, seconds, frame):
+        """
+        Initializes a new time. Only the frame number is retained.
+        """
+        self.frame = frame
+
+    def GetFrame(self):
+        """
+        Returns the frame number of the time.
+        """
+        return self.frame
+
+class FakeAnimationNode(object):
+    """
+    Stands in for FBAnimationNode.
+    """
+
+    def __init__(self, name, nodes=None):
+        """
+        Initializes a new animation node with the given name and child nodes.
+        """
+        self.Name = name
+        self.Nodes = nodes or []
+        self.FCurve = None
+
+class FakeBox(object):
+    """
+    Stands in for FBBox, with named input and output animation nodes.
+    """
+
+    def __init__(self, name, inputs, outputs):
+        """
+        Initializes a new box with the given name and lists of input and
+        output node names.
+        """
+        self.Name = name
+        self.LongName = name
+        self._inputs = FakeAnimationNode('Input',
+            [FakeAnimationNode(n) for n in inputs])
+        self._outputs = FakeAnimationNode('Output',
+            [FakeAnimationNode(n) for n in outputs])
+
+    def AnimationNodeInGet(self):
+        """
+        Returns the parent node of the box's inputs.
+        """
+        return self._inputs
+
+    def AnimationNodeOutGet(self):
+        """
+        Returns the parent node of the box's outputs.
+        """
+        return self._outputs
+
+class FakeConstraint(object):
+    """
+    Stands in for FBConstraintRelation.
+    """
+
+    def __init__(self, scene, name):
+        """
+        Initializes a new, empty relation constraint in the given scene.
+        """
+        self.scene = scene
+        self.Name = name
+        self.LongName = name
+        self.Active = False
+        self.PropertyList = FakePropertyList([])
+        self.deleted = False
+        """ Whether the constraint has been deleted from the scene. """
+        self.boxes = []
+        """ The boxes created in the constraint, in order of creation. """
+
+    def PropertyCreate(self, name, propertyType, dataType, animatable, isUser,
+                       referenceSource):
+        """
+        Adds a custom property with the given name, or returns None if the
+        constraint already has a property by that name.
+        """
+        return self.PropertyList.create(name)
+
+    def CreateFunctionBox(self, groupName, typeName):
+        """
+        Creates a function box, macro tool, or macro box.
+
+        :returns: the new box, or None if the type is not known.
+        """
+        if groupName == 'Macro Tools':
+            if typeName.startswith('Macro Input '):
+                box = FakeBox(typeName, [], ['Input'])
+            elif typeName.startswith('Macro Output '):
+                box = FakeBox(typeName, ['Output'], [])
+            else:
+                return None
+        elif groupName == 'My Macros':
+            # A macro box has a node for each macro tool in the constraint
+            macro = self.scene.findConstraint(typeName)
+            if macro is None:
+                return None
+            box = FakeBox(typeName,
+                [b.Name for b in macro.getMacroTools('Macro Input ')],
+                [b.Name for b in macro.getMacroTools('Macro Output ')])
+        else:
+            functionType = findFunctionType(groupName, typeName)
+            if functionType is None:
+                return None
+            box = FakeBox(typeName,
+                [name for name, valueType in functionType.inputs],
+                [name for name, valueType in functionType.outputs])
+        box.groupName = groupName
+        self.boxes.append(box)
+        return box
+
+    def SetAsSource(self, component):
+        """
+        Creates a sender box for the given model.
+        """
+        box = FakeBox(component.LongName, [], component.getPropertyNames())
+        box.component = component
+        self.boxes.append(box)
+        return box
+
+    def ConstrainObject(self, component):
+        """
+        Creates a receiver box for the given model.
+        """
+        box = FakeBox(component.LongName, component.getPropertyNames(), [])
+        box.component = component
+        self.boxes.append(box)
+        return box
+
+    def SetBoxPosition(self, box, x, y):
+        """
+        Does nothing, since boxes have no layout.
+        """
+        return True
+
+    def getMacroTools(self, prefix):
+        """
+        Returns the macro tool boxes whose type names begin with the given
+        prefix, in order of creation.
+        """
+        return [b for b in self.boxes if getattr(b, 'groupName', None) ==
+            'Macro Tools' and b.Name.startswith(prefix)]
+
+    def FBDelete(self):
+        """
+        Removes the constraint from the scene.
+
+        :raises: a RuntimeError if the constraint has already been deleted.
+        """
+        if self.deleted:
+            raise RuntimeError('The constraint "%s" has been deleted.' %
+                self.LongName)
+        self.scene.deleteConstraint(self)
+
+class FakeProperty(object):
+    """
+    Stands in for an animatable FBProperty.
+    """
+
+    def __init__(self, name):
+        """
+        Initializes a new, unanimated property with the given name.
+        """
+        self.Name = name
+        self.Data = None
+        self._animated = False
+
+    def IsAnimatable(self):
+        """
+        Returns True, since every fake property can be animated.
+        """
+        return True
+
+    def IsAnimated(self):
+        """
+        Returns whether the property has been made animated.
+        """
+        return self._animated
+
+    def SetAnimated(self, animated):
+        """
+        Sets whether the property is animated.
+        """
+        self._animated = animated
+
+    def GetAnimationNode(self):
+        """
+        Returns None, since fake properties carry no animation.
+        """
+        return None
+
+class FakePropertyList(object):
+    """
+    Stands in for FBPropertyList.
+    """
+
+    def __init__(self, names):
+        """
+        Initializes a new list with a property for each of the given names.
+        """
+        self._properties = [FakeProperty(name) for name in names]
+
+    def Find(self, name):
+        """
+        Returns the property with the given name, or None.
+        """
+        for prop in self._properties:
+            if prop.Name == name:
+                return prop
+        return None
+
+    def __iter__(self):
+        """
+        Iterates over the properties in the list.
+        """
+        return iter(self._properties)
+
+    def append(self, prop):
+        """
+        Adds a property to the end of the list.
+        """
+        self._properties.append(prop)
+
+    def create(self, name):
+        """
+        Adds a new property with the given name and returns it, or returns
+        None if the list already has a property by that name.
+        """
+        if self.Find(name):
+            return None
+        prop = FakeProperty(name)
+        self.append(prop)
+        return prop
+
+class FakeModel(object):
+    """
+    Stands in for FBModel.
+    """
+
+    def __init__(self, name):
+        """
+        Initializes a new model with the given name and the standard set of
+        animatable properties.
+        """
+        self.Name = name
+        self.LongName = name
+        self.PropertyList = FakePropertyList(MODEL_PROPERTIES)
+        self.Children = []
+
+    def PropertyCreate(self, name, propertyType, dataType, animatable, isUser,
+                       referenceSource):
+        """
+        Adds a custom property with the given name, or returns None if the
+        model already has a property by that name.
+        """
+        return self.PropertyList.create(name)
+
+    def getPropertyNames(self):
+        """
+        Returns the names of the model's properties.
+        """
+        return [prop.Name for prop in self.PropertyList]
+
+class FakePropertyType(object):
+    """
+    Stands in for FBPropertyType, enumerating the types of custom properties.
+    """
+
+    kFBPT_charptr = 'charptr'
+    kFBPT_double = 'double'
+    kFBPT_Vector3D = 'Vector3D'
+
+class FakeVector3d(tuple):
+    """
+    Stands in for FBVector3d, as a tuple of three floats.
+    """
+
+    def __new__(cls, x=0.0, y=0.0, z=0.0):
+        """
+        Creates a new vector with the given components.
+        """
+        return super(FakeVector3d, cls).__new__(cls, (x, y, z))
+
+class FakeScene(object):
+    """
+    Stands in for FBScene, exposing the root of the model hierarchy and the
+    list of constraints.
+    """
+
+    def __init__(self, rootModel, constraints):
+        """
+        Initializes a new scene with the given root model and constraints.
+        """
+        self.RootModel = rootModel
+        self.Constraints = constraints
+
+class FakeEvent(object):
+    """
+    Stands in for an SDK event (such as FBSystem.OnUIIdle), holding a list of
+    callbacks.
+    """
+
+    def __init__(self):
+        """
+        Initializes a new event with no callbacks.
+        """
+        self.callbacks = []
+
+    def Add(self, callback):
+        """
+        Registers a callback, to be called with (control, event) arguments.
+        """
+        self.callbacks.append(callback)
+
+    def Remove(self, callback):
+        """
+        Unregisters a callback.
+        """
+        self.callbacks.remove(callback)
+
+    def fire(self):
+        """
+        Calls each registered callback, as MotionBuilder would when the event
+        occurs.
+        """
+        for callback in list(self.callbacks):
+            callback(self, None)
+
+class FakeSystem(object):
+    """
+    Stands in for FBSystem, exposing the scene and the idle event.
+    """
+
+    def __init__(self, scene, onUIIdle):
+        """
+        Initializes a new system object for the given scene.
+        """
+        self.Scene = scene
+        self.OnUIIdle = onUIIdle
+
+class FakeSDK(object):
+    """
+    Stands in for the pyfbsdk module, holding the state of a fake scene.
+    """
+
+    FBTime = FakeTime
+    FBPropertyType = FakePropertyType
+    FBVector3d = FakeVector3d
+
+    def __init__(self, models=None, createModels=True):
+        """
+        Initializes a new, empty scene.
+
+        :param models:       Optionally, a list of the names of models to
+                             create in the scene up front.
+        :param createModels: If True, models that are looked up by name are
+                             created if they don't exist.
+        """
+        self.createModels = createModels
+        self.constraints = []
+        """ The constraints created in the scene, in order of creation. """
+        self.connections = []
+        """ A list of (src, dst) pairs of connected animation nodes. """
+        self.models = {}
+        self.rootModel = FakeModel('Scene')
+        """ The root of the model hierarchy, parenting every model. """
+        for name in models or []:
+            self._createModel(name)
+        self._constraintsByName = {}
+        self.onUIIdle = FakeEvent()
+        """ The idle event, which can be fired with :meth:`idle`. """
+
+    def FBSystem(self):
+        """
+        Returns an object which provides access to the scene.
+        """
+        return FakeSystem(FakeScene(self.rootModel, list(self.constraints)),
+            self.onUIIdle)
+
+    def FBConstraintRelation(self, name):
+        """
+        Creates a new relation constraint, renaming it if its name is already
+        taken, as MotionBuilder would.
+        """
+        uniqueName = name
+        suffix = 1
+        while uniqueName in self._constraintsByName:
+            uniqueName = '%s %d' % (name, suffix)
+            suffix += 1
+
+        constraint = FakeConstraint(self, uniqueName)
+        self.constraints.append(constraint)
+        self._constraintsByName[uniqueName] = constraint
+        return constraint
+
+    def FBModelNull(self, name):
+        """
+        Creates a new null model with the given name.
+        """
+        return self._createModel(name)
+
+    def FBConnect(self, src, dst):
+        """
+        Records a connection between two animation nodes.
+        """
+        self.connections.append((src, dst))
+        return True
+
+    def FBFindModelByLabelName(self, name):
+        """
+        Returns the model with the given name, creating it if necessary and
+        permitted.
+        """
+        model = self.models.get(name)
+        if model is None and self.createModels:
+            model = self._createModel(name)
+        return model
+
+    def FBFindObjectByFullName(self, name):
+        """
+        Returns the model with the given full name (group::namespace:name),
+        ignoring the group, creating it if necessary and permitted.
+        """
+        return self.FBFindModelByLabelName(name.split('::', 1)[-1])
+
+    def deleteConstraint(self, constraint):
+        """
+        Removes the given constraint from the scene.
+        """
+        self.constraints.remove(constraint)
+        del self._constraintsByName[constraint.LongName]
+        constraint.deleted = True
+
+    def findConstraint(self, name):
+        """
+        Returns the constraint with the given long name, or None.
+        """
+        return self._constraintsByName.get(name)
+
+    def idle(self):
+        """
+        Fires the idle event, as MotionBuilder does whenever its user
+        interface is idle.
+        """
+        self.onUIIdle.fire()
+
+    def _createModel(self, name):
+        """
+        Creates a new model with the given name, parented to the root.
+        """
+        model = self.models[name] = FakeModel(name)
+        self.rootModel.Children.append(model)
+        return model
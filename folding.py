@@ -0,0 +1,311 @@
+"""
+`fbrelation.folding`
+
+Finds the boxes of a program whose outputs never change over a range of
+frames, and replaces them with constants. Rig relations often contain boxes
+whose inputs are driven only by static properties; MotionBuilder evaluates
+them on every frame regardless. Folding evaluates each relation offline on
+the sender values of every frame in the range (sampled from the scene, or
+given explicitly), finds the function and macro boxes whose outputs stay
+within a tolerance of their first values, and cuts them out of the relation::
+
+    program, report = foldConstants(program, firstFrame=0, lastFrame=250)
+    print(report)
+    program.execute()
+
+Since the MotionBuilder API can't plug constant values into a box's inputs,
+the constants are held as custom properties of a scene component, which the
+folded relations send from through a :class:`.ConstantSenderBoxDeclaration`.
+The component is created (as a null) along with its properties when the
+folded program is executed. (A folded program written out as text declares
+an ordinary sender for the component, so it relies on the properties already
+existing when it's loaded again.) Boxes upstream of the folded boxes that are
+left unused are removed as well.
+
+Folding is only as valid as the frames it was profiled over: a box whose
+inputs are animated outside the range, or are changed later by hand, will
+keep sending its folded value. Relations that serve as macros are never
+folded, since their inputs differ between the macro boxes that use them, and
+a relation is left unchanged unless folding lowers its estimated cost (see
+:mod:`.analysis`).
+"""
+
+from fbrelation.exceptions import EvaluationError
+
+from fbrelation.declarations.box import FunctionBoxDeclaration, \
+                                        MacroBoxDeclaration, \
+                                        SenderBoxDeclaration, \
+                                        ConstantSenderBoxDeclaration
+from fbrelation.declarations.node import MacroNodeDeclaration
+from fbrelation.declarations.connection import ConnectionDeclaration
+from fbrelation.declarations.relation import RelationDeclaration
+from fbrelation.declarations.program import ProgramDeclaration
+
+from fbrelation.analysis import analyzeProgram
+from fbrelation.bake import sampleSenders
+from fbrelation.partitioning import estimateCost
+
+DEFAULT_EPSILON = 1e-6
+""" The largest change in a value that's still considered constant. """
+
+DEFAULT_COMPONENT = 'fbrelation_constants'
+""" The name of the component that holds the constants as properties. """
+
+class FoldingReport(object):
+    """
+    Summarizes the boxes removed by folding a program's constants, and the
+    estimated cost of evaluating the program before and after.
+    """
+
+    def __init__(self, frameCount):
+        """
+        Initializes an empty report for a profile of the given length.
+        """
+        self.frameCount = frameCount
+        """ The number of frames over which the program was evaluated. """
+        self.foldedBoxes = {}
+        """ Maps the names of folded relations to the boxes removed. """
+        self.constants = {}
+        """
+        Maps the names of folded relations to dictionaries of the constant
+        values added to them, keyed by property name.
+        """
+        self.before = None
+        """ The :class:`.CostEstimate` of the original program. """
+        self.after = None
+        """ The :class:`.CostEstimate` of the folded program. """
+
+    @property
+    def boxesRemoved(self):
+        """
+        The total number of boxes removed from the program.
+        """
+        return sum(len(names) for names in self.foldedBoxes.values())
+
+    @property
+    def costSaved(self):
+        """
+        The estimated per-frame evaluation cost saved by folding.
+        """
+        return self.before.totalCost - self.after.totalCost
+
+    def toDict(self):
+        """
+        Returns the contents of the report as a dictionary, suitable for
+        serializing to JSON.
+        """
+        return {
+            'frameCount': self.frameCount,
+            'foldedBoxes': self.foldedBoxes,
+            'constants': self.constants,
+            'before': self.before.toDict(),
+            'after': self.after.toDict(),
+            'costSaved': self.costSaved,
+        }
+
+    def __str__(self):
+        """
+        Formats the report as text, listing the boxes removed from each
+        relation followed by the estimated costs.
+        """
+        lines = ['Folded %d box(es) in %d relation(s) over %d frame(s).' %
+            (self.boxesRemoved, len(self.foldedBoxes), self.frameCount)]
+        for name in sorted(self.foldedBoxes):
+            lines.append('  %s: %s' % (name,
+                ', '.join(self.foldedBoxes[name])))
+        lines.append('Estimated cost per frame: %.2f -> %.2f (saved %.2f)' %
+            (self.before.totalCost, self.after.totalCost, self.costSaved))
+        return '\n'.join(lines)
+
+def foldConstants(program, senders=None, firstFrame=None, lastFrame=None,
+        epsilon=DEFAULT_EPSILON, componentName=DEFAULT_COMPONENT,
+        weights=None):
+    """
+    Folds the constant boxes of the given :class:`.ProgramDeclaration`.
+
+    :param senders:       Optionally, the input values for each frame, as a
+                          list of sender dictionaries (see
+                          :meth:`.ProgramDeclaration.evaluate`). If omitted,
+                          the values are sampled from the scene over the
+                          given range of frames.
+    :param epsilon:       The largest change in a value that's still
+                          considered constant.
+    :param componentName: The name of the component to hold the constants.
+    :param weights:       A weight table which overrides entries in
+                          :data:`.DEFAULT_WEIGHTS`, used to estimate costs.
+
+    :returns: a (program, report) pair of the folded
+              :class:`.ProgramDeclaration` and a :class:`FoldingReport`.
+    :raises:  an :class:`.EvaluationError` if no sender values or frame range
+              are given, or an :class:`.ExecutionError` if the senders can
+              not be sampled.
+    """
+    if senders is None:
+        if firstFrame is None or lastFrame is None:
+            raise EvaluationError(
+                'Constants can only be folded given either the sender values '
+                'of each frame or a range of frames to sample.')
+        senders = sampleSenders(program, firstFrame, lastFrame)
+
+    report = FoldingReport(len(senders))
+    relations = []
+    for relation in program.relations:
+        if relation.isMacro() or not senders:
+            relations.append(relation)
+            continue
+        try:
+            constants = findConstantBoxes(relation, senders, epsilon)
+        except EvaluationError:
+            relations.append(relation)
+            continue
+
+        # Keep the folded relation only if it's estimated to be cheaper
+        folded, removed, values = foldRelation(relation, constants,
+            componentName)
+        if removed:
+            costs = analyzeProgram(ProgramDeclaration([relation, folded]),
+                weights)
+            if costs[1].cost < costs[0].cost:
+                report.foldedBoxes[relation.name] = removed
+                report.constants[relation.name] = values
+                relation = folded
+        relations.append(relation)
+
+    result = ProgramDeclaration(relations, program.modules, program.aliases)
+    report.before = estimateCost(program, weights)
+    report.after = estimateCost(result, weights)
+    return result, report
+
+def findConstantBoxes(relation, senders, epsilon=DEFAULT_EPSILON):
+    """
+    Evaluates the given relation once for each frame of sender values, and
+    finds the function and macro boxes whose connected outputs stay within
+    epsilon of their values on the first frame.
+
+    :returns: a dictionary which maps the names of the constant boxes to
+              dictionaries of their connected output values, keyed as by
+              :attr:`.NodeDeclaration.key`.
+    :raises:  an :class:`.EvaluationError` if the relation can not be
+              evaluated.
+    """
+    keys = {}
+    for connection in relation.connections:
+        box = connection.src.box
+        if _isFoldable(box):
+            keys.setdefault(box.name, set()).add(connection.src.key)
+
+    constants = None
+    for frameSenders in senders:
+        boxValues = relation.evaluate(frameSenders).boxValues
+        if constants is None:
+            constants = dict((name, dict((key, boxValues[name][key])
+                for key in nodeKeys)) for name, nodeKeys in keys.items())
+            continue
+
+        # Rule out the boxes whose values have changed since the first frame
+        for name, values in list(constants.items()):
+            for key, value in values.items():
+                if not _isClose(boxValues[name][key], value, epsilon):
+                    del constants[name]
+                    break
+        if not constants:
+            break
+    return constants or {}
+
+def foldRelation(relation, constants, componentName=DEFAULT_COMPONENT):
+    """
+    Replaces the given constant boxes of a relation with a constant sender,
+    which sends their values to the boxes that aren't constant. Boxes that
+    are no longer used as a result are removed.
+
+    :param constants: Maps the names of constant boxes to dictionaries of
+                      their output values, as returned by
+                      :func:`findConstantBoxes`.
+
+    :returns: a (relation, removed, values) tuple of the new relation
+              declaration, a sorted list of the names of the boxes removed,
+              and a dictionary of the constants added, keyed by property
+              name. If nothing could be folded, the given relation is
+              returned with an empty list and dictionary.
+    """
+    # Find the connections that leave the constant part of the graph, and
+    # name a property for each of the nodes they leave from
+    values = {}
+    redirected = {}
+    for connection in relation.connections:
+        src = connection.src
+        if (src.box.name in constants and
+                connection.dst.box.name not in constants):
+            name = '%s %s %s' % (relation.name, src.box.name,
+                _getNodeName(src))
+            values[name] = constants[src.box.name][src.key]
+            redirected[id(connection)] = name
+    if not values:
+        return relation, [], {}
+
+    names = set(box.name for box in relation.boxes)
+    senderName = 'constants'
+    suffix = 2
+    while senderName in names:
+        senderName = 'constants-%d' % suffix
+        suffix += 1
+    sender = ConstantSenderBoxDeclaration(senderName, componentName, values)
+
+    connections = []
+    for connection in relation.connections:
+        if id(connection) in redirected:
+            connection = ConnectionDeclaration(sender.createNodeDeclaration(
+                redirected[id(connection)], True), connection.dst)
+        connections.append(connection)
+
+    # Remove the boxes left without any outgoing connections, repeatedly, so
+    # that the subgraphs feeding only constant boxes are removed as well
+    used = set(c.src.box.name for c in relation.connections)
+    boxes = list(relation.boxes)
+    removed = []
+    while True:
+        remaining = set(c.src.box.name for c in connections)
+        unused = set(box.name for box in boxes if box.name in used and
+            box.name not in remaining and (_isFoldable(box) or
+            isinstance(box, SenderBoxDeclaration)))
+        if not unused:
+            break
+        removed.extend(unused)
+        boxes = [box for box in boxes if box.name not in unused]
+        connections = [c for c in connections
+            if c.dst.box.name not in unused]
+
+    folded = RelationDeclaration(relation.name, boxes + [sender], connections)
+    return folded, sorted(removed), values
+
+def _isFoldable(box):
+    """
+    Returns whether the given box computes its outputs from its inputs, and
+    so could be replaced by constants: a function box (other than a macro
+    tool) or a macro box.
+    """
+    if isinstance(box, MacroBoxDeclaration):
+        return True
+    return (isinstance(box, FunctionBoxDeclaration) and
+        not box.isMacroTool(True) and not box.isMacroTool(False))
+
+def _getNodeName(node):
+    """
+    Returns the name by which the given source node is declared.
+    """
+    if isinstance(node, MacroNodeDeclaration):
+        return node.box.relation.getMacroToolNames(False)[node.nodeIndex]
+    return node.key
+
+def _isClose(a, b, epsilon):
+    """
+    Returns whether the given values (numbers or tuples of numbers) differ
+    by no more than epsilon.
+    """
+    if isinstance(a, tuple) and isinstance(b, tuple):
+        return len(a) == len(b) and all(
+            _isClose(x, y, epsilon) for x, y in zip(a, b))
+    try:
+        return abs(a - b) <= epsilon
+    except TypeError:
+        return a == b
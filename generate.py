@@ -0,0 +1,199 @@
+"""
+`fbrelation.generate`
+
+Generates synthetic programs for use in benchmarks. Programs are generated
+from a seed, so the same parameters always produce the same text. Every
+generated program is valid: it parses, compiles, evaluates offline, and
+executes against the :mod:`.fakesdk` backend.
+
+Each generated relation consists of sender boxes (each feeding a vector to
+number converter), a series of arithmetic function boxes and macro boxes that
+take their inputs from randomly chosen earlier outputs, and receiver boxes
+(each fed by a number to vector converter). Macro relations are generated
+first, each nesting the previous one, up to the requested depth.
+"""
+
+import random
+
+_OPERATIONS = ['Add (a + b)', 'Subtract (a - b)', 'Multiply (a x b)']
+
+def generateProgram(seed=0, relations=10, boxes=20, density=1.5,
+                    macroDepth=1, senders=0.1, receivers=0.1):
+    """
+    Generates the text of a synthetic program.
+
+    :param seed:       Seeds the random number generator.
+    :param relations:  The number of (non-macro) relations to generate.
+    :param boxes:      The approximate number of boxes in each relation.
+    :param density:    The average number of connections into each function
+                       box, between 0 and 2.
+    :param macroDepth: The number of macro relations to generate, each one
+                       using the previous one as a macro. Zero disables
+                       macros.
+    :param senders:    The proportion of each relation's boxes that are
+                       senders.
+    :param receivers:  The proportion of each relation's boxes that are
+                       receivers.
+
+    :returns: the program's source text.
+    """
+    generator = _ProgramGenerator(random.Random(seed), density)
+    blocks = []
+
+    # Generate a chain of macros, each nested in the next
+    macroName = None
+    for depth in range(macroDepth):
+        name = 'macro_%d' % depth
+        blocks.append(generator.generateMacro(name, boxes, macroName))
+        macroName = name
+
+    # Generate the relations proper, each of which may use the last macro
+    for index in range(relations):
+        blocks.append(generator.generateRelation('relation_%d' % index,
+            boxes, macroName, senders, receivers))
+
+    return '%s\n' % '\n\n'.join(blocks)
+
+class _ProgramGenerator(object):
+    """
+    Generates the individual relations of a synthetic program.
+    """
+
+    def __init__(self, rng, density):
+        """
+        Initializes a new generator with the given random number generator
+        and connection density.
+        """
+        self.rng = rng
+        self.density = density
+        self.macroInterfaces = {}
+
+    def generateMacro(self, name, boxCount, nestedMacro):
+        """
+        Generates a macro relation with a few inputs and outputs, optionally
+        using another macro as one of its boxes.
+        """
+        inputs = ['in%d' % i for i in range(self.rng.randint(1, 3))]
+        outputs = ['out%d' % i for i in range(self.rng.randint(1, 2))]
+        self.macroInterfaces[name] = (inputs, outputs)
+
+        body = _RelationBody(self)
+        for inputName in inputs:
+            body.addBox(inputName, 'input="Number"')
+            body.sources.append(inputName)
+        body.addOperations(boxCount, nestedMacro)
+        for outputName in outputs:
+            body.addBox(outputName, 'output="Number"')
+            body.connect(body.pickSource(), outputName)
+        return body.getText(name)
+
+    def generateRelation(self, name, boxCount, macroName, senders, receivers):
+        """
+        Generates an ordinary relation with senders and receivers.
+        """
+        body = _RelationBody(self)
+
+        # Each sender feeds a converter, whose outputs become sources
+        for index in range(max(1, int(boxCount * senders))):
+            senderName = 'sender%d' % index
+            converterName = 'sender%d-translation' % index
+            body.addBox(senderName, 'sender="Model%d"' % self.rng.randint(0,
+                max(1, boxCount)))
+            body.addBox(converterName,
+                'group="Converters", type="Vector to Number"')
+            body.connect('%s.Translation' % senderName, '%s.V' % converterName)
+            body.sources.extend('%s.%s' % (converterName, axis)
+                for axis in 'XYZ')
+
+        body.addOperations(boxCount, macroName)
+
+        # Each receiver is fed by a converter whose inputs come from sources
+        for index in range(max(1, int(boxCount * receivers))):
+            receiverName = 'receiver%d' % index
+            converterName = 'receiver%d-translation' % index
+            body.addBox(receiverName, 'receiver="Target_%s_%d"' %
+                (name, index))
+            body.addBox(converterName,
+                'group="Converters", type="Number to Vector"')
+            for axis in 'XYZ':
+                if self.rng.random() < self.density / 2.0:
+                    body.connect(body.pickSource(),
+                        '%s.%s' % (converterName, axis))
+            body.connect('%s.Result' % converterName,
+                '%s.Translation' % receiverName)
+
+        return body.getText(name)
+
+class _RelationBody(object):
+    """
+    Accumulates the boxes and connections of a single generated relation.
+    """
+
+    def __init__(self, generator):
+        """
+        Initializes an empty relation body for the given generator.
+        """
+        self.generator = generator
+        self.rng = generator.rng
+        self.boxes = []
+        self.connections = []
+        self.sources = []
+
+    def addBox(self, name, attributes):
+        """
+        Adds a box declaration with the given name and attribute text.
+        """
+        self.boxes.append('%s [%s]' % (name, attributes))
+
+    def connect(self, src, dst):
+        """
+        Adds a connection declaration between the two given nodes.
+        """
+        self.connections.append('%s -> %s' % (src, dst))
+
+    def pickSource(self):
+        """
+        Returns a randomly chosen output node, favoring recent ones so that
+        the relation forms deep chains as well as wide fans.
+        """
+        if self.rng.random() < 0.5:
+            return self.sources[-1]
+        return self.rng.choice(self.sources)
+
+    def addOperations(self, boxCount, macroName):
+        """
+        Adds the given number of arithmetic function boxes, with an
+        occasional instance of the named macro, if any.
+        """
+        for index in range(boxCount):
+            name = 'op%d' % index
+
+            # Use a macro box every so often, if a macro is available
+            if macroName and self.rng.random() < 0.1:
+                inputs, outputs = self.generator.macroInterfaces[macroName]
+                self.addBox(name, 'macro="%s"' % macroName)
+                for inputName in inputs:
+                    if self.sources and self.rng.random() < \
+                            self.generator.density / 2.0:
+                        self.connect(self.pickSource(),
+                            '%s.%s' % (name, inputName))
+                self.sources.extend('%s.%s' % (name, outputName)
+                    for outputName in outputs)
+                continue
+
+            # Otherwise, use an ordinary arithmetic box
+            self.addBox(name, 'group="Number", type="%s"' %
+                self.rng.choice(_OPERATIONS))
+            for inputName in 'ab':
+                if self.sources and self.rng.random() < \
+                        self.generator.density / 2.0:
+                    self.connect(self.pickSource(),
+                        '%s.%s' % (name, inputName))
+            self.sources.append('%s.Result' % name)
+
+    def getText(self, name):
+        """
+        Returns the text of the finished relation with the given name.
+        """
+        return '%s\n{\n    %s\n\n    %s\n}' % (name,
+            '\n    '.join(self.boxes), '\n    '.join(self.connections))
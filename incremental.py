@@ -0,0 +1,233 @@
+"""
+`fbrelation.incremental`
+
+Evaluates a relation offline incrementally, for interactive previews in which
+only a few inputs change at a time. An :class:`IncrementalEvaluator` keeps
+the output values of every box from one evaluation to the next. When some of
+the sender values or macro arguments change, only the boxes that depend on
+them are evaluated again, in dependency order, and propagation stops at any
+box whose outputs come out unchanged::
+
+    evaluator = IncrementalEvaluator(relation)
+    evaluator.update(senders)
+    evaluator.update({'Null': {'Translation': (0.0, 1.0, 0.0)}})
+    print(evaluator.receivers, evaluator.evaluated, evaluator.skipped)
+
+Each macro box holds an evaluator of its own for the relation it uses, so
+changes propagate through macros in the same way, and the boxes inside a
+macro are only evaluated if its inputs, or the senders it uses, change.
+Values are compared exactly, so a box that produces a value equal to its
+previous one stops propagation even if its inputs changed.
+"""
+
+import heapq
+
+from fbrelation.declarations.box import MacroBoxDeclaration, \
+                                        MacroInputBoxDeclaration, \
+                                        SenderBoxDeclaration
+from fbrelation.declarations.relation import EvaluationEnvironment
+
+_MISSING = object()
+
+class IncrementalEvaluator(object):
+    """
+    Evaluates a :class:`.RelationDeclaration` offline, reusing the output
+    values of boxes whose inputs haven't changed since the last evaluation.
+    """
+
+    def __init__(self, relation, senders=None):
+        """
+        Prepares to evaluate the given relation. Nothing is evaluated until
+        the first call to :meth:`update`.
+
+        :param senders: Optionally, the initial values of the relation's
+                        senders, mapping component names to dictionaries of
+                        node name -> value mappings. The dictionary is used
+                        as given, rather than copied, so that the evaluators
+                        of nested macros share it with their parents.
+
+        :raises: an :class:`.EvaluationError` if the relation's connections
+                 form a cycle.
+        """
+        self.relation = relation
+        self.environment = EvaluationEnvironment(
+            senders if senders is not None else {}, {})
+        """
+        The :class:`.EvaluationEnvironment` holding the current inputs,
+        results, and box values of the relation.
+        """
+        self.evaluated = 0
+        """ The number of boxes evaluated by the last update. """
+        self.skipped = 0
+        """ The number of boxes left unevaluated by the last update. """
+        self.totalEvaluated = 0
+        """ The number of boxes evaluated by every update so far. """
+        self.totalSkipped = 0
+        """ The number of boxes left unevaluated by every update so far. """
+
+        # Index the plan so that the boxes fed by each output node can be
+        # marked dirty by position, and evaluated in dependency order
+        self._plan = relation.getEvaluationPlan()
+        positions = dict((box.name, i)
+            for i, (box, _) in enumerate(self._plan))
+        self._consumers = {}
+        for connection in relation.connections:
+            nodes = self._consumers.setdefault(connection.src.box.name, {})
+            nodes.setdefault(connection.src.key, set()).add(
+                positions[connection.dst.box.name])
+
+        # Find the boxes to mark dirty when senders and arguments change,
+        # including macro boxes that contain senders
+        self._macros = {}
+        self._senderPositions = {}
+        self._inputPositions = {}
+        self.componentNames = set()
+        """
+        The names of the sender components used by the relation or any of
+        the macros within it.
+        """
+        self.boxCount = 0
+        """ The number of boxes in the relation, with macros expanded. """
+        for i, (box, _) in enumerate(self._plan):
+            componentNames = []
+            if isinstance(box, MacroBoxDeclaration):
+                macro = self._macros[box.name] = IncrementalEvaluator(
+                    box.relation, self.environment.senders)
+                componentNames = macro.componentNames
+                self.boxCount += macro.boxCount
+            else:
+                if isinstance(box, SenderBoxDeclaration):
+                    componentNames = [box.componentName]
+                elif isinstance(box, MacroInputBoxDeclaration):
+                    self._inputPositions[box.name] = i
+                self.boxCount += 1
+            for componentName in componentNames:
+                self._senderPositions.setdefault(componentName, []).append(i)
+                self.componentNames.add(componentName)
+        self._dirty = set(range(len(self._plan)))
+
+    @property
+    def receivers(self):
+        """
+        Maps receiver component names to dictionaries of the node name ->
+        value mappings they received in the latest evaluation.
+        """
+        return self.environment.receivers
+
+    @property
+    def outputs(self):
+        """
+        Maps the names of macro output boxes to the values they received in
+        the latest evaluation.
+        """
+        return self.environment.outputs
+
+    def update(self, senders=None, arguments=None):
+        """
+        Applies changes to the relation's inputs and evaluates the boxes that
+        depend on them. The first update evaluates every box.
+
+        :param senders:   Optionally, maps the names of components whose
+                          values have changed to dictionaries of the changed
+                          node name -> value mappings. Nodes that aren't
+                          given keep their previous values.
+        :param arguments: Optionally, maps the names of macro input boxes to
+                          their new values. Inputs that aren't given keep
+                          their previous values.
+
+        :returns: the :class:`.EvaluationEnvironment` holding the results.
+        :raises:  an :class:`.EvaluationError` if any box can not be
+                  evaluated.
+        """
+        # Replace the values of each changed component, rather than updating
+        # them in place, since sender boxes output the dictionary itself
+        changed = set()
+        for componentName, values in (senders or {}).items():
+            current = self.environment.senders.get(componentName, {})
+            if any(current.get(k, _MISSING) != v for k, v in values.items()):
+                updated = dict(current)
+                updated.update(values)
+                self.environment.senders[componentName] = updated
+                changed.add(componentName)
+        return self._update(changed, arguments or {})
+
+    def _update(self, changed, arguments):
+        """
+        Marks the boxes affected by the given changes as dirty, then
+        evaluates every dirty box in dependency order, marking the boxes fed
+        by any outputs that change as dirty in turn.
+
+        :param changed:   The names of the sender components whose values
+                          have changed. The new values must already be in the
+                          environment.
+        :param arguments: Maps the names of macro input boxes to their
+                          (possibly unchanged) values.
+        """
+        for componentName in changed:
+            self._dirty.update(self._senderPositions.get(componentName, []))
+        for name, value in arguments.items():
+            if name in self._inputPositions and \
+                    self.environment.arguments.get(name, _MISSING) != value:
+                self.environment.arguments[name] = value
+                self._dirty.add(self._inputPositions[name])
+
+        self.evaluated = 0
+        self.skipped = self.boxCount
+        boxValues = self.environment.boxValues
+        pending = list(self._dirty)
+        heapq.heapify(pending)
+        while pending:
+            position = heapq.heappop(pending)
+            if position not in self._dirty:
+                continue
+            box, inputConnections = self._plan[position]
+
+            inputValues = {}
+            for connection in inputConnections:
+                inputValues[connection.dst.key] = connection.src.evaluate(
+                    boxValues[connection.src.box.name])
+            if box.name in self._macros:
+                values = self._evaluateMacro(box, inputValues, changed)
+            else:
+                values = box.evaluate(inputValues, self.environment)
+                self.evaluated += 1
+                self.skipped -= 1
+
+            # Mark the boxes fed by each changed output node as dirty. A box
+            # stays dirty until it's been evaluated successfully, so that it's
+            # evaluated again by the next update if this one fails.
+            self._dirty.discard(position)
+            previous = boxValues.get(box.name)
+            boxValues[box.name] = values
+            consumers = self._consumers.get(box.name, {})
+            for key, positions in consumers.items():
+                if previous is None or previous.get(key, _MISSING) != \
+                        values.get(key, _MISSING):
+                    for consumer in positions:
+                        if consumer not in self._dirty:
+                            self._dirty.add(consumer)
+                            heapq.heappush(pending, consumer)
+
+        self.totalEvaluated += self.evaluated
+        self.totalSkipped += self.skipped
+        return self.environment
+
+    def _evaluateMacro(self, box, inputValues, changed):
+        """
+        Updates the evaluator of the given macro box with its input values,
+        counting the boxes it evaluates and skips as this evaluator's own.
+
+        :returns: a dictionary mapping the index of each of the box's output
+                  nodes to its value.
+        """
+        macro = self._macros[box.name]
+        arguments = {}
+        for index, name in enumerate(box.relation.getMacroToolNames(True)):
+            if index in inputValues:
+                arguments[name] = inputValues[index]
+        macro._update(changed, arguments)
+
+        self.evaluated += macro.evaluated
+        self.skipped -= macro.evaluated
+        return dict(enumerate([macro.outputs[name]
+            for name in box.relation.getMacroToolNames(False)]))
@@ -0,0 +1,365 @@
+"""
+`fbrelation.index`
+
+Maintains a persistent index of what the programs in a directory tree refer
+to: the scene components used by their sender and receiver boxes, the
+relations they use as macros, and the types of their function boxes. The
+index is stored in an SQLite database, so that questions like "which programs
+send from Hips?" can be answered without parsing every program again::
+
+    with ProgramIndex('programs.db') as index:
+        index.update(['path/to/programs'])
+        for reference in index.findComponent('Hips'):
+            print('%s: %s' % (reference.path, reference.relation))
+
+Programs are only parsed, not compiled, so they're indexed even if the macros
+they use can't be resolved. The only exception is expression declarations,
+which are compiled on their own to find the types of the function boxes they
+create; an expression whose operands can't be resolved without compiling the
+rest of the program (an output of a macro box, for instance) is skipped.
+
+Updating the index reparses only the files whose modification times have
+changed since they were last indexed, and forgets the files that have been
+deleted. A component may be looked up by its full name
+(`Character::ns:RightHand`) or by its name alone (`RightHand`), which matches
+it in any group and namespace.
+
+Running this module as a script updates or queries an index::
+
+    python -m fbrelation.index --db programs.db update path/to/programs
+    python -m fbrelation.index --db programs.db component Hips
+    python -m fbrelation.index --db programs.db macro linear_interpolate
+    python -m fbrelation.index --db programs.db function "Add (a + b)"
+"""
+
+import argparse
+import os
+import sqlite3
+
+from collections import namedtuple
+
+from fbrelation.exceptions import RelationException
+
+from fbrelation.syntax.program import ProgramSyntax
+from fbrelation.syntax.vector import VectorConverters
+from fbrelation.syntax.expression import ExpressionCompiler
+
+from fbrelation.declarations.box import FunctionBoxDeclaration
+
+from fbrelation.analysis import findFiles
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS refs (
+    file INTEGER NOT NULL,
+    relation TEXT NOT NULL,
+    box TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    role TEXT,
+    name TEXT NOT NULL,
+    shortName TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS refs_name ON refs (kind, name);
+CREATE INDEX IF NOT EXISTS refs_shortName ON refs (kind, shortName);
+CREATE INDEX IF NOT EXISTS refs_file ON refs (file);
+'''
+
+Reference = namedtuple('Reference', 'path relation box role name')
+"""
+Describes a single box that refers to something: the path of its program, the
+name of its relation, its own name, its role (`sender` or `receiver` for
+components, otherwise None), and the full name of what it refers to.
+"""
+
+class ProgramIndex(object):
+    """
+    An index of the references made by the programs in one or more directory
+    trees, stored in an SQLite database.
+    """
+
+    def __init__(self, path):
+        """
+        Opens the index stored in the database at the given path, creating it
+        if it doesn't exist.
+        """
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript(_SCHEMA)
+
+    def __enter__(self):
+        """
+        Returns the index itself, so that it can be used in a with statement.
+        """
+        return self
+
+    def __exit__(self, *exc_info):
+        """
+        Closes the index at the end of a with statement.
+        """
+        self.close()
+
+    def close(self):
+        """
+        Closes the index's database.
+        """
+        self._connection.close()
+
+    def update(self, directories, pattern='*.fbr'):
+        """
+        Brings the index up to date with the programs in the given directory
+        trees: files that are new or have been modified since they were last
+        indexed are parsed and indexed, and files that no longer exist are
+        removed from the index.
+
+        :param pattern: The shell-style pattern matched by the names of
+                        program files.
+
+        :returns: a tuple containing the number of files indexed and the
+                  number of files removed.
+        """
+        paths = set()
+        for directory in directories:
+            paths.update(os.path.abspath(p) for p in
+                findFiles(directory, pattern))
+
+        cursor = self._connection.cursor()
+        known = dict((path, (fileId, mtime)) for fileId, path, mtime in
+            cursor.execute('SELECT id, path, mtime FROM files'))
+
+        # Forget the files under these directories that have been deleted
+        roots = [os.path.join(os.path.abspath(d), '') for d in directories]
+        removed = [path for path in known if path not in paths and
+            any(path.startswith(root) for root in roots)]
+        for path in removed:
+            self._removeFile(cursor, known[path][0])
+
+        # Reindex each file that's new or has changed
+        indexed = 0
+        for path in sorted(paths):
+            mtime = os.path.getmtime(path)
+            if path in known:
+                fileId, knownMtime = known[path]
+                if knownMtime == mtime:
+                    continue
+                self._removeFile(cursor, fileId)
+            self._indexFile(cursor, path, mtime)
+            indexed += 1
+
+        self._connection.commit()
+        return indexed, len(removed)
+
+    def findComponent(self, name, role=None):
+        """
+        Returns a :class:`Reference` to each sender or receiver box for the
+        named component. A name without a group or namespace matches that
+        name in any group and namespace.
+
+        :param role: Optionally, either "sender" or "receiver", to find only
+                     boxes of that kind.
+        """
+        column = 'shortName' if name == _getShortName(name) else 'name'
+        query = 'kind = ? AND %s = ?' % column
+        arguments = ['component', name]
+        if role:
+            query += ' AND role = ?'
+            arguments.append(role)
+        return self._find(query, arguments)
+
+    def findMacroUsers(self, name):
+        """
+        Returns a :class:`Reference` to each macro box which uses the relation
+        with the given name.
+        """
+        return self._find('kind = ? AND name = ?', ['macro', name])
+
+    def findFunctionUses(self, typeName, groupName=None):
+        """
+        Returns a :class:`Reference` to each function box of the given type,
+        from any group unless one is given.
+        """
+        if groupName:
+            return self._find('kind = ? AND name = ?',
+                ['function', '%s/%s' % (groupName, typeName)])
+        return self._find('kind = ? AND shortName = ?',
+            ['function', typeName])
+
+    def getErrors(self):
+        """
+        Returns a list of (path, message) pairs for the indexed files that
+        could not be parsed.
+        """
+        return list(self._connection.execute(
+            'SELECT path, error FROM files WHERE error IS NOT NULL '
+            'ORDER BY path'))
+
+    def _find(self, condition, arguments):
+        """
+        Returns the references that match the given SQL condition.
+        """
+        return [Reference(*row) for row in self._connection.execute(
+            'SELECT files.path, refs.relation, refs.box, refs.role, '
+            'refs.name FROM refs JOIN files ON refs.file = files.id WHERE '
+            '%s ORDER BY files.path, refs.relation, refs.box' % condition,
+            arguments)]
+
+    def _indexFile(self, cursor, path, mtime):
+        """
+        Parses the file at the given path and records its references, or the
+        error that prevented it from being parsed.
+        """
+        rows = []
+        error = None
+        try:
+            with open(path) as fp:
+                syntax = ProgramSyntax.parse(fp.read(), path)
+            for relation in syntax.relations:
+                for box in relation.boxes:
+                    rows.extend((relation.name, box.name) + reference
+                        for reference in _getReferences(box))
+                rows.extend(_getExpressionReferences(relation))
+        except (IOError, RelationException) as e:
+            error = str(e)
+            rows = []
+        except UnicodeError:
+            error = 'The file "%s" is not valid text.' % path
+            rows = []
+
+        cursor.execute('INSERT INTO files (path, mtime, error) VALUES '
+            '(?, ?, ?)', (path, mtime, error))
+        fileId = cursor.lastrowid
+        cursor.executemany('INSERT INTO refs (file, relation, box, kind, '
+            'role, name, shortName) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(fileId,) + row for row in rows])
+
+    def _removeFile(self, cursor, fileId):
+        """
+        Removes the file with the given id, and its references, from the
+        index.
+        """
+        cursor.execute('DELETE FROM refs WHERE file = ?', (fileId,))
+        cursor.execute('DELETE FROM files WHERE id = ?', (fileId,))
+
+def _getReferences(box):
+    """
+    Returns a list of (kind, role, name, shortName) tuples for the things
+    referred to by the given :class:`.BoxSyntax`.
+    """
+    attributes = box.attributes
+    references = []
+    for role in ('sender', 'receiver'):
+        if role in attributes and attributes[role]:
+            name = attributes[role]
+            references.append(('component', role, name, _getShortName(name)))
+    if 'macro' in attributes and attributes['macro']:
+        name = attributes['macro']
+        references.append(('macro', None, name, name))
+    if 'group' in attributes and 'type' in attributes:
+        references.append(('function', None,
+            '%s/%s' % (attributes['group'], attributes['type']),
+            attributes['type']))
+    return references
+
+def _getExpressionReferences(relation):
+    """
+    Returns a list of (relation, box, kind, role, name, shortName) tuples for
+    the function boxes created by the expressions of the given
+    :class:`.RelationSyntax`. Each expression is compiled against those of
+    the relation's boxes that compile without resolving any macros, and
+    expressions that can't be compiled are skipped.
+    """
+    if not relation.expressions:
+        return []
+    boxes = []
+    boxesByName = {}
+    for boxSyntax in relation.boxes:
+        try:
+            box = boxSyntax.compile(boxesByName, {})
+        except RelationException:
+            continue
+        boxes.append(box)
+        boxesByName[box.name] = box
+    declared = set(boxesByName)
+
+    compiler = ExpressionCompiler(boxes, boxesByName,
+        VectorConverters(boxes, boxesByName))
+    for expression in relation.expressions:
+        try:
+            compiler.compile(expression)
+        except RelationException:
+            continue
+
+    references = []
+    for box in boxes:
+        if box.name not in declared and \
+                isinstance(box, FunctionBoxDeclaration):
+            references.append((relation.name, box.name, 'function', None,
+                '%s/%s' % (box.groupName, box.typeName), box.typeName))
+    return references
+
+def _getShortName(componentName):
+    """
+    Returns the given component name without its group or namespace: for
+    example, "Character::ns:RightHand" becomes "RightHand".
+    """
+    return componentName.split('::')[-1].split(':')[-1]
+
+def main(argv=None):
+    """
+    Runs the command-line interface, updating or querying an index.
+    """
+    parser = argparse.ArgumentParser(description=
+        'Indexes the components, macros, and function boxes referred to by a '
+        'tree of fbrelation programs.')
+    parser.add_argument('--db', default='fbrelation-index.db',
+        help='the path of the index database (default: fbrelation-index.db)')
+    commands = parser.add_subparsers(dest='command')
+
+    update = commands.add_parser('update',
+        help='index new and modified programs')
+    update.add_argument('directories', nargs='+')
+    update.add_argument('--pattern', default='*.fbr',
+        help='the file name pattern of programs (default: *.fbr)')
+
+    component = commands.add_parser('component',
+        help='find the boxes that use a scene component')
+    component.add_argument('name')
+    component.add_argument('--role', choices=['sender', 'receiver'])
+
+    macro = commands.add_parser('macro',
+        help='find the macro boxes that use a relation')
+    macro.add_argument('name')
+
+    function = commands.add_parser('function',
+        help='find the function boxes of a type')
+    function.add_argument('type')
+    function.add_argument('--group')
+
+    args = parser.parse_args(argv)
+    with ProgramIndex(args.db) as index:
+        if args.command == 'update':
+            indexed, removed = index.update(args.directories, args.pattern)
+            print('%d indexed, %d removed' % (indexed, removed))
+            for path, error in index.getErrors():
+                print('%s: %s' % (path, error))
+            return
+
+        if args.command == 'component':
+            references = index.findComponent(args.name, args.role)
+        elif args.command == 'macro':
+            references = index.findMacroUsers(args.name)
+        elif args.command == 'function':
+            references = index.findFunctionUses(args.type, args.group)
+        else:
+            parser.error('a command is required')
+        for reference in references:
+            print('%s: %s.%s%s' % (reference.path, reference.relation,
+                reference.box, ' (%s)' % reference.role if reference.role
+                else ''))
+
+if __name__ == '__main__':
+    main()
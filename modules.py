@@ -0,0 +1,195 @@
+"""
+`fbrelation.modules`
+
+Allows programs to use the relations of other programs as macros. A program
+imports another program (a *module*) with a directive outside of any
+relation, after which the module's relations can be referenced by name::
+
+    import "macros/interpolation.fbr"
+
+    test_constraint
+    {
+        lerp [macro="linear_interpolate"]
+        ...
+    }
+
+(`include` may be used in place of `import`.) Modules are found by a
+:class:`ModuleResolver`: relative paths are looked up relative to the
+directory of the importing program's file, if known, then in each directory
+on the resolver's search path. The search path of :data:`defaultResolver` is
+read from the FBRELATION_PATH environment variable.
+
+Each module is parsed and compiled only once per process. Compiled modules are
+cached by path and reused until the file's modification time changes, or
+until one of the modules it imports in turn is recompiled. Likewise, the
+relation constraints of a module are created only once per scene, and are
+shared by every program that imports it; they're only created again if any of
+them have been deleted from the scene.
+"""
+
+import os
+
+from fbrelation.exceptions import RelationException, CompilationError
+
+from fbrelation.syntax.program import ProgramSyntax
+
+from fbrelation.declarations.relation import constraintsExist
+
+_modules = {}
+""" Caches compiled modules by absolute path, for the life of the process. """
+
+class Module(object):
+    """
+    Represents a compiled module, whose relations are available to the
+    programs that import it.
+    """
+
+    def __init__(self, path, mtime, program):
+        """
+        Initializes a new module compiled from the file at the given path,
+        as of the given modification time.
+
+        :param program: The :class:`.ProgramDeclaration` compiled from the
+                        module's file.
+        """
+        self.path = path
+        self.mtime = mtime
+        self.program = program
+        self._constraints = None
+
+    def __getstate__(self):
+        """
+        Omits the module's constraints when it's pickled (to be sent between
+        processes, for instance), since they belong to this process's scene.
+        """
+        state = self.__dict__.copy()
+        state['_constraints'] = None
+        return state
+
+    def execute(self, profile=None, force=False):
+        """
+        Executes the module's program, unless its constraints have already
+        been created and still exist in the scene.
+
+        :param force: If True, the program is executed even if its constraints
+                      already exist, and the new constraints replace them.
+
+        :returns: a dictionary which maps the names of the module's relation
+                  declarations to their corresponding constraint objects.
+        """
+        if force or self._constraints is None or \
+                not constraintsExist(self._constraints.values()):
+            self._constraints = self.program.execute(profile)
+        return self._constraints
+
+class ModuleResolver(object):
+    """
+    Finds and loads the modules imported by programs.
+    """
+
+    def __init__(self, searchPath=None):
+        """
+        Initializes a new resolver with the given list of directories to
+        search for modules, or if None, the directories listed in the
+        FBRELATION_PATH environment variable.
+        """
+        if searchPath is None:
+            searchPath = [d for d in
+                os.environ.get('FBRELATION_PATH', '').split(os.pathsep) if d]
+        self.searchPath = list(searchPath)
+        self._loading = set()
+
+    def find(self, name, relativeTo=None):
+        """
+        Returns the absolute path of the module imported with the given name.
+
+        :param relativeTo: Optionally, the path of the importing program's
+                           file. Modules are first looked for relative to its
+                           directory.
+
+        :raises: a :class:`.CompilationError` if no such module exists.
+        """
+        if os.path.isabs(name):
+            candidates = [name]
+        else:
+            candidates = [os.path.join(directory, name)
+                for directory in self.searchPath]
+            if relativeTo:
+                candidates.insert(0, os.path.join(
+                    os.path.dirname(os.path.abspath(relativeTo)), name))
+
+        for candidate in candidates:
+            if os.path.isfile(candidate):
+                return os.path.abspath(candidate)
+        raise CompilationError('Could not find a module named "%s".' % name)
+
+    def load(self, path):
+        """
+        Returns the module compiled from the file at the given path,
+        compiling it only if it hasn't been compiled already, or if it (or
+        any module it imports) has changed since.
+
+        :raises: a :class:`.RelationException` if the module (or any module
+                 it imports) can't be read, parsed, or compiled, or if it
+                 imports itself.
+        """
+        path = os.path.abspath(path)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            raise CompilationError('Could not read the module "%s".' % path)
+
+        # Reuse the cached module if neither it nor its imports have changed
+        module = _modules.get(path)
+        if module is not None and module.mtime == mtime and all(
+                self.load(m.path) is m for m in module.program.modules):
+            return module
+
+        # Otherwise, compile the module, taking care not to recurse forever
+        if path in self._loading:
+            raise CompilationError(
+                'The module "%s" imports itself, directly or indirectly.' %
+                path)
+        self._loading.add(path)
+        try:
+            with open(path) as fp:
+                text = fp.read()
+            program = ProgramSyntax.parse(text, path).compile(resolver=self)
+        except IOError:
+            raise CompilationError('Could not read the module "%s".' % path)
+        except UnicodeError:
+            raise CompilationError(
+                'The module "%s" is not valid text.' % path)
+        except RelationException as e:
+            raise type(e)('%s: %s' % (path, e))
+        finally:
+            self._loading.discard(path)
+
+        module = _modules[path] = Module(path, mtime, program)
+        return module
+
+def cacheModule(module):
+    """
+    Adds a module that was compiled elsewhere (in another process, for
+    instance) to the cache, along with the modules it imports, unless an
+    up-to-date module with the same path is already cached.
+
+    :returns: the cached module for the given module's path, which the
+              caller should use in place of the given module.
+    """
+    cached = _modules.get(module.path)
+    if cached is not None and cached.mtime == module.mtime:
+        return cached
+    module.program.modules = [cacheModule(m) for m in module.program.modules]
+    _modules[module.path] = module
+    return module
+
+def clearCache():
+    """
+    Discards every cached module, so that each is compiled again the next time
+    it's imported.
+    """
+    _modules.clear()
+
+defaultResolver = ModuleResolver()
+""" The resolver used when none is given explicitly. """
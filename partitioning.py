@@ -0,0 +1,363 @@
+"""
+`fbrelation.partitioning`
+
+Reshapes the relations of a compiled program so that they evaluate more
+efficiently, without changing what they compute:
+
+- A large relation whose boxes form several independent groups (weakly
+  connected components: boxes with no path of connections between them, in
+  either direction) is **split** into one relation per group, so that each
+  constraint is smaller and can be evaluated independently.
+- Many tiny relations are **merged** into a single relation, so that the
+  scene holds fewer constraints, each with its own evaluation overhead.
+
+::
+
+    program = ProgramSyntax.parse(text).compile()
+    constraints = program.partition(splitThreshold=200).execute()
+
+Executing the partitioned program returns the same dictionary keys as
+executing the original: the name of each relation originally declared maps
+to the constraint holding it (or, for a relation that was split, the
+constraint holding its largest part). Relations that are used as macros, or
+that have macro inputs or outputs, are never split or merged, and the parts
+of a split relation are never merged. When boxes from merged relations have
+the same names, they're renamed after their relations.
+
+The effect of a partitioning can be estimated with the static cost model of
+the :mod:`.analysis` module, whose `"constraint"` weight estimates the
+overhead of each constraint. Running this module as a script compares the
+estimates for a program before and after partitioning::
+
+    python -m fbrelation.partitioning --split 200 --merge 4 program.fbr
+"""
+
+import argparse
+import copy
+import json
+import sys
+
+from fbrelation.exceptions import RelationException
+
+from fbrelation.syntax.program import ProgramSyntax
+
+from fbrelation.declarations.box import MacroBoxDeclaration
+from fbrelation.declarations.relation import RelationDeclaration
+from fbrelation.declarations.program import ProgramDeclaration
+
+from fbrelation.analysis import DEFAULT_WEIGHTS, analyzeProgram
+
+DEFAULT_SPLIT_THRESHOLD = 200
+""" The number of boxes at which a relation becomes a candidate to split. """
+
+DEFAULT_MERGE_THRESHOLD = 4
+""" The number of boxes at or below which a relation may be merged. """
+
+DEFAULT_MERGE_LIMIT = 200
+""" The maximum number of boxes in a relation created by merging. """
+
+class CostEstimate(object):
+    """
+    Summarizes the estimated evaluation cost of a program's constraints.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty estimate.
+        """
+        self.constraintCount = 0
+        """ The number of constraints evaluated (excluding macros). """
+        self.totalCost = 0.0
+        """ The estimated cost of every constraint, including overhead. """
+        self.largestCost = 0.0
+        """ The estimated cost of the most expensive single constraint. """
+        self.depth = 0
+        """ The depth of the deepest constraint's critical path. """
+
+    def toDict(self):
+        """
+        Returns the contents of the estimate as a dictionary, suitable for
+        serializing to JSON.
+        """
+        return {
+            'constraintCount': self.constraintCount,
+            'totalCost': self.totalCost,
+            'largestCost': self.largestCost,
+            'depth': self.depth,
+        }
+
+def partitionProgram(program, splitThreshold=DEFAULT_SPLIT_THRESHOLD,
+        mergeThreshold=DEFAULT_MERGE_THRESHOLD,
+        mergeLimit=DEFAULT_MERGE_LIMIT):
+    """
+    Splits and merges the relations of the given :class:`.ProgramDeclaration`.
+
+    :param splitThreshold: Relations with at least this many boxes are split
+                           into their weakly connected components. If None,
+                           no relations are split.
+    :param mergeThreshold: Relations with at most this many boxes are merged
+                           together, in program order. The parts of split
+                           relations are never merged, so that they aren't
+                           merged straight back together. If None, no
+                           relations are merged.
+    :param mergeLimit:     The maximum number of boxes in a merged relation.
+
+    :returns: a new :class:`.ProgramDeclaration` whose constraints are
+              returned under the names of the original program's relations.
+    """
+    fixed = _findFixedRelations(program)
+    names = set(r.name for r in program.relations)
+    for originalNames in program.aliases.values():
+        names.update(originalNames)
+
+    # Split each large relation into parts, each of which remembers the
+    # names of the original relations it's returned as. The parts are left
+    # fixed, so that they aren't merged back together.
+    parts = []
+    for relation in program.relations:
+        aliases = program.aliases.get(relation.name, [relation.name])
+        if (splitThreshold is None or id(relation) in fixed or
+                len(relation.boxes) < splitThreshold):
+            parts.append((relation, aliases))
+            continue
+        split = splitRelation(relation, names)
+        for i, part in enumerate(split):
+            parts.append((part, aliases if i == 0 else []))
+            if len(split) > 1:
+                fixed.add(id(part))
+
+    # Gather the small parts into groups to merge, and place each merged
+    # relation after the last of its members, so that it follows any macros
+    # that its members use
+    groups = []
+    if mergeThreshold is not None:
+        group = []
+        count = 0
+        for i, (relation, _) in enumerate(parts):
+            if (id(relation) in fixed or
+                    len(relation.boxes) > mergeThreshold):
+                continue
+            if group and count + len(relation.boxes) > mergeLimit:
+                groups.append(group)
+                group, count = [], 0
+            group.append(i)
+            count += len(relation.boxes)
+        groups.append(group)
+    merged = {}
+    for group in [g for g in groups if len(g) > 1]:
+        members = [parts[i] for i in group]
+        relation = mergeRelations([m[0] for m in members], names)
+        merged[group[-1]] = (relation, sum([m[1] for m in members], []))
+        for i in group[:-1]:
+            merged[i] = None
+
+    relations = []
+    aliases = {}
+    for i, part in enumerate(parts):
+        if i in merged:
+            if merged[i] is None:
+                continue
+            part = merged[i]
+        relation, originalNames = part
+        relations.append(relation)
+        if originalNames != [relation.name]:
+            aliases[relation.name] = originalNames
+    return ProgramDeclaration(relations, program.modules, aliases)
+
+def splitRelation(relation, names=None):
+    """
+    Splits the given relation into one relation per weakly connected
+    component of its boxes, largest first. The largest keeps the relation's
+    name; the others are named after it, with numeric suffixes.
+
+    :param names: Optionally, a set of the relation names already in use,
+                  which is updated with the names of the new relations.
+
+    :returns: a list of relation declarations, or a list containing only the
+              given relation if it can't be split.
+    """
+    names = set() if names is None else names
+
+    # Find the components with a disjoint-set forest of box names
+    parents = dict((box.name, box.name) for box in relation.boxes)
+    def find(name):
+        """
+        Returns the name of the root box of the given box's component,
+        compressing the path to it along the way.
+        """
+        root = name
+        while parents[root] != root:
+            root = parents[root]
+        while parents[name] != root:
+            parents[name], name = root, parents[name]
+        return root
+    for connection in relation.connections:
+        srcRoot = find(connection.src.box.name)
+        dstRoot = find(connection.dst.box.name)
+        if srcRoot != dstRoot:
+            parents[dstRoot] = srcRoot
+
+    # Collect each component's boxes and connections in declaration order
+    components = {}
+    order = []
+    for box in relation.boxes:
+        root = find(box.name)
+        if root not in components:
+            components[root] = ([], [])
+            order.append(root)
+        components[root][0].append(box)
+    if len(order) < 2:
+        return [relation]
+    for connection in relation.connections:
+        components[find(connection.src.box.name)][1].append(connection)
+
+    order.sort(key=lambda root: -len(components[root][0]))
+    result = []
+    for i, root in enumerate(order):
+        name = relation.name if i == 0 else _getUniqueName(
+            '%s-%d' % (relation.name, i + 1), names)
+        boxes, connections = components[root]
+        result.append(RelationDeclaration(name, boxes, connections))
+    return result
+
+def mergeRelations(relations, names=None):
+    """
+    Merges the given relations into a single relation, named after the
+    first. Boxes whose names are already taken in the merged relation are
+    renamed after their relations.
+
+    :param names: Optionally, a set of the relation names already in use,
+                  which is updated with the name of the new relation.
+
+    :returns: a new relation declaration.
+    """
+    names = set() if names is None else names
+    name = _getUniqueName('%s-merged' % relations[0].name, names)
+
+    boxNames = set()
+    boxes = []
+    connections = []
+    for relation in relations:
+        replacements = {}
+        for box in relation.boxes:
+            if box.name in boxNames:
+                replacement = copy.copy(box)
+                replacement.name = _getUniqueName(
+                    '%s-%s' % (relation.name, box.name), boxNames)
+                replacements[id(box)] = replacement
+            else:
+                boxNames.add(box.name)
+        if replacements:
+            relation = relation.replaceBoxes(replacements)
+        boxes.extend(relation.boxes)
+        connections.extend(relation.connections)
+    return RelationDeclaration(name, boxes, connections)
+
+def estimateCost(program, weights=None):
+    """
+    Estimates the cost of evaluating the constraints of the given program
+    using the static cost model of the :mod:`.analysis` module. Relations
+    that serve only as macros are counted as part of the relations that use
+    them, rather than as constraints of their own.
+
+    :param weights: A weight table which overrides entries in
+                    :data:`.DEFAULT_WEIGHTS`.
+
+    :returns: a :class:`CostEstimate`.
+    """
+    table = dict(DEFAULT_WEIGHTS)
+    table.update(weights or {})
+
+    estimate = CostEstimate()
+    for relation, report in zip(program.relations,
+            analyzeProgram(program, weights)):
+        if relation.isMacro():
+            continue
+        cost = report.cost + table['constraint']
+        estimate.constraintCount += 1
+        estimate.totalCost += cost
+        estimate.largestCost = max(estimate.largestCost, cost)
+        estimate.depth = max(estimate.depth, report.depth)
+    return estimate
+
+def _findFixedRelations(program):
+    """
+    Returns the ids of the relations that can't be split or merged: those
+    with macro inputs or outputs, and those used by macro boxes.
+    """
+    fixed = set()
+    for relation in program.relations:
+        if relation.isMacro():
+            fixed.add(id(relation))
+        for box in relation.boxes:
+            if isinstance(box, MacroBoxDeclaration):
+                fixed.add(id(box.relation))
+    return fixed
+
+def _getUniqueName(name, names):
+    """
+    Returns the given name, or the name with a numeric suffix if it's
+    already in the given set, and adds the result to the set.
+    """
+    unique = name
+    suffix = 2
+    while unique in names:
+        unique = '%s-%d' % (name, suffix)
+        suffix += 1
+    names.add(unique)
+    return unique
+
+def main(argv=None):
+    """
+    Runs the command-line interface, printing the estimated cost of a program
+    before and after partitioning.
+    """
+    parser = argparse.ArgumentParser(description=
+        'Estimates the effect of splitting and merging the relations of an '
+        'fbrelation program.')
+    parser.add_argument('path')
+    parser.add_argument('--split', type=int, default=DEFAULT_SPLIT_THRESHOLD,
+        help='the box count at which relations are split (default: %d)' %
+        DEFAULT_SPLIT_THRESHOLD)
+    parser.add_argument('--merge', type=int, default=DEFAULT_MERGE_THRESHOLD,
+        help='the box count up to which relations are merged (default: %d)' %
+        DEFAULT_MERGE_THRESHOLD)
+    parser.add_argument('--limit', type=int, default=DEFAULT_MERGE_LIMIT,
+        help='the maximum box count of a merged relation (default: %d)' %
+        DEFAULT_MERGE_LIMIT)
+    parser.add_argument('--weights',
+        help='a JSON file containing a weight table to use')
+    parser.add_argument('--json', action='store_true',
+        help='print the estimates as JSON')
+    args = parser.parse_args(argv)
+
+    weights = None
+    if args.weights:
+        with open(args.weights) as fp:
+            weights = json.load(fp)
+
+    try:
+        with open(args.path) as fp:
+            program = ProgramSyntax.parse(fp.read(), args.path).compile()
+    except (IOError, RelationException) as e:
+        sys.stderr.write('%s: %s\n' % (args.path, e))
+        sys.exit(1)
+    partitioned = partitionProgram(program, args.split, args.merge,
+        args.limit)
+    before = estimateCost(program, weights)
+    after = estimateCost(partitioned, weights)
+
+    if args.json:
+        print(json.dumps({'before': before.toDict(), 'after': after.toDict()},
+            indent=2, sort_keys=True))
+        return
+
+    print('%-8s %11s %10s %10s %6s' %
+        ('', 'constraints', 'total', 'largest', 'depth'))
+    for label, estimate in (('before', before), ('after', after)):
+        print('%-8s %11d %10.2f %10.2f %6d' % (label,
+            estimate.constraintCount, estimate.totalCost,
+            estimate.largestCost, estimate.depth))
+
+if __name__ == '__main__':
+    main()
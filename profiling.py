@@ -0,0 +1,399 @@
+"""
+`fbrelation.profiling`
+
+Defines an opt-in instrumentation surface for measuring where time goes when
+a program is loaded. Passing a :class:`Profile` to :func:`.loads` records the
+wall time and memory allocated by each phase (parsing, compilation, and
+execution), by each relation as it's compiled and executed, and by each box
+as it's executed, along with the number of calls made to the functions and
+classes of the MotionBuilder SDK module::
+
+    profile = fbrelation.profiling.Profile()
+    fbrelation.loads(text, profile=profile)
+    with open('trace.json', 'w') as fp:
+        profile.dumpChromeTrace(fp)
+
+Events are grouped into categories: "phase" for each phase of loading,
+"compile" and "execute" for each relation (named by relation), and "box" for
+each box executed (named by the class of its declaration) along with the
+connections of each relation. The results can be summarized, exported as
+JSON, or exported in the Chrome trace event format for viewing in
+chrome://tracing or Perfetto. When no profile is given, the library uses
+:data:`NULL_PROFILE`, whose measurements do nothing.
+
+Only calls made through the SDK module itself are counted, such as the
+creation of each FBConstraintRelation and each call to FBConnect. Calls to the
+methods of the objects it returns (`CreateFunctionBox`, `SetAsSource`, and so
+on) aren't counted, since the objects are passed back into the SDK and
+returned to the caller, and so can't be wrapped; the time they take is still
+included in the duration of each box.
+
+Memory allocations are measured with the tracemalloc module, when it's
+available (Python 3.4 and up), and are otherwise reported as None.
+"""
+
+import json
+
+from timeit import default_timer
+
+from fbrelation.exceptions import ExecutionError
+
+from fbrelation.backend import sdk
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+class Event(object):
+    """
+    Records a single measured span of work.
+    """
+
+    def __init__(self, name, category, start):
+        """
+        Initializes a new event with the given name and category, beginning
+        at the given time (in seconds, relative to the start of the profile).
+        """
+        self.name = name
+        self.category = category
+        self.start = start
+        self.duration = 0.0
+        self.allocated = None
+        """ The net number of bytes allocated, or None if not measured. """
+        self.calls = 0
+        """ The number of calls made into the SDK during the event. """
+
+    def toDict(self):
+        """
+        Returns the contents of the event as a dictionary.
+        """
+        return {
+            'name': self.name,
+            'category': self.category,
+            'start': self.start,
+            'duration': self.duration,
+            'allocated': self.allocated,
+            'calls': self.calls,
+        }
+
+class Profile(object):
+    """
+    Collects events measured while a program is parsed, compiled, and
+    executed.
+    """
+
+    def __init__(self, trackAllocations=True):
+        """
+        Initializes a new, empty profile.
+
+        :param trackAllocations: If True (and tracemalloc is available), the
+                                 memory allocated during each event is
+                                 measured for the duration of a
+                                 :meth:`session`. This slows down the code
+                                 being measured considerably.
+        """
+        self.trackAllocations = trackAllocations and tracemalloc is not None
+        self.events = []
+        self.calls = {}
+        """
+        Maps the names of SDK functions and classes to the number of calls
+        made to them. Calls to the methods of SDK objects aren't counted.
+        """
+
+        self._origin = default_timer()
+        self._callCount = 0
+
+    def __bool__(self):
+        """
+        Returns True, to distinguish a profile from :data:`NULL_PROFILE`.
+        """
+        return True
+    __nonzero__ = __bool__
+
+    def measure(self, name, category):
+        """
+        Returns a context manager which records a new event with the given
+        name and category, spanning the body of the with statement.
+        """
+        return _Measurement(self, name, category)
+
+    def session(self):
+        """
+        Returns a context manager which enables the measurement of SDK calls
+        and (optionally) memory allocations for the body of the with
+        statement.
+        """
+        return _Session(self)
+
+    def recordCall(self, name):
+        """
+        Counts a single call to the named SDK function.
+        """
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self._callCount += 1
+
+    def getSummary(self):
+        """
+        Aggregates the recorded events by category and name.
+
+        :returns: a dictionary which maps each category to a dictionary that
+                  maps each event name to a dictionary holding the number of
+                  events and their total duration, allocations, and calls.
+        """
+        summary = {}
+        for event in self.events:
+            totals = summary.setdefault(event.category, {}).setdefault(
+                event.name, {'count': 0, 'duration': 0.0, 'allocated': None,
+                    'calls': 0})
+            totals['count'] += 1
+            totals['duration'] += event.duration
+            totals['calls'] += event.calls
+            if event.allocated is not None:
+                totals['allocated'] = \
+                    (totals['allocated'] or 0) + event.allocated
+        return summary
+
+    def toDict(self):
+        """
+        Returns the contents of the profile as a dictionary, suitable for
+        serializing to JSON.
+        """
+        return {
+            'events': [event.toDict() for event in self.events],
+            'summary': self.getSummary(),
+            'calls': self.calls,
+        }
+
+    def toChromeTrace(self):
+        """
+        Returns the recorded events in the Chrome trace event format, as a
+        dictionary suitable for serializing to JSON.
+        """
+        traceEvents = []
+        for event in self.events:
+            traceEvents.append({
+                'name': event.name,
+                'cat': event.category,
+                'ph': 'X',
+                'ts': event.start * 1e6,
+                'dur': event.duration * 1e6,
+                'pid': 0,
+                'tid': 0,
+                'args': {'allocated': event.allocated, 'calls': event.calls},
+            })
+        return {'traceEvents': traceEvents, 'displayTimeUnit': 'ms'}
+
+    def dump(self, fp):
+        """
+        Writes the profile to the given open file as JSON.
+        """
+        json.dump(self.toDict(), fp, indent=2, sort_keys=True)
+
+    def dumpChromeTrace(self, fp):
+        """
+        Writes the profile to the given open file in the Chrome trace event
+        format.
+        """
+        json.dump(self.toChromeTrace(), fp)
+
+class NullProfile(object):
+    """
+    Stands in for a :class:`Profile` when instrumentation is disabled. Its
+    measurements do nothing.
+    """
+
+    def __bool__(self):
+        """
+        Returns False, so that the null profile can be replaced with `or`.
+        """
+        return False
+    __nonzero__ = __bool__
+
+    def measure(self, name, category):
+        """
+        Returns a context manager that does nothing.
+        """
+        return _NULL_CONTEXT
+
+    def session(self):
+        """
+        Returns a context manager that does nothing.
+        """
+        return _NULL_CONTEXT
+
+class _NullContext(object):
+    """
+    A reusable context manager that does nothing.
+    """
+
+    def __enter__(self):
+        """
+        Does nothing.
+        """
+        return self
+
+    def __exit__(self, *exc_info):
+        """
+        Does nothing.
+        """
+        return False
+
+_NULL_CONTEXT = _NullContext()
+
+NULL_PROFILE = NullProfile()
+""" The profile used when instrumentation is disabled. """
+
+class _Measurement(object):
+    """
+    A context manager which records a single event in a profile.
+    """
+
+    def __init__(self, profile, name, category):
+        """
+        Prepares to measure an event with the given name and category.
+        """
+        self.profile = profile
+        self.event = Event(name, category, 0.0)
+
+    def __enter__(self):
+        """
+        Begins the event, noting the time, memory, and SDK calls so far.
+        """
+        self._memory = _getTracedMemory()
+        self._calls = self.profile._callCount
+        self._start = default_timer()
+        self.event.start = self._start - self.profile._origin
+        return self.event
+
+    def __exit__(self, *exc_info):
+        """
+        Ends the event and adds it to the profile.
+        """
+        self.event.duration = default_timer() - self._start
+        self.event.calls = self.profile._callCount - self._calls
+        memory = _getTracedMemory()
+        if memory is not None and self._memory is not None:
+            self.event.allocated = memory - self._memory
+        self.profile.events.append(self.event)
+        return False
+
+class _Session(object):
+    """
+    A context manager which routes SDK calls through a counting proxy and
+    enables tracemalloc, if requested, for the duration of a profile session.
+    """
+
+    def __init__(self, profile):
+        """
+        Prepares a session for the given profile.
+        """
+        self.profile = profile
+
+    def __enter__(self):
+        """
+        Installs the counting proxy and starts tracing allocations.
+        """
+        # SDK calls can only be counted if the SDK is available; a profile
+        # may also be used to measure parsing and compilation on their own.
+        # Within another session of the same profile, calls are already
+        # being counted.
+        try:
+            self._previous = sdk.load()
+        except ExecutionError:
+            self._previous = None
+        self._proxy = None
+        if self._previous is not None and not (
+                isinstance(self._previous, _CountingModule) and
+                self._previous._profile is self.profile):
+            self._proxy = _CountingModule(self._previous, self.profile)
+            sdk.use(self._proxy)
+
+        self._tracing = False
+        if self.profile.trackAllocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        return self.profile
+
+    def __exit__(self, *exc_info):
+        """
+        Restores the original SDK module and stops tracing allocations.
+        """
+        if self._proxy is not None:
+            sdk.use(self._previous)
+        if self._tracing:
+            tracemalloc.stop()
+        return False
+
+class _CountingModule(object):
+    """
+    Wraps an SDK module, counting each call made to its functions and
+    classes in a profile.
+    """
+
+    def __init__(self, module, profile):
+        """
+        Initializes a proxy for the given module.
+        """
+        self._module = module
+        self._profile = profile
+
+    def __getattr__(self, name):
+        """
+        Returns the named attribute of the module, wrapped so that calls to it
+        are counted.
+        """
+        value = getattr(self._module, name)
+        if not callable(value):
+            return value
+        return _CountedCallable(name, value, self._profile)
+
+class _CountedCallable(object):
+    """
+    Wraps a function or class of an SDK module, counting each call made to
+    it in a profile. Other attributes (such as the members of an enumeration
+    class) are forwarded to the wrapped object, and a wrapped class can still
+    be used to check the types of objects with isinstance and issubclass.
+    """
+
+    def __init__(self, name, value, profile):
+        """
+        Initializes a proxy for the given function or class.
+        """
+        self._name = name
+        self._value = value
+        self._profile = profile
+
+    def __call__(self, *args, **kwargs):
+        """
+        Records the call in the profile, then makes it.
+        """
+        self._profile.recordCall(self._name)
+        return self._value(*args, **kwargs)
+
+    def __getattr__(self, name):
+        """
+        Returns the named attribute of the wrapped object.
+        """
+        return getattr(self._value, name)
+
+    def __instancecheck__(self, instance):
+        """
+        Returns whether the given object is an instance of the wrapped class.
+        """
+        return isinstance(instance, self._value)
+
+    def __subclasscheck__(self, subclass):
+        """
+        Returns whether the given class is a subclass of the wrapped class.
+        """
+        return issubclass(subclass, self._value)
+
+def _getTracedMemory():
+    """
+    Returns the current size of memory traced by tracemalloc, or None if
+    allocations are not being traced.
+    """
+    if tracemalloc is None or not tracemalloc.is_tracing():
+        return None
+    return tracemalloc.get_traced_memory()[0]
@@ -0,0 +1,132 @@
+"""
+`fbrelation.registry`
+
+Remembers the macro relations that have been compiled and executed in this
+process, so that programs loaded later can use them without declaring them
+again, and without creating another copy of their constraints::
+
+    fbrelation.loads(helpers)    # declares and creates linear_interpolate
+    fbrelation.loads('''
+    rig
+    {
+        lerp [macro="linear_interpolate"]
+        ...
+    }
+    ''')                         # uses the existing linear_interpolate
+
+Whenever a program creates the constraint for a relation that serves only as
+a macro (and so doesn't depend on any scene components), the relation and its
+constraint are added to :data:`defaultRegistry`, keyed by the relation's
+structural hash. A program that declares a structurally identical relation
+reuses the registered constraint instead of creating a new one, and a macro
+box that names a relation the program doesn't declare uses the most recently
+registered relation with that name.
+
+Registered constraints are only reused while they still exist in the scene;
+if one has been deleted, it's created again when next needed. The registry
+holds a bounded number of relations, discarding the least recently used one
+when it's full.
+"""
+
+from collections import OrderedDict
+
+from fbrelation.declarations.relation import constraintsExist
+
+DEFAULT_CAPACITY = 64
+""" The number of relations held by a registry unless specified otherwise. """
+
+class MacroRegistry(object):
+    """
+    Holds compiled macro relations and the constraints created from them,
+    keyed by structural hash, evicting the least recently used relations once
+    its capacity is exceeded.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        """
+        Initializes a new, empty registry which holds at most the given number
+        of relations.
+        """
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._hashesByName = {}
+
+    def __len__(self):
+        """
+        Returns the number of relations held by the registry.
+        """
+        return len(self._entries)
+
+    def register(self, relation, constraint=None):
+        """
+        Adds the given relation declaration to the registry, along with the
+        constraint that was created from it, if any. If a structurally
+        identical relation is already registered, it's replaced.
+        """
+        key = relation.getStructuralHash()
+        previous = self._entries.pop(key, None)
+        if constraint is None and previous is not None:
+            constraint = previous[1]
+        self._entries[key] = (relation, constraint)
+        self._hashesByName[relation.name] = key
+
+        # Discard the least recently used relations, along with their names
+        while len(self._entries) > self.capacity:
+            evictedKey, entry = self._entries.popitem(last = False)
+            for name in [name for name, k in self._hashesByName.items()
+                    if k == evictedKey]:
+                del self._hashesByName[name]
+
+    def findRelation(self, name):
+        """
+        Returns the most recently registered relation declaration with the
+        given name, or None.
+        """
+        entry = self._touch(self._hashesByName.get(name))
+        return entry[0] if entry else None
+
+    def findConstraint(self, relation):
+        """
+        Returns the constraint created from a relation structurally identical
+        to the given one, or None if there's no such relation registered or
+        if its constraint no longer exists in the scene.
+        """
+        entry = self._touch(relation.getStructuralHash())
+        if not entry or entry[1] is None:
+            return None
+        return entry[1] if constraintsExist([entry[1]]) else None
+
+    def getConstraint(self, relation, relationComponents=None, profile=None):
+        """
+        Returns the registered constraint for the given relation, executing
+        the relation and registering the new constraint if necessary.
+
+        :param relationComponents: Maps the names of relations executed so far
+                                   to their constraints, as would be passed to
+                                   :meth:`.RelationDeclaration.execute`.
+        """
+        constraint = self.findConstraint(relation)
+        if constraint is None:
+            constraint = relation.execute(relationComponents or {}, profile)
+            self.register(relation, constraint)
+        return constraint
+
+    def clear(self):
+        """
+        Discards every registered relation.
+        """
+        self._entries.clear()
+        self._hashesByName.clear()
+
+    def _touch(self, key):
+        """
+        Returns the entry with the given hash, if any, marking it as the most
+        recently used.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._entries[key] = entry
+        return entry
+
+defaultRegistry = MacroRegistry()
+""" The registry shared by every program loaded in this process. """
@@ -0,0 +1,212 @@
+"""
+`fbrelation.scheduling`
+
+Executes programs a little at a time, so that building a very large program
+doesn't freeze MotionBuilder's user interface. An :class:`Execution` steps
+through :meth:`.ProgramDeclaration.iterExecute`, doing as much work as fits
+within a time budget each time it's advanced, and is typically driven by
+MotionBuilder's idle event::
+
+    execution = Execution(program, callback=lambda e: print(e.progress))
+    execution.start(budget=0.02)
+
+Each step creates a single box or makes a single connection, so a slice never
+runs much longer than its budget. An execution reports its progress as the
+number of steps completed out of the total, and may be cancelled at any point
+between slices: the relations already executed are left complete and active,
+and the partially built constraint of the relation in progress is deleted.
+
+An execution can also be driven by hand, one slice at a time::
+
+    execution = Execution(program)
+    while execution.run(budget=0.02):
+        doOtherWork()
+"""
+
+from timeit import default_timer
+
+from fbrelation.exceptions import RelationException
+
+from fbrelation.backend import sdk
+
+DEFAULT_BUDGET = 0.02
+""" The default time budget of each slice, in seconds. """
+
+PENDING = 'pending'
+""" The state of an execution that hasn't yet begun. """
+
+RUNNING = 'running'
+""" The state of an execution that has begun but not yet ended. """
+
+FINISHED = 'finished'
+""" The state of an execution that has executed the entire program. """
+
+CANCELLED = 'cancelled'
+""" The state of an execution that was cancelled before it finished. """
+
+FAILED = 'failed'
+""" The state of an execution that ended with an error. """
+
+class Execution(object):
+    """
+    Executes a :class:`.ProgramDeclaration` in slices of bounded duration.
+    """
+
+    def __init__(self, program, profile=None, callback=None):
+        """
+        Prepares to execute the given program. Nothing is executed until the
+        execution is advanced.
+
+        :param profile:  Optionally, a :class:`.Profile` in which to record
+                         the time spent executing each relation and box.
+                         Relations are measured from their first step to
+                         their last, including any time between slices.
+        :param callback: Optionally, a function which is called with the
+                         execution after each slice, and once more when the
+                         execution ends.
+        """
+        self.program = program
+        self.callback = callback
+        self.constraints = {}
+        """
+        Maps the names of the relation declarations executed so far to their
+        corresponding constraint objects.
+        """
+        self.state = PENDING
+        self.error = None
+        """ The exception that ended the execution, if it failed. """
+        self.completed = 0
+        """ The number of steps completed so far. """
+        self.total = None
+        """ The total number of steps, once the execution has begun. """
+        self._steps = program.iterExecute(self.constraints, profile)
+        self._idleCallback = None
+
+    @property
+    def progress(self):
+        """
+        The fraction of the execution that's been completed, from 0.0 to 1.0.
+        """
+        if self.state == FINISHED:
+            return 1.0
+        if not self.total:
+            return 0.0
+        return float(self.completed) / self.total
+
+    @property
+    def done(self):
+        """
+        Whether the execution has ended, by finishing, being cancelled, or
+        failing.
+        """
+        return self.state in (FINISHED, CANCELLED, FAILED)
+
+    def step(self, count=1):
+        """
+        Advances the execution by up to the given number of steps.
+
+        :returns: True if there's work remaining, or False if the execution
+                  has ended.
+        :raises:  a :class:`.RelationException` if the execution fails. The
+                  exception is also stored as :attr:`error`.
+        """
+        return self._advance(lambda steps: steps < count)
+
+    def run(self, budget=DEFAULT_BUDGET):
+        """
+        Advances the execution by as many steps as can be completed within
+        the given time budget, taking at least one step.
+
+        :param budget: The time budget of the slice, in seconds. If None,
+                       the rest of the program is executed.
+
+        :returns: True if there's work remaining, or False if the execution
+                  has ended.
+        :raises:  a :class:`.RelationException` if the execution fails. The
+                  exception is also stored as :attr:`error`.
+        """
+        if budget is None:
+            return self._advance(lambda steps: True)
+        deadline = default_timer() + budget
+        return self._advance(lambda steps: default_timer() < deadline)
+
+    def cancel(self):
+        """
+        Cancels the execution, deleting the constraint of the relation being
+        executed (if any) and leaving the constraints of the relations
+        already executed in place. Does nothing if the execution has ended.
+        """
+        if self.done:
+            return
+        self.state = CANCELLED
+        try:
+            self._steps.close()
+        finally:
+            self._end()
+
+    def start(self, budget=DEFAULT_BUDGET):
+        """
+        Registers the execution with MotionBuilder's idle event, so that a
+        slice of the given budget is run each time the user interface is
+        idle. The execution unregisters itself once it ends, whether it
+        finishes, fails, or is cancelled. Errors are stored as :attr:`error`
+        rather than raised, and are reported to the callback.
+        """
+        if self._idleCallback is not None or self.done:
+            return
+        def onIdle(control, event):
+            """
+            Runs a single slice of the execution.
+            """
+            try:
+                self.run(budget)
+            except RelationException:
+                pass
+        self._idleCallback = onIdle
+        sdk.FBSystem().OnUIIdle.Add(onIdle)
+
+    def _advance(self, shouldContinue):
+        """
+        Takes steps for as long as the given function, which is passed the
+        number of steps taken so far in the slice, returns True, always taking
+        at least one step.
+
+        :returns: True if there's work remaining, or False if the execution
+                  has ended.
+        """
+        if self.done:
+            return False
+        self.state = RUNNING
+
+        steps = 0
+        try:
+            while True:
+                self.completed, self.total = next(self._steps)
+                steps += 1
+                if not shouldContinue(steps):
+                    break
+        except StopIteration:
+            self.state = FINISHED
+        except RelationException as e:
+            self.state = FAILED
+            self.error = e
+            self._end()
+            raise
+
+        if self.done:
+            self._end()
+            return False
+        if self.callback:
+            self.callback(self)
+        return True
+
+    def _end(self):
+        """
+        Unregisters the execution from the idle event, if it's registered,
+        and notifies the callback that the execution has ended.
+        """
+        if self._idleCallback is not None:
+            sdk.FBSystem().OnUIIdle.Remove(self._idleCallback)
+            self._idleCallback = None
+        if self.callback:
+            self.callback(self)
@@ -0,0 +1,73 @@
+"""
+`fbrelation.serialization`
+
+Writes programs back out as text. Either a :class:`.ProgramSyntax` or a
+compiled :class:`.ProgramDeclaration` may be written, so programs that were
+built or transformed as declarations can be saved and loaded again later. The
+output is identical to that of `str(syntax)`, and parsing it produces an
+equivalent program. Imported modules are written as import directives.
+
+Rather than building the text of the entire program in memory, :func:`dump`
+writes it to a file one relation at a time, so only the text of the largest
+relation is ever held at once::
+
+    with open('generated.fbr', 'w') as fp:
+        fbrelation.dump(program, fp)
+"""
+
+def iterdump(program):
+    """
+    Yields the text of the given program in chunks, one for each relation.
+    Joining the chunks produces the text of the entire program.
+
+    :param program: A :class:`.ProgramSyntax` or :class:`.ProgramDeclaration`.
+    """
+    separator = ''
+    imports = getImports(program)
+    if imports:
+        yield '\n'.join(['import "%s"' % name for name in imports])
+        separator = '\n\n'
+    for relation in program.relations:
+        yield separator + formatRelation(relation)
+        separator = '\n\n'
+    yield '\n'
+
+def dump(program, fp):
+    """
+    Writes the text of the given program to the given open file, one relation
+    at a time.
+
+    :param program: A :class:`.ProgramSyntax` or :class:`.ProgramDeclaration`.
+    """
+    for chunk in iterdump(program):
+        fp.write(chunk)
+
+def dumps(program):
+    """
+    Returns the text of the given program as a string.
+
+    :param program: A :class:`.ProgramSyntax` or :class:`.ProgramDeclaration`.
+    """
+    return ''.join(iterdump(program))
+
+def getImports(program):
+    """
+    Returns the names of the modules imported by the given program. Modules
+    imported by a :class:`.ProgramDeclaration` are named by absolute path.
+    """
+    if hasattr(program, 'imports'):
+        return program.imports
+    return [module.path for module in program.modules]
+
+def formatRelation(relation):
+    """
+    Returns the text of a single relation, given either a
+    :class:`.RelationSyntax` or a :class:`.RelationDeclaration`. The
+    expression statements of a relation syntax follow its connections.
+    """
+    statements = list(relation.connections) + \
+        list(getattr(relation, 'expressions', []))
+    return '%s\n{\n    %s\n\n    %s\n}' % (
+        relation.name,
+        '\n    '.join([str(box) for box in relation.boxes]),
+        '\n    '.join([str(statement) for statement in statements]))
@@ -0,0 +1,466 @@
+"""
+`fbrelation.simplification`
+
+Simplifies the function boxes of compiled relations, reducing their box
+count and the depth of their evaluation, without changing what they compute::
+
+    program = ProgramSyntax.parse(text).compile().simplify()
+
+Each kind of function box is simplified according to its entry in a rule
+table, keyed by `"<group>/<type>"` (as in the weight tables of
+:mod:`.analysis`). A :class:`SimplificationRule` describes which of the
+following the box supports:
+
+- **Identity elimination**: a box with only one input connected, which
+  passes that input through unchanged because its other input defaults to
+  zero (as with `Add (a + b)` with only `a` connected, or `Subtract (a - b)`
+  with only `a` connected), is removed.
+- **Inverse cancellation**: a box which undoes a box of the same type (as
+  with two `Invert (1/a)` boxes in a row, or two `Subtract (a - b)` boxes
+  with only `b` connected, each of which negates its input) is removed,
+  along with the box it undoes if nothing else uses it.
+- **Idempotence**: a box which repeats a box of the same type (as with two
+  `Absolute (|a|)` boxes in a row) is removed.
+- **Rebalancing**: a chain of associative boxes of the same type (as with
+  eight `Add (a + b)` boxes in a row, each feeding the next) is rebuilt from
+  the same boxes as a balanced tree, combining the operands that are
+  available earliest first, so that its result is computed in as few steps
+  as possible.
+
+Function boxes whose outputs are left unused are removed. Macro inputs and
+outputs, macros, senders, and receivers are never removed, so the relation's
+interface and effects are unchanged.
+
+Since relations can't contain constants, identities such as multiplication
+by one can't be expressed, and aren't simplified. Rebalancing can change the
+result of a chain of floating-point operations by rounding error, so
+:func:`verifyEquivalence` compares the results of two relations within a
+tolerance, evaluating them offline on random inputs, and
+:func:`verifyProgramEquivalence` compares every relation of two programs,
+including the interfaces of their macros.
+"""
+
+import heapq
+import random
+
+from fbrelation.exceptions import EvaluationError
+
+from fbrelation.catalog import DEFAULT_VALUES
+
+from fbrelation.declarations.box import FunctionBoxDeclaration, \
+                                        MacroBoxDeclaration, \
+                                        MacroInputBoxDeclaration, \
+                                        SenderBoxDeclaration
+from fbrelation.declarations.connection import ConnectionDeclaration
+from fbrelation.declarations.relation import RelationDeclaration
+from fbrelation.declarations.program import ProgramDeclaration
+
+class SimplificationRule(object):
+    """
+    Describes how one kind of function box can be simplified. Every box it
+    applies to must have a single output node named "Result".
+    """
+
+    def __init__(self, inputs, identity=None, inverse=None, idempotent=None,
+                 associative=False):
+        """
+        Initializes a new rule for boxes with the given input nodes.
+
+        :param identity:    A list of the input nodes which the box passes
+                            through unchanged when no other input is
+                            connected.
+        :param inverse:     The input node through which the box undoes
+                            another box of the same type, when no other input
+                            of either box is connected.
+        :param idempotent:  The input node through which the box repeats
+                            another box of the same type, when no other input
+                            of either box is connected.
+        :param associative: Whether the box's operation is associative and
+                            commutative, so that a chain of such boxes (with
+                            both inputs connected) can be rebalanced.
+        """
+        self.inputs = inputs
+        self.identity = identity or []
+        self.inverse = inverse
+        self.idempotent = idempotent
+        self.associative = associative
+
+DEFAULT_RULES = {
+    'Number/Add (a + b)': SimplificationRule(['a', 'b'],
+        identity=['a', 'b'], associative=True),
+    'Number/Subtract (a - b)': SimplificationRule(['a', 'b'],
+        identity=['a'], inverse='b'),
+    'Number/Multiply (a x b)': SimplificationRule(['a', 'b'],
+        associative=True),
+    'Number/Invert (1/a)': SimplificationRule(['a'], inverse='a'),
+    'Number/Absolute (|a|)': SimplificationRule(['a'], idempotent='a'),
+    'Vector/Add (V1 + V2)': SimplificationRule(['V1', 'V2'],
+        identity=['V1', 'V2'], associative=True),
+    'Vector/Subtract (V1 - V2)': SimplificationRule(['V1', 'V2'],
+        identity=['V1'], inverse='V2'),
+}
+""" The default rule table, keyed by "<group>/<type>". """
+
+def simplifyProgram(program, rules=None):
+    """
+    Simplifies every relation in the given :class:`.ProgramDeclaration`,
+    updating macro boxes to use the simplified versions of their relations.
+
+    :param rules: A rule table which overrides entries in
+                  :data:`DEFAULT_RULES`.
+
+    :returns: a new :class:`.ProgramDeclaration`.
+    """
+    table = dict(DEFAULT_RULES)
+    table.update(rules or {})
+
+    simplified = {}
+    relations = []
+    for original in program.relations:
+        replacements = {}
+        for box in original.boxes:
+            if (isinstance(box, MacroBoxDeclaration) and
+                    id(box.relation) in simplified):
+                replacements[id(box)] = MacroBoxDeclaration(
+                    box.name, simplified[id(box.relation)])
+        relation = original
+        if replacements:
+            relation = relation.replaceBoxes(replacements)
+        result = simplifyRelation(relation, table)
+        simplified[id(original)] = result
+        relations.append(result)
+    return ProgramDeclaration(relations, program.modules, program.aliases)
+
+def simplifyRelation(relation, rules=None):
+    """
+    Simplifies the given :class:`.RelationDeclaration`. Relations whose
+    connections form a cycle are returned unchanged.
+
+    :param rules: A rule table which overrides entries in
+                  :data:`DEFAULT_RULES`.
+
+    :returns: a new relation declaration with the same name, or the given
+              relation if nothing could be simplified.
+    """
+    table = dict(DEFAULT_RULES)
+    table.update(rules or {})
+    try:
+        plan = relation.getEvaluationPlan()
+    except EvaluationError:
+        return relation
+
+    # Find the boxes that can be bypassed, in dependency order, mapping each
+    # of their outputs to the node that produces the same value
+    replacements = {}
+    def resolve(node):
+        """
+        Returns the node that ultimately produces the given node's value,
+        following any replacements.
+        """
+        return replacements.get((node.box.name, node.key), node)
+    inputsByBox = {}
+    for box, inputConnections in plan:
+        inputs = dict((c.dst.key, resolve(c.src)) for c in inputConnections)
+        inputsByBox[box.name] = inputs
+        rule = _getRule(box, table)
+        if rule is not None:
+            replacement = _findReplacement(box, rule, inputs, inputsByBox,
+                table)
+            if replacement is not None:
+                replacements[(box.name, 'Result')] = replacement
+
+    connections = []
+    for connection in relation.connections:
+        src = resolve(connection.src)
+        if src is not connection.src:
+            connection = ConnectionDeclaration(src, connection.dst)
+        connections.append(connection)
+    boxes, connections = _removeUnusedBoxes(list(relation.boxes), connections)
+    connections = _rebalance(boxes, connections, table)
+
+    if (len(boxes) == len(relation.boxes) and
+            connections == relation.connections):
+        return relation
+    return RelationDeclaration(relation.name, boxes, connections)
+
+def verifyEquivalence(original, simplified, trials=20, seed=None,
+        tolerance=1e-6):
+    """
+    Evaluates two relations offline on the same random inputs, and compares
+    the values that they send to their receivers and macro outputs. Inputs
+    are generated for the nodes of the original relation's senders and for
+    its macro inputs.
+
+    :param trials:    The number of sets of random inputs to try.
+    :param seed:      Optionally, a seed for the random number generator.
+    :param tolerance: The relative difference allowed between numbers.
+
+    :returns: a list of descriptions of the differences found, which is empty
+              if the relations are equivalent.
+    """
+    generator = random.Random(seed)
+    differences = []
+    for _ in range(trials):
+        senders, arguments = _getRandomInputs(original, generator)
+        try:
+            expected = original.evaluate(senders, arguments)
+        except (EvaluationError, ArithmeticError, ValueError):
+            continue
+        try:
+            actual = simplified.evaluate(senders, arguments)
+        except (EvaluationError, ArithmeticError, ValueError) as e:
+            differences.append('%s: %s' % (simplified.name, e))
+            continue
+
+        for name, values in sorted(expected.receivers.items()):
+            for key, value in sorted(values.items()):
+                other = actual.receivers.get(name, {}).get(key)
+                if not _isClose(value, other, tolerance):
+                    differences.append('%s.%s: expected %r, got %r' %
+                        (name, key, value, other))
+        for name, value in sorted(expected.outputs.items()):
+            other = actual.outputs.get(name)
+            if not _isClose(value, other, tolerance):
+                differences.append('%s: expected %r, got %r' %
+                    (name, value, other))
+        if differences:
+            break
+    return differences
+
+def verifyProgramEquivalence(original, simplified, trials=20, seed=None,
+        tolerance=1e-6):
+    """
+    Compares each relation of a program with the relation of the same name
+    (or, among relations that share a name, in the same position) in a
+    simplified version of it, using :func:`verifyEquivalence`. Since
+    the relations of each program are evaluated with the macros of that
+    program, a change to a macro's interface (such as a removed input, which
+    would shift the nodes of every macro box that uses it) is caught in the
+    relations that use it, as well as by comparing the macro tools of each
+    pair of relations directly.
+
+    :returns: a list of descriptions of the differences found, which is empty
+              if the programs are equivalent.
+    """
+    # Pair relations that share a name in the order they're declared
+    relationsByName = {}
+    for relation in simplified.relations:
+        relationsByName.setdefault(relation.name, []).append(relation)
+    differences = []
+    for relation in original.relations:
+        others = relationsByName.get(relation.name)
+        other = others.pop(0) if others else None
+        if other is None:
+            differences.append('%s: missing' % relation.name)
+            continue
+        for isInput in (True, False):
+            names = relation.getMacroToolNames(isInput)
+            otherNames = other.getMacroToolNames(isInput)
+            if names != otherNames:
+                differences.append('%s: expected macro %s %r, got %r' %
+                    (relation.name, 'inputs' if isInput else 'outputs',
+                    names, otherNames))
+        if not differences:
+            differences.extend(verifyEquivalence(relation, other, trials,
+                seed, tolerance))
+        if differences:
+            break
+    return differences
+
+def _getRule(box, table):
+    """
+    Returns the rule for the given box, or None if it's not a function box
+    with an entry in the table.
+    """
+    if not isinstance(box, FunctionBoxDeclaration):
+        return None
+    return table.get('%s/%s' % (box.groupName, box.typeName))
+
+def _findReplacement(box, rule, inputs, inputsByBox, table):
+    """
+    Returns the node that produces the same value as the given box's result,
+    if the box can be bypassed, or otherwise None.
+
+    :param inputs:      Maps the keys of the box's connected inputs to the
+                        nodes that drive them.
+    :param inputsByBox: Maps the names of the boxes visited so far to their
+                        inputs.
+    """
+    if len(inputs) != 1:
+        return None
+    key, src = list(inputs.items())[0]
+    if key in rule.identity:
+        return src
+
+    # An inverse or idempotent box must be fed by another box of its type,
+    # with the same single input connected
+    if key not in (rule.inverse, rule.idempotent) or src.key != 'Result':
+        return None
+    if (not isinstance(src.box, FunctionBoxDeclaration) or
+            _getRule(src.box, table) is not rule):
+        return None
+    srcInputs = inputsByBox.get(src.box.name, {})
+    if list(srcInputs) != [key]:
+        return None
+    return srcInputs[key] if key == rule.inverse else src
+
+def _removeUnusedBoxes(boxes, connections):
+    """
+    Removes the function boxes (other than macro inputs and outputs) whose
+    outputs aren't connected to anything, along with the connections to their
+    inputs, repeatedly until none remain.
+
+    :returns: the remaining boxes and connections.
+    """
+    while True:
+        used = set(c.src.box.name for c in connections)
+        unused = set(box.name for box in boxes if
+            isinstance(box, FunctionBoxDeclaration) and
+            not box.isMacroTool(True) and not box.isMacroTool(False) and
+            box.name not in used)
+        if not unused:
+            return boxes, connections
+        boxes = [box for box in boxes if box.name not in unused]
+        connections = [c for c in connections
+            if c.dst.box.name not in unused]
+
+def _rebalance(boxes, connections, table):
+    """
+    Rebuilds each chain of associative boxes as a balanced tree, reusing the
+    chain's boxes.
+
+    :returns: the new list of connections.
+    """
+    rules = dict((box.name, _getRule(box, table)) for box in boxes)
+    inputs = dict((box.name, {}) for box in boxes)
+    consumers = dict((box.name, []) for box in boxes)
+    for connection in connections:
+        inputs[connection.dst.box.name][connection.dst.key] = connection
+        consumers[connection.src.box.name].append(connection)
+
+    def isOperation(name):
+        """
+        Returns whether the named box is associative and has both of its
+        inputs connected.
+        """
+        rule = rules[name]
+        return (rule is not None and rule.associative and
+            set(inputs[name]) == set(rule.inputs))
+    def isAbsorbed(name):
+        """
+        Returns whether the named box is an operation whose result is used
+        only as an operand of another box of the same type, making it part
+        of that box's tree.
+        """
+        if not isOperation(name) or len(consumers[name]) != 1:
+            return False
+        dst = consumers[name][0].dst
+        return (isOperation(dst.box.name) and
+            rules[dst.box.name] is rules[name] and
+            dst.key in rules[name].inputs)
+
+    # Find the depth at which each box's value becomes available
+    depths = {}
+    plan = RelationDeclaration('', boxes, connections).getEvaluationPlan()
+    for box, inputConnections in plan:
+        depths[box.name] = 1 + max([depths[c.src.box.name]
+            for c in inputConnections] or [0])
+
+    removed = set()
+    added = []
+    for box, _ in plan:
+        if not isOperation(box.name) or isAbsorbed(box.name):
+            continue
+
+        # Collect the tree's operands and boxes, root first
+        operands = []
+        treeBoxes = []
+        pending = [box]
+        while pending:
+            treeBox = pending.pop()
+            treeBoxes.append(treeBox)
+            for key in reversed(rules[box.name].inputs):
+                connection = inputs[treeBox.name][key]
+                if (connection.src.key == 'Result' and
+                        isAbsorbed(connection.src.box.name)):
+                    pending.append(connection.src.box)
+                else:
+                    operands.append(connection.src)
+        if len(operands) < 3:
+            continue
+
+        # Combine the two operands that are available earliest, repeatedly,
+        # and rebuild the tree only if that shortens it
+        heap = [(depths[src.box.name], i, src)
+            for i, src in enumerate(operands)]
+        heapq.heapify(heap)
+        merges = []
+        while len(heap) > 1:
+            depthA, _, a = heapq.heappop(heap)
+            depthB, _, b = heapq.heappop(heap)
+            merges.append((a, b))
+            heapq.heappush(heap, (max(depthA, depthB) + 1,
+                len(operands) + len(merges), len(merges) - 1))
+        if heap[0][0] >= depths[box.name]:
+            continue
+
+        # Assign the merges to the tree's boxes, with the last (the root of
+        # the new tree) assigned to the original root
+        assigned = list(reversed(treeBoxes))
+        nodes = []
+        for a, b in merges:
+            treeBox = assigned.pop(0) if len(assigned) > 1 else assigned[0]
+            for key, operand in zip(rules[box.name].inputs, (a, b)):
+                src = operand if not isinstance(operand, int) else \
+                    nodes[operand]
+                added.append(ConnectionDeclaration(src,
+                    treeBox.createNodeDeclaration(key, False)))
+            nodes.append(treeBox.createNodeDeclaration('Result', True))
+        removed.update(id(inputs[b.name][key]) for b in treeBoxes
+            for key in rules[box.name].inputs)
+
+    if not added:
+        return connections
+    return [c for c in connections if id(c) not in removed] + added
+
+def _getRandomInputs(relation, generator):
+    """
+    Returns random values for the given relation's sender nodes and macro
+    inputs, as a (senders, arguments) pair ready to be evaluated.
+    """
+    def getValue(valueType):
+        """
+        Returns a random value of the given type.
+        """
+        if valueType == 'Vector':
+            return tuple(generator.uniform(-10.0, 10.0) for _ in range(3))
+        if valueType in DEFAULT_VALUES and valueType != 'Number':
+            return DEFAULT_VALUES[valueType]
+        return generator.uniform(-10.0, 10.0)
+
+    senders = {}
+    arguments = {}
+    for box in relation.boxes:
+        if isinstance(box, MacroInputBoxDeclaration):
+            arguments[box.name] = getValue(box.valueType)
+    for connection in relation.connections:
+        box = connection.src.box
+        if isinstance(box, SenderBoxDeclaration):
+            senders.setdefault(box.componentName, {})[connection.src.key] = \
+                getValue(box.getNodeValueType(connection.src.key, True))
+    return senders, arguments
+
+def _isClose(a, b, tolerance):
+    """
+    Returns whether the given values (numbers or tuples of numbers) are
+    equal, within the given relative tolerance. Infinities of the same sign
+    are equal, as are NaNs.
+    """
+    if isinstance(a, tuple) and isinstance(b, tuple):
+        return len(a) == len(b) and all(
+            _isClose(x, y, tolerance) for x, y in zip(a, b))
+    if isinstance(a, float) and isinstance(b, float):
+        if a == b or (a != a and b != b):
+            return True
+        return abs(a - b) <= tolerance * max(1.0, abs(a), abs(b))
+    return a == b
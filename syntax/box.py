@@ -8,12 +8,14 @@ occupy a single line and must not contain arrows (`->`)::
 
 import re
 
-from fbrelation.utility import find
+from functools import reduce
 
 from fbrelation.exceptions import ParsingError, CompilationError
 
 from fbrelation.syntax.attributelist import AttributeListSyntax
 
+from fbrelation.registry import defaultRegistry
+
 from fbrelation.declarations.box import FunctionBoxDeclaration, \
                                         MacroInputBoxDeclaration, \
                                         MacroOutputBoxDeclaration, \
@@ -53,14 +55,17 @@ class BoxSyntax(object):
         Checks and compiles the abstract syntax structure to create a new
         :class:`.BoxDeclaration` object of the appropriate subclass.
 
-        :param boxes: The list of box declarations compiled so far.
-        :param relations: The list of relation declarations compiled so far.
+        :param boxes:     Maps the names of the box declarations compiled so
+                          far to the declarations.
+        :param relations: Maps the names of the relation declarations compiled
+                          so far to the declarations. Macros that name none
+                          of them are looked up in the :mod:`.registry`.
 
         :returns: the newly created box declaration.
         :raises:  a :class:`.CompilationError` if any static checks fail.
         """
         # Ensure that the box name is not a duplicate
-        if find(lambda b: b.name == self.name, boxes):
+        if self.name in boxes:
             raise CompilationError(
                 '"%s": A box by the name of "%s" already exists.' %
                 (str(self), self.name))
@@ -97,6 +102,16 @@ class BoxSyntax(object):
                 '"%s": Invalid combination of attributes for a box '
                 'declaration.' % str(self))
 
+        # Only senders and receivers may declare which of their nodes are
+        # vectors, as a comma-separated list of property names
+        vectorNodes = None
+        if includes('vectors'):
+            if not (isSender or isReceiver):
+                raise CompilationError(
+                    '"%s": Only sender and receiver boxes may declare vector '
+                    'nodes.' % str(self))
+            vectorNodes = [n.strip() for n in self['vectors'].split(',')]
+
         # Finally, create a box declaration of the appropriate class
         if isFunction:
             return FunctionBoxDeclaration(
@@ -106,17 +121,21 @@ class BoxSyntax(object):
         if isMacroOutput:
             return MacroOutputBoxDeclaration(self.name, self['output'])
         if isMacro:
-            # Require that the given macro name matches an existing relation
-            relation = find(lambda r: r.name == self['macro'], relations)
+            # Require that the given macro name matches an existing relation,
+            # either in this program or registered by an earlier one
+            relation = (relations.get(self['macro']) or
+                defaultRegistry.findRelation(self['macro']))
             if not relation:
                 raise CompilationError(
                     '"%s": No relation constraint named "%s" yet exists.' %
                     (str(self), self['macro']))
             return MacroBoxDeclaration(self.name, relation)
         if isSender:
-            return SenderBoxDeclaration(self.name, self['sender'])
+            return SenderBoxDeclaration(
+                self.name, self['sender'], vectorNodes)
         if isReceiver:
-            return ReceiverBoxDeclaration(self.name, self['receiver'])
+            return ReceiverBoxDeclaration(
+                self.name, self['receiver'], vectorNodes)
         
         # We should never reach this point
         assert False
@@ -37,7 +37,8 @@ class ConnectionSyntax(object):
         Compiles this object into a :class:`.ConnectionDeclaration` by
         compiling the source and destination nodes in turn.
 
-        :param boxes: The list of compiled box declarations.
+        :param boxes: Maps the names of the compiled box declarations to the
+                      declarations.
         
         :returns: the newly created connection declaration.
         :raises:  a :class:`.CompilationError` if any static checks fail.
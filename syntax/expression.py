@@ -0,0 +1,515 @@
+"""
+Defines the parsing and compilation of expression declarations, which assign
+the result of an arithmetic expression to a node::
+
+    <node> = <expression>
+
+An expression combines the values of nodes (written as in connection
+declarations) with the operators `+`, `-`, `*`, `/` and `^` (exponent),
+unary `-`, parentheses, and the functions `abs`, `sin`, `cos`, `sqrt`, `mod`,
+`dot`, `cross`, and `length`. Each operation compiles to a function box, and
+each operand to a connection, so that the linear interpolation from the
+README can be written as::
+
+    r = a + (b - a) * t
+
+and compiles as if it were written::
+
+    sub [group="Number", type="Subtract (a - b)"]
+    mult [group="Number", type="Multiply (a x b)"]
+    add [group="Number", type="Add (a + b)"]
+    b -> sub.a
+    a -> sub.b
+    sub.Result -> mult.a
+    t -> mult.b
+    a -> add.a
+    mult.Result -> add.b
+    add.Result -> r
+
+Operations on vectors compile to boxes from the "Vector" group: vectors can be
+added and subtracted, multiplied or divided by numbers, and passed to `dot`,
+`cross`, and `length`. A node is treated as a vector if it's known to be one
+(see :mod:`.syntax.vector`), and as a number otherwise; the components of
+vector nodes may be used as numbers, and assigned to, as in connections.
+
+Each distinct operation is compiled only once per relation: a subexpression
+that appears more than once, in one expression or in several, shares a
+single box (with the operands of `+`, `*`, `dot` treated as unordered). Boxes
+are named after their operations, with numeric suffixes where a name is
+already taken. Expressions can't contain numeric constants, since nodes can
+only be given values by connections. A minus sign between two names with no
+space around it (as in `cube-translation`) is read as part of a box name,
+unless no box by that name is declared (or the box is a function box with no
+node by that name), in which case it's read as a subtraction wherever that
+leaves only declared boxes and nodes (so `a*b-c` reads as `a * b - c`). Any
+name could be a property of a scene component, so a hyphen in the node name
+of a sender or receiver is always read as part of the name.
+"""
+
+import re
+
+from fbrelation.exceptions import ParsingError, CompilationError
+
+from fbrelation.syntax.node import NodeSyntax
+from fbrelation.syntax.connection import ConnectionSyntax
+
+from fbrelation.catalog import findFunctionType
+
+from fbrelation.declarations.box import FunctionBoxDeclaration
+
+# Splits an expression into operators, parentheses, commas, and the operands
+# between them, keeping hyphens within names
+_TOKEN_PATTERN = re.compile(r'\s*(?:([-+*/^(),])|((?:[^-+*/^(),]|'
+    r'(?<=[\w.])-(?=[\w.]))+))')
+
+_OPERATORS = {'+': 'add', '-': 'sub', '*': 'mul', '/': 'div', '^': 'pow'}
+
+_FUNCTIONS = {'abs': 1, 'sin': 1, 'cos': 1, 'sqrt': 1, 'mod': 2, 'dot': 2,
+    'cross': 2, 'length': 1}
+""" Maps the name of each function to the number of arguments it takes. """
+
+_N = 'Number'
+_V = 'Vector'
+
+_OPERATIONS = {
+    ('add', _N, _N): ('Number', 'Add (a + b)', ['a', 'b'], _N),
+    ('sub', _N, _N): ('Number', 'Subtract (a - b)', ['a', 'b'], _N),
+    ('mul', _N, _N): ('Number', 'Multiply (a x b)', ['a', 'b'], _N),
+    ('div', _N, _N): ('Number', 'Divide (a/b)', ['a', 'b'], _N),
+    ('pow', _N, _N): ('Number', 'Exponent (a^b)', ['a', 'b'], _N),
+    ('neg', _N): ('Number', 'Subtract (a - b)', ['b'], _N),
+    ('inv', _N): ('Number', 'Invert (1/a)', ['a'], _N),
+    ('abs', _N): ('Number', 'Absolute (|a|)', ['a'], _N),
+    ('sin', _N): ('Number', 'Sine sin(a)', ['a'], _N),
+    ('cos', _N): ('Number', 'Cosine cos(a)', ['a'], _N),
+    ('sqrt', _N): ('Number', 'sqrt(a)', ['a'], _N),
+    ('mod', _N, _N): ('Number', 'Modulo mod(a, b)', ['a', 'b'], _N),
+    ('add', _V, _V): ('Vector', 'Add (V1 + V2)', ['V1', 'V2'], _V),
+    ('sub', _V, _V): ('Vector', 'Subtract (V1 - V2)', ['V1', 'V2'], _V),
+    ('neg', _V): ('Vector', 'Subtract (V1 - V2)', ['V2'], _V),
+    ('mul', _N, _V): ('Vector', 'Scale (a x V)', ['Number', 'Vector'], _V),
+    ('mul', _V, _N): ('Vector', 'Scale (a x V)', ['Vector', 'Number'], _V),
+    ('dot', _V, _V): ('Vector', 'Dot Product (V1 . V2)', ['V1', 'V2'], _N),
+    ('cross', _V, _V):
+        ('Vector', 'Vector Product (V1 x V2)', ['V1', 'V2'], _V),
+    ('length', _V): ('Vector', 'Length', ['V'], _N),
+}
+"""
+Maps each operation and the value types of its operands to the group and type
+of the function box that performs it, the input node that receives each
+operand, and the value type of its result. Negation subtracts its operand
+from an unconnected input, which has a default value of zero.
+"""
+
+_COMMUTATIVE = set(['add', 'mul', 'dot'])
+
+_BOX_NAMES = {'mul': 'mult'}
+""" Maps operations to the base names of their boxes, where they differ. """
+
+class ExpressionSyntax(object):
+    """
+    Represents the abstract syntax of an expression declaration, which
+    consists of a target node and an expression tree. Each node of the tree
+    is either a :class:`.NodeSyntax` (an operand) or a tuple containing the
+    name of an operation followed by its operand trees.
+    """
+
+    def __init__(self, target, expression, text):
+        """
+        Initializes a new expression syntax object which assigns the given
+        expression tree, parsed from the given text, to the target node.
+        """
+        self.target = target
+        self.expression = expression
+        self.text = text
+
+    def __str__(self):
+        """
+        Converts the syntax object into its raw string representation.
+        """
+        return '%s = %s' % (str(self.target), self.text)
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Parses the given input text to produce a new ExpressionSyntax object.
+
+        :returns: the newly created syntax object.
+        :raises:  a :class:`.ParsingError` if the syntax is invalid.
+        """
+        targetText, _, expressionText = text.partition('=')
+        if not targetText.strip() or not expressionText.strip():
+            raise ParsingError(
+                '"%s": Incomplete expression declaration.' % text)
+        parser = _Parser(expressionText.strip())
+        return cls(NodeSyntax.parse(targetText), parser.parse(),
+            expressionText.strip())
+
+    @classmethod
+    def matches(cls, line):
+        """
+        Returns whether the given line of a relation body is an expression
+        declaration: a line with an equals sign that comes before any
+        attribute list.
+        """
+        equalsPos = line.find('=')
+        bracketPos = line.find('[')
+        return equalsPos >= 0 and (bracketPos < 0 or equalsPos < bracketPos)
+
+class ExpressionCompiler(object):
+    """
+    Compiles the expression declarations of a single relation, sharing the
+    boxes of common subexpressions between them.
+    """
+
+    def __init__(self, boxes, boxesByName, converters):
+        """
+        Initializes a new compiler for the relation with the given boxes.
+        Function boxes are added to both the list and the dictionary as
+        they're created.
+
+        :param boxes:       The relation's list of box declarations.
+        :param boxesByName: Maps the names of the box declarations to the
+                            declarations.
+        :param converters:  The relation's :class:`.VectorConverters`, used to
+                            compile each connection.
+        """
+        self.boxes = boxes
+        self.boxesByName = boxesByName
+        self.converters = converters
+        self._results = {}
+
+    def compile(self, expression):
+        """
+        Compiles the given :class:`ExpressionSyntax`, creating the function
+        boxes that it needs.
+
+        :returns: a list of the resulting connection declarations.
+        :raises:  a :class:`.CompilationError` if any static checks fail.
+        """
+        # Reparse the expression if any of its operands has a hyphenated name
+        # that isn't a box, reading the hyphens as subtractions instead
+        tree = expression.expression
+        if self._hasUnknownName(tree):
+            tree = _Parser(expression.text, self.boxesByName).parse()
+
+        connections = []
+        src, valueType = self._compileTree(
+            tree, connections, str(expression))[1:]
+
+        # Ensure that the result can be assigned to the target
+        target = expression.target
+        box = self.boxesByName.get(target.boxName)
+        targetType = 'Number' if target.component else (box and
+            box.getNodeValueType(target.nodeName, False))
+        if targetType in (_N, _V) and targetType != valueType:
+            raise CompilationError(
+                '"%s": A %s can not be assigned to the %s node "%s".' %
+                (str(expression), valueType.lower(), targetType.lower(),
+                str(target)))
+
+        connections.extend(
+            self.converters.compile(ConnectionSyntax(src, target)))
+        return connections
+
+    def _hasUnknownName(self, tree):
+        """
+        Returns whether any operand in the given expression tree has a
+        hyphenated name that doesn't refer to a declared box and node.
+        """
+        if isinstance(tree, NodeSyntax):
+            return '-' in str(tree) and not _isOperand(str(tree),
+                self.boxesByName)
+        return any(self._hasUnknownName(t) for t in tree[1:])
+
+    def _compileTree(self, tree, connections, text):
+        """
+        Compiles the given expression tree, reusing the box for any identical
+        operation that's already been compiled.
+
+        :returns: a (key, node, valueType) tuple, where key identifies the
+                  value, node is the :class:`.NodeSyntax` of the node that
+                  holds it, and valueType is "Number" or "Vector".
+        """
+        if isinstance(tree, NodeSyntax):
+            return ('node', str(tree)), tree, self._getValueType(tree, text)
+
+        # Compile the operands (in a canonical order, if their order doesn't
+        # matter), then find the box that operates on them
+        operation = tree[0]
+        operands = [self._compileTree(t, connections, text) for t in tree[1:]]
+        if operation in _COMMUTATIVE:
+            operands.sort(key=lambda operand: repr(operand[0]))
+        valueTypes = tuple(valueType for _, _, valueType in operands)
+        signature = _OPERATIONS.get((operation,) + valueTypes)
+        if signature is None and operation == 'div' and valueTypes == (_V, _N):
+            # Vectors are divided by scaling them by the inverse
+            return self._compileTree(('mul', tree[1], ('inv', tree[2])),
+                connections, text)
+        if signature is None:
+            raise CompilationError(
+                '"%s": The operation "%s" can not be applied to %s.' % (text,
+                operation, ' and '.join(t.lower() + 's' for t in valueTypes)))
+
+        groupName, typeName, inputNames, valueType = signature
+        key = (operation,) + tuple(key for key, _, _ in operands)
+        if key in self._results:
+            return (key,) + self._results[key]
+
+        # Create the box and connect each operand to its input
+        name = self._getUniqueName(_BOX_NAMES.get(operation, operation))
+        box = FunctionBoxDeclaration(name, groupName, typeName)
+        self.boxes.append(box)
+        self.boxesByName[name] = box
+        for inputName, (_, src, _) in zip(inputNames, operands):
+            connections.extend(self.converters.compile(
+                ConnectionSyntax(src, NodeSyntax(name, inputName))))
+
+        self._results[key] = (NodeSyntax(name, 'Result'), valueType)
+        return (key,) + self._results[key]
+
+    def _getValueType(self, node, text):
+        """
+        Returns the value type of the given operand: "Vector" if it's known
+        to be a vector, or otherwise "Number".
+
+        :raises: a :class:`.CompilationError` if the operand's box doesn't
+                 exist.
+        """
+        box = self.boxesByName.get(node.boxName)
+        if box is None:
+            raise CompilationError(
+                '"%s": "%s" is not a valid box name.' % (text, node.boxName))
+        if node.component:
+            return _N
+        return _V if box.getNodeValueType(node.nodeName, True) == _V else _N
+
+    def _getUniqueName(self, baseName):
+        """
+        Returns the given box name, or the name with a numeric suffix if it's
+        already taken.
+        """
+        name = baseName
+        suffix = 2
+        while name in self.boxesByName:
+            name = '%s-%d' % (baseName, suffix)
+            suffix += 1
+        return name
+
+class _Parser(object):
+    """
+    Parses the text of an expression into an expression tree, by recursive
+    descent.
+    """
+
+    def __init__(self, text, boxesByName=None):
+        """
+        Splits the given text into tokens, each a (kind, value) pair where
+        kind is "op" for operators and punctuation or "name" for operands.
+
+        :param boxesByName: Optionally, maps the names of the declared boxes
+                            to their declarations. If given, a hyphenated
+                            name that doesn't refer to a declared box and
+                            node is split into operands of subtractions.
+
+        :raises: a :class:`.ParsingError` if the text can't be tokenized, or
+                 a :class:`.CompilationError` if a hyphenated name can't be
+                 split into operands.
+        """
+        self.text = text
+        self.tokens = []
+        position = 0
+        while position < len(text):
+            match = _TOKEN_PATTERN.match(text, position)
+            if not match or match.end() == position:
+                raise ParsingError(
+                    '"%s": Invalid syntax for an expression.' % text)
+            if match.group(1):
+                self.tokens.append(('op', match.group(1)))
+            elif match.group(2).strip():
+                name = match.group(2).strip()
+                if boxesByName is not None and '-' in name:
+                    self.tokens.extend(self._splitName(name, boxesByName))
+                else:
+                    self.tokens.append(('name', name))
+            position = match.end()
+        self.position = 0
+
+    def _splitName(self, name, boxesByName):
+        """
+        Returns the tokens of a hyphenated name: the name itself if it refers
+        to a declared box and node, or otherwise the longest runs of its
+        hyphen-separated parts that do, separated by minus signs.
+
+        :raises: a :class:`.CompilationError` if the name can't be split into
+                 operands.
+        """
+        if _isOperand(name, boxesByName):
+            return [('name', name)]
+        parts = name.split('-')
+        tokens = []
+        start = 0
+        while start < len(parts):
+            for end in range(len(parts), start, -1):
+                operand = '-'.join(parts[start:end])
+                if _isOperand(operand, boxesByName):
+                    break
+            else:
+                raise CompilationError(
+                    '"%s": "%s" is not a valid box name. To subtract, put '
+                    'spaces around "-".' % (self.text, name))
+            if tokens:
+                tokens.append(('op', '-'))
+            tokens.append(('name', operand))
+            start = end
+        return tokens
+
+    def parse(self):
+        """
+        Parses the entire expression.
+
+        :returns: the expression tree.
+        :raises:  a :class:`.ParsingError` if the syntax is invalid.
+        """
+        tree = self._parseSum()
+        if self.position < len(self.tokens):
+            self._fail('Unexpected "%s"' % self.tokens[self.position][1])
+        return tree
+
+    def _parseSum(self):
+        """
+        Parses a sequence of terms separated by `+` or `-`.
+        """
+        tree = self._parseProduct()
+        while self._peek() in ('+', '-'):
+            operator = self._next()[1]
+            tree = (_OPERATORS[operator], tree, self._parseProduct())
+        return tree
+
+    def _parseProduct(self):
+        """
+        Parses a sequence of factors separated by `*` or `/`.
+        """
+        tree = self._parseUnary()
+        while self._peek() in ('*', '/'):
+            operator = self._next()[1]
+            tree = (_OPERATORS[operator], tree, self._parseUnary())
+        return tree
+
+    def _parseUnary(self):
+        """
+        Parses a factor, optionally negated.
+        """
+        if self._peek() == '-':
+            self._next()
+            return ('neg', self._parseUnary())
+        return self._parsePower()
+
+    def _parsePower(self):
+        """
+        Parses an operand, optionally raised to a (right-associative) power.
+        """
+        tree = self._parseOperand()
+        if self._peek() == '^':
+            self._next()
+            tree = ('pow', tree, self._parseUnary())
+        return tree
+
+    def _parseOperand(self):
+        """
+        Parses a parenthesized expression, a function call, or a node.
+        """
+        token = self._next()
+        if token == ('op', '('):
+            tree = self._parseSum()
+            self._expect(')')
+            return tree
+        if token is None or token[0] != 'name':
+            self._fail('Expected an operand')
+
+        name = token[1]
+        if self._peek() == '(':
+            if name not in _FUNCTIONS:
+                self._fail('Unknown function "%s"' % name)
+            self._next()
+            arguments = [self._parseSum()]
+            while self._peek() == ',':
+                self._next()
+                arguments.append(self._parseSum())
+            self._expect(')')
+            if len(arguments) != _FUNCTIONS[name]:
+                self._fail('The function "%s" takes %d argument(s)' %
+                    (name, _FUNCTIONS[name]))
+            return tuple([name] + arguments)
+
+        try:
+            float(name)
+        except ValueError:
+            pass
+        else:
+            self._fail('Constants are not supported')
+        try:
+            return NodeSyntax.parse(name)
+        except ParsingError:
+            # A hyphen may be a minus sign, which can't be known until the
+            # names of the relation's boxes are (see ExpressionCompiler)
+            if '-' not in name:
+                raise
+            return NodeSyntax(name, '')
+
+    def _peek(self):
+        """
+        Returns the value of the next operator token, or None if the next
+        token isn't an operator.
+        """
+        if self.position < len(self.tokens):
+            kind, value = self.tokens[self.position]
+            if kind == 'op':
+                return value
+        return None
+
+    def _next(self):
+        """
+        Consumes and returns the next token, or None at the end of the text.
+        """
+        if self.position >= len(self.tokens):
+            return None
+        self.position += 1
+        return self.tokens[self.position - 1]
+
+    def _expect(self, value):
+        """
+        Consumes the next token, which must be the given operator.
+        """
+        if self._next() != ('op', value):
+            self._fail('Expected "%s"' % value)
+
+    def _fail(self, message):
+        """
+        Raises a :class:`.ParsingError` with the given message.
+        """
+        raise ParsingError('"%s": %s in expression.' % (self.text, message))
+
+def _isOperand(name, boxesByName):
+    """
+    Returns whether the given operand name refers to a declared box and, if
+    its node name is hyphenated, a node of that box.
+    """
+    boxName, _, nodeName = name.partition('.')
+    box = boxesByName.get(boxName)
+    if box is None:
+        return False
+    if '-' not in nodeName:
+        return True
+    try:
+        node = NodeSyntax.parse(name)
+    except ParsingError:
+        return False
+
+    # The nodes of function boxes of known types are known, while any name
+    # might be a property of a scene component
+    if isinstance(box, FunctionBoxDeclaration) and \
+            findFunctionType(box.groupName, box.typeName):
+        return (box.getNodeValueType(node.nodeName, True) is not None or
+            box.getNodeValueType(node.nodeName, False) is not None)
+    return box.supportsNode(node.nodeName)
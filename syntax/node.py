@@ -1,54 +1,72 @@
 """
 Defines classes for parsing and compiling node declarations, which consist of
 either a plain box name (indicating a macro input or output) or a box name and
-node name separated by a dot::
+node name separated by a dot. Either may be followed by the name of a single
+component (X, Y, or Z) of a vector node (see :mod:`.syntax.vector`)::
 
-    <boxname.nodename|boxname>
+    <boxname.nodename|boxname>[.X|.Y|.Z]
 """
 
-from fbrelation.utility import find
-
 from fbrelation.exceptions import ParsingError, CompilationError
 
+COMPONENTS = ('X', 'Y', 'Z')
+""" The names of the components of a vector node. """
+
 class NodeSyntax(object):
     """
     Represents the abstract syntax for an animation node reference within a
     connection declaration. Consists of a box name and an optional node name to
     clarify which of the box's nodes is involved in the connection. If the node
     name is blank, it is assumed that the box name by itself is sufficient to
-    deduce the node, as in the case of a macro input or output box.
+    deduce the node, as in the case of a macro input or output box. A node
+    reference may also name a single component of a vector node.
     """
 
-    def __init__(self, boxName, nodeName):
+    def __init__(self, boxName, nodeName, component=None):
         """
         Initializes a new node syntax object to refer to some optionally named
         node in a box with the given name.
+
+        :param component: Optionally, the name of the component of the node
+                          (if it's a vector) that's referred to.
         """
         self.boxName = boxName
         self.nodeName = nodeName
+        self.component = component
 
     def __str__(self):
         """
         Converts the syntax object into its raw string representation.
         """
+        text = self.boxName
         if self.nodeName:
-            return '%s.%s' % (self.boxName, self.nodeName)
-        return self.boxName
+            text = '%s.%s' % (text, self.nodeName)
+        if self.component:
+            text = '%s.%s' % (text, self.component)
+        return text
 
     def compile(self, boxes, isSrc):
         """
         Compiles this node syntax structure into a :class:`.NodeDeclaration`
         object as either a source or a destination node.
 
-        :param boxes: The list of compiled box declarations.
+        :param boxes: Maps the names of the compiled box declarations to the
+                      declarations.
         :param isSrc: If True, the node is a source node (i.e., on the left
                       side of the arrow in the connection declaration).
 
         :returns: The newly created node declaration.
         :raises:  a :class:`.CompilationError` if any static checks fail.
         """
+        # Components can only be compiled along with the converter boxes that
+        # extract or combine them
+        if self.component:
+            raise CompilationError(
+                '"%s": Vector components can only be referred to in '
+                'connection declarations.' % str(self))
+
         # Find the box declaration object that owns the node in question
-        box = find(lambda b: b.name == self.boxName, boxes)
+        box = boxes.get(self.boxName)
         if not box:
             raise CompilationError(
                 '"%s" is not a valid box name.' % self.boxName)
@@ -77,13 +95,16 @@ class NodeSyntax(object):
             return cls(text.strip(), '')
 
         # Otherwise, split the string on the dot, which should result in a
-        # list with exactly two elements
-        tokens = text.split('.')
+        # list with exactly two elements, or three if a component is given
+        tokens = [token.strip() for token in text.split('.')]
+        component = None
+        if len(tokens) == 3 and tokens[2] in COMPONENTS:
+            component = tokens.pop()
         if len(tokens) != 2 or not tokens[0] or not tokens[1]:
             raise ParsingError(
                 '"%s": Invalid syntax for a connection declaration. Expected '
                 'box name dot attribute name.' % text.strip())
 
-        # Construct a new NodeSyntax object from the pair
+        # Construct a new NodeSyntax object from the tokens
         boxName, nodeName = tokens
-        return cls(boxName.strip(), nodeName.strip())
+        return cls(boxName, nodeName, component)
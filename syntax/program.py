@@ -1,7 +1,10 @@
 """
 Defines classes for parsing and compiling programs, which consist of a series
-of relation constraint declarations::
+of relation constraint declarations, optionally preceded by directives which
+import the relations of other programs (see :mod:`.modules`)::
 
+    import "<path>"
+    ...
     <relation>
     <relation>
     ...
@@ -10,22 +13,39 @@ of relation constraint declarations::
 
 import re
 
+from fbrelation.exceptions import CompilationError
+
+from fbrelation.profiling import NULL_PROFILE
+
 from fbrelation.syntax.relation import RelationSyntax
 
 from fbrelation.declarations.program import ProgramDeclaration
 
+from fbrelation.validation import WARN, validateProgram
+
+_RELATION_PATTERN = re.compile(r'.*\s*{[^{}]*}')
+_IMPORT_PATTERN = re.compile(r'^\s*(?:import|include)\s+"([^"]*)"\s*$', re.M)
+_MACRO_PATTERN = re.compile(r'\bmacro\s*=\s*"([^"]*)"')
+
 class ProgramSyntax(object):
     """
     Represents the abstract syntax of an entire program, which consists of a
-    series of relation declarations.
+    series of relation declarations and the names of any imported modules.
     """
 
-    def __init__(self, relations):
+    def __init__(self, relations, imports=None, path=None):
         """
         Initializes a new program syntax structure with the given list of
         relation syntax objects.
+
+        :param imports: Optionally, a list of the names of modules imported
+                        by the program, as written.
+        :param path:    Optionally, the path of the file the program was read
+                        from, used to find modules relative to it.
         """
         self.relations = relations
+        self.imports = imports or []
+        self.path = path
 
     def __str__(self):
         """
@@ -33,37 +53,130 @@ class ProgramSyntax(object):
         to its input text.
         """
         relationStrings = [str(relation) for relation in self.relations]
+        if self.imports:
+            relationStrings.insert(0, '\n'.join(
+                ['import "%s"' % name for name in self.imports]))
         return '%s\n' % '\n\n'.join(relationStrings)
 
-    def compile(self):
+    def compile(self, profile=None, resolver=None, validation=WARN):
         """
         Compiles the entire program from its abstract syntax structure into a
         :class:`.ProgramDeclaration`.
 
+        :param profile:  Optionally, a :class:`.Profile` in which to record
+                         the time spent compiling each relation.
+        :param resolver: Optionally, the :class:`.ModuleResolver` used to find
+                         and compile imported modules. Defaults to
+                         :data:`.defaultResolver`.
+        :param validation: The mode in which to check the program's
+                           connection graphs for cycles and fan-in conflicts
+                           (see :mod:`.validation`), or None to skip the
+                           check.
+
         :returns: the resulting program declaration.
         :raises:  a :class:`.CompilationError` if the program fails to
-                  statically check.
+                  statically check, or if an imported module can't be found or
+                  compiled.
         """
+        profile = profile or NULL_PROFILE
+
+        # Make the relations of each imported module available for use as
+        # macros, loading each module (or reusing its cached compilation)
+        modules = []
+        relationsByName = {}
+        if self.imports:
+            from fbrelation.modules import defaultResolver
+            resolver = resolver or defaultResolver
+            for name in self.imports:
+                with profile.measure(name, 'import'):
+                    module = resolver.load(resolver.find(name, self.path))
+                modules.append(module)
+                for relation in module.program.relations:
+                    relationsByName.setdefault(relation.name, relation)
+        importedNames = set(relationsByName)
+
         # Compile each relation constraint one-by-one, collecting the newly
         # created declarations into a list
         relationDeclarations = []
         for relationSyntax in self.relations:
-            
-            # Pass the list of previously-created relations to the new one
-            relation = relationSyntax.compile(relationDeclarations)
+
+            # Relations can't be distinguished from imported relations by name
+            if relationSyntax.name in importedNames:
+                raise CompilationError(
+                    'A relation constraint named "%s" has already been '
+                    'imported.' % relationSyntax.name)
+
+            # Pass the previously-created relations to the new one, indexed by
+            # name (macros refer to the first relation declared with a name)
+            with profile.measure(relationSyntax.name, 'compile'):
+                relation = relationSyntax.compile(relationsByName)
             relationDeclarations.append(relation)
+            relationsByName.setdefault(relation.name, relation)
 
-        # Construct a new program from the accumulated relation declarations
-        return ProgramDeclaration(relationDeclarations)
+        # Construct a new program from the accumulated relation declarations,
+        # then check its connection graphs
+        program = ProgramDeclaration(relationDeclarations, modules)
+        if validation:
+            with profile.measure('validation', 'compile'):
+                validateProgram(program, validation)
+        return program
 
     @classmethod
-    def parse(cls, text):
+    def parse(cls, text, path=None, targets=None):
         """
         Parses the given input text to produce a new ProgramSyntax object.
 
+        :param path:    Optionally, the path of the file the text was read
+                        from, used to find imported modules relative to it.
+        :param targets: Optionally, the names of the only relations needed
+                        from the program. Only these relations, and the
+                        relations they use as macros (directly or
+                        indirectly), are parsed; the others are skipped
+                        without being checked.
+
         :returns: the newly created syntax structure for the entire program.
         :raises:  a :class:`.ParsingError` if the program contains any invalid
-                  syntax.
+                  syntax, or a :class:`.CompilationError` if any of the
+                  targets are not declared in the program.
         """
-        return ProgramSyntax([RelationSyntax.parse(t) for
-            t in re.compile(r'.*\s*{[^{}]*}').findall(text)])
+        blocks = _RELATION_PATTERN.findall(text)
+        if targets is not None:
+            blocks = _selectBlocks(blocks, targets)
+
+        # Import directives may appear anywhere outside of a relation
+        return ProgramSyntax(
+            [RelationSyntax.parse(t) for t in blocks],
+            _IMPORT_PATTERN.findall(_RELATION_PATTERN.sub('', text)),
+            path)
+
+def _selectBlocks(blocks, targets):
+    """
+    Returns the text of the relation blocks declaring the given target
+    relations and the relations they use as macros, in program order. The
+    blocks are scanned for macro attributes without being parsed.
+
+    :raises: a :class:`.CompilationError` if any of the targets are not
+             declared.
+    """
+    # Index the blocks by relation name, noting which macros each one uses
+    names = [block[:block.find('{')].strip() for block in blocks]
+    macrosByName = {}
+    for name, block in zip(names, blocks):
+        macrosByName.setdefault(name, set()).update(
+            _MACRO_PATTERN.findall(block))
+
+    # Find the closure of the targets over macro references, ignoring macros
+    # that aren't declared here (being imported, for instance)
+    for target in targets:
+        if target not in macrosByName:
+            raise CompilationError(
+                'No relation constraint named "%s" is declared.' % target)
+    selected = set(targets)
+    pending = list(targets)
+    while pending:
+        for macro in macrosByName[pending.pop()]:
+            if macro in macrosByName and macro not in selected:
+                selected.add(macro)
+                pending.append(macro)
+
+    return [block for name, block in zip(names, blocks) if name in selected]
@@ -1,15 +1,15 @@
 """
 Defines classes for parsing and compiling relation declarations, which consist
-of a name, then a series of newline-separated box and connection declarations
-inside a block of curly braces. Shell-style comments (prefixed with `#`) may be
-included within the body::
+of a name, then a series of newline-separated box, connection, and expression
+declarations (see :mod:`.syntax.expression`) inside a block of curly braces.
+Shell-style comments (prefixed with `#`) may be included within the body::
 
     name
     {
-        <box|connection>
-        <box|connection>
+        <box|connection|expression>
+        <box|connection|expression>
         ...
-        <box|connection>
+        <box|connection|expression>
     }
 """
 
@@ -17,33 +17,38 @@ from fbrelation.exceptions import ParsingError
 
 from fbrelation.syntax.box import BoxSyntax
 from fbrelation.syntax.connection import ConnectionSyntax
+from fbrelation.syntax.vector import VectorConverters
+from fbrelation.syntax.expression import ExpressionSyntax, ExpressionCompiler
 
 from fbrelation.declarations.relation import RelationDeclaration
 
 class RelationSyntax(object):
     """
     Represents the abstract syntax of a relation constraint declaration,
-    consisting of a name, a list of box syntax objects, and a list of
-    connection syntax objects. Note that order is preserved among boxes and
-    among connections respectively, but that the order of connections relative
-    to boxes is insignificant.
+    consisting of a name, a list of box syntax objects, a list of connection
+    syntax objects, and a list of expression syntax objects. Note that order is
+    preserved among boxes, among connections, and among expressions
+    respectively, but that their order relative to each other is
+    insignificant.
     """
 
-    def __init__(self, name, boxes, connections):
+    def __init__(self, name, boxes, connections, expressions=None):
         """
         Initializes a new relation syntax object with the given name and the
-        the provided box and connection structures.
+        the provided box, connection, and expression structures.
         """
         self.name = name
         self.boxes = boxes
         self.connections = connections
+        self.expressions = expressions or []
 
     def __str__(self):
         """
         Converts the syntax object into its raw string representation.
         """
         boxStrings = [str(box) for box in self.boxes]
-        connectionStrings = [str(connection) for connection in self.connections]
+        connectionStrings = [str(connection) for connection in
+            self.connections + self.expressions]
 
         return '%s\n{\n    %s\n\n    %s\n}' % (
             self.name,
@@ -55,24 +60,40 @@ class RelationSyntax(object):
         Checks and compiles this relation constraint from its abstract syntax
         into a new :class:`.RelationDeclaration.` object.
 
-        :param relations: The list of relation declarations compiled so far.
-                          Used to resolve macro references.
+        :param relations: Maps the names of the relation declarations compiled
+                          so far to the declarations. Used to resolve macro
+                          references.
 
         :returns: the newly created relation declaration.
         :raises:  a :class:`.CompilationError` if any static checks fail.
         """
-        # Compile each relation one-by-one, accumulating them into a list
+        # Compile each box one-by-one, accumulating them into a list and
+        # indexing them by name so that later boxes and connections can be
+        # checked against them
         boxDeclarations = []
+        boxesByName = {}
         for boxSyntax in self.boxes:
-            box = boxSyntax.compile(boxDeclarations, relations)
+            box = boxSyntax.compile(boxesByName, relations)
             boxDeclarations.append(box)
+            boxesByName[box.name] = box
 
-        # With all the boxes compiled, compile all of the connections and use
+        # With all the boxes compiled, compile all of the connections (adding
+        # converter boxes for any that refer to vector components) and use
         # both to construct and return a new relation declaration
+        converters = VectorConverters(boxDeclarations, boxesByName)
+        connectionDeclarations = []
+        for connectionSyntax in self.connections:
+            connectionDeclarations.extend(
+                converters.compile(connectionSyntax))
+
+        # Then compile the expressions into function boxes and connections
+        expressions = ExpressionCompiler(
+            boxDeclarations, boxesByName, converters)
+        for expressionSyntax in self.expressions:
+            connectionDeclarations.extend(
+                expressions.compile(expressionSyntax))
         return RelationDeclaration(
-            self.name,
-            boxDeclarations,
-            [c.compile(boxDeclarations) for c in self.connections])
+            self.name, boxDeclarations, connectionDeclarations)
 
     @classmethod
     def parse(cls, text):
@@ -99,13 +120,16 @@ class RelationSyntax(object):
                 'Invalid syntax for a relation constraint declaration. '
                 'Expected the block to be explicitly named.')
 
-        # Collect the individual declarations (either box or connection)
-        # line-by-line
+        # Collect the individual declarations (box, connection, or
+        # expression) line-by-line
         boxDeclarationsText = []
         connectionDeclarationsText = []
+        expressionDeclarationsText = []
         for line in cls.splitBodyLines(text[openingPos+1:closingPos]):
             if '->' in line:
                 connectionDeclarationsText.append(line)
+            elif ExpressionSyntax.matches(line):
+                expressionDeclarationsText.append(line)
             else:
                 boxDeclarationsText.append(line)
 
@@ -114,7 +138,8 @@ class RelationSyntax(object):
         return RelationSyntax(
             name,
             [BoxSyntax.parse(t) for t in boxDeclarationsText],
-            [ConnectionSyntax.parse(t) for t in connectionDeclarationsText])
+            [ConnectionSyntax.parse(t) for t in connectionDeclarationsText],
+            [ExpressionSyntax.parse(t) for t in expressionDeclarationsText])
 
     @classmethod
     def splitBodyLines(cls, text):
@@ -0,0 +1,160 @@
+"""
+Defines the compilation of connections that refer to single components of
+vector nodes. Such connections are shorthand for connections through
+converter boxes, which are created automatically::
+
+    cube.Translation.X -> lerp.a
+    lerp.r -> camera.Translation.Y
+
+compiles as if it were written::
+
+    cube-translation [group="Converters", type="Vector to Number"]
+    camera-translation [group="Converters", type="Number to Vector"]
+    cube.Translation -> cube-translation.V
+    cube-translation.X -> lerp.a
+    camera-translation.Result -> camera.Translation
+    lerp.r -> camera-translation.Y
+
+Only one converter is created for each vector node in each direction, and it's
+shared by every connection that refers to the node's components. A macro
+input or output box of type "Vector" is referred to by box name alone, so its
+components are written as `box.X`.
+
+A node's components may only be referred to if the node is known to be a
+vector: from the :mod:`.catalog` for function boxes, from the type of macro
+inputs and outputs, and for senders and receivers, from the catalog's list of
+vector properties or the box's `vectors` attribute::
+
+    null [sender="Null", vectors="Offset, Aim Vector"]
+"""
+
+from fbrelation.exceptions import CompilationError
+
+from fbrelation.syntax.node import NodeSyntax, COMPONENTS
+
+from fbrelation.declarations.box import FunctionBoxDeclaration
+from fbrelation.declarations.connection import ConnectionDeclaration
+
+class VectorConverters(object):
+    """
+    Compiles the connections of a single relation, creating and sharing
+    converter boxes for any connections that refer to vector components.
+    """
+
+    def __init__(self, boxes, boxesByName):
+        """
+        Initializes a new set of converters for the relation with the given
+        boxes. Converter boxes are added to both the list and the dictionary
+        as they're created.
+
+        :param boxes:       The relation's list of box declarations.
+        :param boxesByName: Maps the names of the box declarations to the
+                            declarations.
+        """
+        self.boxes = boxes
+        self.boxesByName = boxesByName
+        self._converters = {}
+
+    def compile(self, connection):
+        """
+        Compiles the given :class:`.ConnectionSyntax`, creating any converter
+        boxes that it needs.
+
+        :returns: a list of the resulting connection declarations: the given
+                  connection, preceded by the connection of each new converter
+                  box to its vector node.
+        :raises:  a :class:`.CompilationError` if any static checks fail, in
+                  which case no converter boxes are created.
+        """
+        connections = []
+        count = len(self.boxes)
+        try:
+            src = self._getNode(connection.src, True, connections)
+            dst = self._getNode(connection.dst, False, connections)
+            connections.append(ConnectionDeclaration(
+                src.compile(self.boxesByName, isSrc = True),
+                dst.compile(self.boxesByName, isSrc = False)))
+        except CompilationError:
+            # Remove any converters created for the failed connection, since
+            # the connections to their vector nodes are discarded with it
+            for box in self.boxes[count:]:
+                del self.boxesByName[box.name]
+            del self.boxes[count:]
+            self._converters = dict((key, converter) for key, converter in
+                self._converters.items()
+                if self.boxesByName.get(converter.name) is converter)
+            raise
+        return connections
+
+    def _getNode(self, node, isSrc, connections):
+        """
+        Returns the node syntax to compile in place of the given node: the
+        node itself, or if it refers to a vector component, the component's
+        node on a converter box.
+        """
+        component = node.component
+        nodeName = node.nodeName
+
+        # Macro tools are referred to without a node name, so a component
+        # appears in its place
+        box = self.boxesByName.get(node.boxName)
+        if (not component and nodeName in COMPONENTS and box is not None and
+                (box.isMacroTool(True) or box.isMacroTool(False))):
+            component, nodeName = nodeName, ''
+        if not component:
+            return node
+
+        # Ensure that the node exists and is known to be a vector
+        vectorNode = NodeSyntax(node.boxName, nodeName)
+        if box is None:
+            raise CompilationError(
+                '"%s" is not a valid box name.' % node.boxName)
+        if not box.supportsNode(nodeName):
+            raise CompilationError(
+                '"%s" is not a valid node name for the box named "%s".' %
+                (nodeName, node.boxName))
+        if box.getNodeValueType(nodeName, isSrc) != 'Vector':
+            raise CompilationError(
+                '"%s": The node "%s" is not known to be a vector.' %
+                (str(node), str(vectorNode)))
+
+        converter = self._getConverter(vectorNode, isSrc, connections)
+        return NodeSyntax(converter.name, component)
+
+    def _getConverter(self, node, isSrc, connections):
+        """
+        Returns the converter box which splits (for a source) or combines (for
+        a destination) the components of the given vector node, creating it
+        and connecting it to the node if it doesn't yet exist.
+        """
+        key = (node.boxName, node.nodeName, isSrc)
+        converter = self._converters.get(key)
+        if converter is not None:
+            return converter
+
+        # Name the converter after the node, ensuring that it's unique
+        baseName = ('%s-%s' % (node.boxName, node.nodeName or 'xyz')).lower(
+            ).replace(' ', '-')
+        name = baseName
+        suffix = 2
+        while name in self.boxesByName:
+            name = '%s-%d' % (baseName, suffix)
+            suffix += 1
+
+        # Create the converter and connect it to the vector node
+        if isSrc:
+            converter = FunctionBoxDeclaration(
+                name, 'Converters', 'Vector to Number')
+            src, dst = node, NodeSyntax(name, 'V')
+        else:
+            converter = FunctionBoxDeclaration(
+                name, 'Converters', 'Number to Vector')
+            src, dst = NodeSyntax(name, 'Result'), node
+        self.boxes.append(converter)
+        self.boxesByName[name] = converter
+        connections.append(ConnectionDeclaration(
+            src.compile(self.boxesByName, isSrc = True),
+            dst.compile(self.boxesByName, isSrc = False)))
+
+        self._converters[key] = converter
+        return converter
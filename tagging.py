@@ -0,0 +1,193 @@
+"""
+`fbrelation.tagging`
+
+Tags the constraints created by programs, so that they can be found and
+deleted again later without relying on their names (which MotionBuilder may
+have changed to keep them unique). Each constraint is given two custom
+properties as it's created: the id of the program that created it, and the
+structural hash of the relation it was created from (see
+:meth:`.RelationDeclaration.getStructuralHash`)::
+
+    fbrelation.loads(text, programId='rig')
+    ...
+    fbrelation.tagging.teardown('rig')   # deletes the rig's constraints
+    fbrelation.loads(text, programId='rig')
+
+A program's id defaults to a hash of its structure (see
+:meth:`.ProgramDeclaration.getProgramId`), so loading the same program twice
+tags both sets of constraints alike. Constraints are added to
+:data:`defaultIndex` as they're tagged, so finding the constraints of a
+program doesn't search the scene. Constraints created in an earlier session
+(and saved with the scene) are only indexed once
+:meth:`ConstraintIndex.refresh` reads the tags of every constraint in the
+scene.
+
+Relations that serve only as macros and are shared between programs through
+the :mod:`.registry` are not tagged, since tearing down one program must not
+delete a constraint that others still use.
+"""
+
+from fbrelation.backend import sdk
+
+from fbrelation.exceptions import ExecutionError
+
+PROGRAM_PROPERTY = 'fbrelation Program'
+""" The name of the property holding the id of a constraint's program. """
+
+HASH_PROPERTY = 'fbrelation Hash'
+""" The name of the property holding the hash of a constraint's relation. """
+
+class ConstraintIndex(object):
+    """
+    Indexes tagged constraints by program id.
+    """
+
+    def __init__(self):
+        """
+        Initializes a new, empty index.
+        """
+        self._constraints = {}
+
+    def __len__(self):
+        """
+        Returns the number of constraints in the index.
+        """
+        return sum(len(c) for c in self._constraints.values())
+
+    def add(self, programId, constraint):
+        """
+        Adds a constraint to the index under the given program id.
+        """
+        self._constraints.setdefault(programId, []).append(constraint)
+
+    def discard(self, programId, constraint):
+        """
+        Removes a constraint from the index, if it's there, without deleting
+        it.
+        """
+        constraints = self._constraints.get(programId, [])
+        if constraint in constraints:
+            constraints.remove(constraint)
+            if not constraints:
+                del self._constraints[programId]
+
+    def findGenerated(self, programId):
+        """
+        Returns a list of the indexed constraints created by the program with
+        the given id, in order of creation.
+        """
+        return list(self._constraints.get(programId, []))
+
+    def getProgramIds(self):
+        """
+        Returns a sorted list of the ids of the programs with indexed
+        constraints.
+        """
+        return sorted(self._constraints)
+
+    def teardown(self, programId):
+        """
+        Deletes the constraints created by the program with the given id, in
+        reverse order of creation (so that constraints are deleted before the
+        macros they use), and removes them from the index. Constraints that
+        have already been deleted from the scene are skipped.
+
+        :returns: the number of constraints deleted.
+        :raises:  the SDK's error if a constraint that's still in the scene
+                  can't be deleted, in which case it and the constraints not
+                  yet deleted are kept in the index.
+        """
+        constraints = self._constraints.pop(programId, [])
+        count = 0
+        for i in reversed(range(len(constraints))):
+            # Deleting a constraint that's already gone (deleted by hand, or
+            # lost when a new scene was opened) raises an error whose type
+            # varies between versions of the SDK, so the scene is only
+            # searched for the constraint once deleting it has failed
+            try:
+                constraints[i].FBDelete()
+            except Exception:
+                if _isInScene(constraints[i]):
+                    self._constraints[programId] = constraints[:i + 1]
+                    raise
+                continue
+            count += 1
+        return count
+
+    def refresh(self):
+        """
+        Rebuilds the index from the tags of every constraint in the scene,
+        discarding any constraints that no longer exist.
+        """
+        self._constraints = {}
+        for constraint in sdk.FBSystem().Scene.Constraints:
+            tag = getTag(constraint)
+            if tag is not None:
+                self.add(tag[0], constraint)
+
+    def clear(self):
+        """
+        Discards every indexed constraint, without deleting any.
+        """
+        self._constraints = {}
+
+defaultIndex = ConstraintIndex()
+""" The index to which every constraint is added as it's tagged. """
+
+def tagConstraint(constraint, programId, relationHash, index=None):
+    """
+    Tags the given constraint with the id of the program that created it and
+    the hash of the relation it was created from, and adds it to the index.
+
+    :param index: The :class:`ConstraintIndex` to add the constraint to, or
+                  :data:`defaultIndex` if None.
+
+    :raises: an :class:`.ExecutionError` if the properties can not be
+             created.
+    """
+    for name, value in ((PROGRAM_PROPERTY, programId),
+            (HASH_PROPERTY, relationHash)):
+        prop = constraint.PropertyList.Find(name)
+        if not prop:
+            prop = constraint.PropertyCreate(name,
+                sdk.FBPropertyType.kFBPT_charptr, 'String', False, True, None)
+        if not prop:
+            raise ExecutionError(
+                'Could not create a property named "%s" on the constraint '
+                '"%s".' % (name, constraint.Name))
+        prop.Data = value
+    (defaultIndex if index is None else index).add(programId, constraint)
+
+def getTag(constraint):
+    """
+    Returns a (programId, relationHash) pair read from the tags of the given
+    constraint, or None if it's not tagged.
+    """
+    programProperty = constraint.PropertyList.Find(PROGRAM_PROPERTY)
+    if not programProperty:
+        return None
+    hashProperty = constraint.PropertyList.Find(HASH_PROPERTY)
+    return (programProperty.Data,
+        hashProperty.Data if hashProperty else None)
+
+def _isInScene(constraint):
+    """
+    Returns whether the given constraint is still in the scene.
+    """
+    return constraint in list(sdk.FBSystem().Scene.Constraints)
+
+def findGenerated(programId):
+    """
+    Returns a list of the constraints created by the program with the given
+    id, from :data:`defaultIndex`.
+    """
+    return defaultIndex.findGenerated(programId)
+
+def teardown(programId):
+    """
+    Deletes the constraints created by the program with the given id, as
+    found in :data:`defaultIndex`.
+
+    :returns: the number of constraints deleted.
+    """
+    return defaultIndex.teardown(programId)
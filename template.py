@@ -0,0 +1,186 @@
+"""
+`fbrelation.template`
+
+Defines parametric relation templates. A template is written like any other
+relation, but with parameters (`$name`, where the name consists of letters and
+digits) in its name, its box names, and the component names of its sender and
+receiver boxes::
+
+    finger_$side_$digit
+    {
+        knuckle [sender="$side_Knuckle_$digit"]
+        tip     [receiver="$side_Tip_$digit"]
+        ...
+        knuckle.Rotation -> tip.Rotation
+    }
+
+The template is compiled only once, with its parameters left in place.
+Instantiating it with a set of values binds each parameter, producing a
+:class:`.RelationDeclaration` which shares every box and connection that does
+not depend on a parameter with the template itself, so each instance costs
+only as much as the boxes and connections that have to be renamed::
+
+    template = compileTemplate(text)
+    relations = [template.instantiate({'side': side, 'digit': str(digit)})
+        for side in ('left', 'right') for digit in range(1, 6)]
+
+Parameters may not appear in any other attributes (group, type, macro, input,
+or output) or in node names, since changing those would change the structure
+of the relation rather than just the scene components it's bound to.
+"""
+
+import copy
+
+from string import Template
+
+from fbrelation.exceptions import CompilationError
+
+from fbrelation.syntax.relation import RelationSyntax
+
+
+_BINDABLE_ATTRIBUTES = ('sender', 'receiver')
+
+class _ParameterTemplate(Template):
+    """
+    A string.Template whose parameter names may not contain underscores, so
+    that a parameter can be followed directly by an underscore. (Braces can't
+    be used to delimit parameters, since they delimit relations.)
+    """
+    idpattern = r'[a-z][a-z0-9]*'
+
+class RelationTemplate(object):
+    """
+    Represents a relation compiled once with its parameters unbound, which
+    can be instantiated any number of times with different values.
+    """
+
+    def __init__(self, relation):
+        """
+        Initializes a new template from a relation declaration whose name,
+        box names, and component names may contain parameters. Consider using
+        :meth:`compile` or :func:`compileTemplate` instead.
+        """
+        self.relation = relation
+        """ The compiled relation, with its parameters unbound. """
+
+        parameters = set()
+        self._name = _getTemplate(relation.name, parameters)
+
+        # Find the boxes whose names or components depend on a parameter
+        self._boxes = []
+        for index, box in enumerate(relation.boxes):
+            nameTemplate = _getTemplate(box.name, parameters)
+            componentTemplate = _getTemplate(
+                getattr(box, 'componentName', ''), parameters)
+            if nameTemplate or componentTemplate:
+                self._boxes.append((index, nameTemplate, componentTemplate))
+        self._renamesBoxes = any(t[1] for t in self._boxes)
+
+        self.parameters = sorted(parameters)
+        """ The sorted names of the template's parameters. """
+
+    def instantiate(self, values):
+        """
+        Binds the template's parameters to the given values.
+
+        :param values: Maps the name of each parameter to its value.
+
+        :returns: a new :class:`.RelationDeclaration`.
+        :raises:  a :class:`.CompilationError` if a value is missing for any
+                  parameter, or if binding the parameters gives two boxes the
+                  same name.
+        """
+        # Copy and rebind each box that depends on a parameter, sharing the
+        # rest of the boxes and connections with the template
+        replacements = {}
+        for index, nameTemplate, componentTemplate in self._boxes:
+            original = self.relation.boxes[index]
+            box = copy.copy(original)
+            if nameTemplate:
+                box.name = _substitute(nameTemplate, values)
+            if componentTemplate:
+                box = box.bind(_substitute(componentTemplate, values))
+            replacements[id(original)] = box
+        relation = self.relation.replaceBoxes(
+            replacements, _substitute(self._name, values))
+
+        # Ensure that binding the parameters didn't produce duplicate names
+        if self._renamesBoxes and \
+                len(set(b.name for b in relation.boxes)) < len(relation.boxes):
+            raise CompilationError(
+                'Instantiating the template "%s" produces more than one box '
+                'with the same name.' % self.relation.name)
+        return relation
+
+    @classmethod
+    def compile(cls, syntax, relations=None):
+        """
+        Checks and compiles a new template from the given
+        :class:`.RelationSyntax`.
+
+        :param relations: Optionally maps the names of relation declarations
+                          to the declarations. Used to resolve macro
+                          references.
+
+        :returns: the newly created template.
+        :raises:  a :class:`.CompilationError` if a parameter appears where
+                  it's not allowed, or if any static checks fail.
+        """
+        # Parameters may only be bound in names and component names
+        for box in syntax.boxes:
+            for key in box.attributes.attributes:
+                if key not in _BINDABLE_ATTRIBUTES and \
+                        _getTemplate(box[key], set()):
+                    raise CompilationError(
+                        '"%s": Parameters may not be used in the "%s" '
+                        'attribute.' % (str(box), key))
+        for connection in syntax.connections:
+            for node in (connection.src, connection.dst):
+                if _getTemplate(node.nodeName, set()):
+                    raise CompilationError(
+                        '"%s": Parameters may not be used in node names.' %
+                        str(connection))
+
+        return cls(syntax.compile(relations or {}))
+
+def compileTemplate(text, relations=None):
+    """
+    Parses and compiles a new :class:`RelationTemplate` from the text of a
+    single relation.
+
+    :param relations: Optionally maps the names of relation declarations to
+                      the declarations. Used to resolve macro references.
+
+    :raises: a :class:`.ParsingError` if the syntax is invalid, or a
+             :class:`.CompilationError` if the template fails to compile.
+    """
+    return RelationTemplate.compile(RelationSyntax.parse(text), relations)
+
+def _getTemplate(text, parameters):
+    """
+    Returns a template for the given text if it contains any
+    parameters, adding their names to the given set. Otherwise, returns None.
+    """
+    template = _ParameterTemplate(text)
+    names = [m.group('named') or m.group('braced') for m in
+        template.pattern.finditer(text)]
+    names = [n for n in names if n]
+    if not names:
+        return None
+    parameters.update(names)
+    return template
+
+def _substitute(template, values):
+    """
+    Substitutes the given values into the given template, if any.
+
+    :raises: a :class:`.CompilationError` if a value is missing.
+    """
+    if template is None:
+        return None
+    try:
+        return template.substitute(values)
+    except KeyError as e:
+        raise CompilationError(
+            '"%s": No value was given for the parameter %s.' %
+            (template.template, e))
@@ -0,0 +1,278 @@
+"""
+`fbrelation.validation`
+
+Checks the connection graph of each relation for two problems that
+MotionBuilder doesn't report, but which cause evaluation to thrash or
+connections to be silently dropped:
+
+- **Cycles**, where a box's output feeds back (directly or through other
+  boxes) into its own input. Macro boxes are seen through: a path enters a
+  macro box at one of its inputs and leaves only at the outputs that the
+  macro's relation actually connects that input to, so a macro box whose
+  output feeds its own input is only a cycle if the macro connects the two.
+- **Fan-in conflicts**, where more than one connection drives the same input
+  node.
+
+The pass runs in time linear in the size of each relation (using Tarjan's
+strongly connected components algorithm and an index of destination nodes),
+and it's run on every program as it's compiled. In `"strict"` mode, any
+problem raises a :class:`.CompilationError`; in `"warn"` mode, each problem is
+reported as a :class:`.ValidationWarning` and compilation continues::
+
+    fbrelation.loads(text, validation='strict')
+
+Each problem is reported with the text of the connections involved.
+"""
+
+import warnings
+
+from fbrelation.exceptions import CompilationError, ValidationWarning
+
+from fbrelation.declarations.box import MacroBoxDeclaration
+from fbrelation.declarations.node import MacroNodeDeclaration
+
+STRICT = 'strict'
+""" The mode in which problems raise a :class:`.CompilationError`. """
+
+WARN = 'warn'
+""" The mode in which problems are reported as warnings. """
+
+class GraphIssue(object):
+    """
+    Describes a problem found in the connections of a relation.
+    """
+
+    def __init__(self, relationName, kind, description, connections):
+        """
+        Initializes a new issue.
+
+        :param kind:        Either "cycle" or "fan-in".
+        :param connections: The connection declarations involved.
+        """
+        self.relationName = relationName
+        self.kind = kind
+        self.description = description
+        self.connections = connections
+
+    def __str__(self):
+        """
+        Describes the issue, followed by the text of each connection involved
+        on its own line.
+        """
+        return '%s: %s:\n%s' % (self.relationName, self.description,
+            '\n'.join(['    %s' % c for c in self.connections]))
+
+    @property
+    def lines(self):
+        """
+        The text of each connection involved, as it'd be written in the
+        relation's declaration.
+        """
+        return [str(connection) for connection in self.connections]
+
+def validateProgram(program, mode=WARN):
+    """
+    Checks each relation in the given program for cycles and fan-in
+    conflicts.
+
+    :param mode: Either :data:`STRICT` or :data:`WARN`.
+
+    :returns: a list of the :class:`GraphIssue` objects found.
+    :raises:  a :class:`.CompilationError` describing every issue, if any are
+              found in strict mode.
+    """
+    if mode not in (STRICT, WARN):
+        raise ValueError('Unknown validation mode "%s".' % mode)
+
+    issues = []
+    reachability = {}
+    for relation in program.relations:
+        issues.extend(validateRelation(relation, reachability))
+
+    if issues and mode == STRICT:
+        raise CompilationError('\n'.join([str(issue) for issue in issues]))
+    for issue in issues:
+        warnings.warn(str(issue), ValidationWarning)
+    return issues
+
+def validateRelation(relation, reachability=None):
+    """
+    Checks the given relation for cycles and fan-in conflicts.
+
+    :param reachability: Optionally, a dictionary in which to cache the
+                         input-to-output reachability of macro relations,
+                         shared between calls.
+
+    :returns: a list of the :class:`GraphIssue` objects found.
+    """
+    reachability = {} if reachability is None else reachability
+    issues = []
+
+    # Index the connections by destination node to find those that share one
+    connectionsByDestination = {}
+    for connection in relation.connections:
+        connectionsByDestination.setdefault(
+            (connection.dst.box.name, connection.dst.key), []).append(
+            connection)
+    for connection in relation.connections:
+        connections = connectionsByDestination.get(
+            (connection.dst.box.name, connection.dst.key))
+        if connections and len(connections) > 1:
+            issues.append(GraphIssue(relation.name, 'fan-in',
+                'the node "%s" is driven by %d connections' %
+                (connection.dst, len(connections)), connections))
+            connectionsByDestination[
+                (connection.dst.box.name, connection.dst.key)] = None
+
+    # Each connection whose endpoints fall in the same strongly connected
+    # component lies on a cycle
+    adjacency, edges = _buildGraph(relation, reachability)
+    componentOf = {}
+    for i, component in enumerate(
+            findStronglyConnectedComponents(adjacency)):
+        for vertex in component:
+            componentOf[vertex] = i
+    cycles = {}
+    order = []
+    for src, dst, connection in edges:
+        if componentOf[src] == componentOf[dst]:
+            if componentOf[src] not in cycles:
+                order.append(componentOf[src])
+            cycles.setdefault(componentOf[src], []).append(connection)
+    for connections in [cycles[i] for i in order]:
+        boxNames = []
+        for connection in connections:
+            if connection.src.box.name not in boxNames:
+                boxNames.append(connection.src.box.name)
+        issues.append(GraphIssue(relation.name, 'cycle',
+            'the boxes %s form a cycle' %
+            ', '.join(['"%s"' % name for name in boxNames]), connections))
+
+    return issues
+
+def findStronglyConnectedComponents(adjacency):
+    """
+    Finds the strongly connected components of a directed graph, using an
+    iterative form of Tarjan's algorithm.
+
+    :param adjacency: Maps each vertex to a list of the vertices it has edges
+                      to. Every vertex must appear as a key.
+
+    :returns: a list of components, each a list of vertices, in reverse
+              topological order.
+    """
+    index = {}
+    lowLink = {}
+    stack = []
+    onStack = set()
+    components = []
+
+    for root in adjacency:
+        if root in index:
+            continue
+
+        # Visit vertices depth-first, keeping an iterator over the remaining
+        # edges of each vertex on the current path
+        index[root] = lowLink[root] = len(index)
+        stack.append(root)
+        onStack.add(root)
+        path = [(root, iter(adjacency[root]))]
+        while path:
+            vertex, edges = path[-1]
+            for successor in edges:
+                if successor not in index:
+                    index[successor] = lowLink[successor] = len(index)
+                    stack.append(successor)
+                    onStack.add(successor)
+                    path.append((successor, iter(adjacency[successor])))
+                    break
+                if successor in onStack:
+                    lowLink[vertex] = min(lowLink[vertex], index[successor])
+            else:
+                # With every edge visited, pop the vertex from the path, and
+                # if it's the root of a component, pop the whole component
+                path.pop()
+                if path:
+                    parent = path[-1][0]
+                    lowLink[parent] = min(lowLink[parent], lowLink[vertex])
+                if lowLink[vertex] == index[vertex]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        onStack.discard(member)
+                        component.append(member)
+                        if member == vertex:
+                            break
+                    components.append(component)
+
+    return components
+
+def getMacroReachability(relation, reachability=None):
+    """
+    Returns which outputs of the given macro relation each of its inputs
+    affects, through any path of connections.
+
+    :param reachability: Optionally, a dictionary in which to cache the
+                         results for each relation.
+
+    :returns: a list with an entry for each macro input (in node order),
+              each a set of the indices of the macro outputs it reaches.
+    """
+    reachability = {} if reachability is None else reachability
+    if id(relation) in reachability:
+        return reachability[id(relation)]
+
+    adjacency = _buildGraph(relation, reachability)[0]
+    outputIndices = dict((name, i) for i, name in
+        enumerate(relation.getMacroToolNames(False)))
+
+    result = []
+    for name in relation.getMacroToolNames(True):
+        reached = set()
+        visited = set([name])
+        pending = [name]
+        while pending:
+            vertex = pending.pop()
+            if vertex in outputIndices:
+                reached.add(outputIndices[vertex])
+            for successor in adjacency[vertex]:
+                if successor not in visited:
+                    visited.add(successor)
+                    pending.append(successor)
+        result.append(reached)
+
+    reachability[id(relation)] = result
+    return result
+
+def _buildGraph(relation, reachability):
+    """
+    Returns the adjacency of the given relation's connection graph. Each box
+    is a vertex (identified by name), except for macro boxes, which have a
+    vertex for each of their input and output nodes, with edges from each
+    input to the outputs it reaches within the macro.
+
+    :returns: a tuple containing the adjacency, and a list of
+              (src, dst, connection) tuples for the edge of each connection.
+    """
+    adjacency = {}
+    for box in relation.boxes:
+        if isinstance(box, MacroBoxDeclaration):
+            reachable = getMacroReachability(box.relation, reachability)
+            for i, outputs in enumerate(reachable):
+                adjacency[('in', box.name, i)] = [
+                    ('out', box.name, j) for j in sorted(outputs)]
+            for j in range(len(box.relation.getMacroToolNames(False))):
+                adjacency[('out', box.name, j)] = []
+        else:
+            adjacency[box.name] = []
+
+    edges = []
+    for connection in relation.connections:
+        src, dst = connection.src, connection.dst
+        src = (('out', src.box.name, src.nodeIndex)
+            if isinstance(src, MacroNodeDeclaration) else src.box.name)
+        dst = (('in', dst.box.name, dst.nodeIndex)
+            if isinstance(dst, MacroNodeDeclaration) else dst.box.name)
+        adjacency[src].append(dst)
+        edges.append((src, dst, connection))
+    return adjacency, edges